@@ -0,0 +1,237 @@
+"""Benchmark kep_h on generated pools of several sizes.
+
+Each case generates a pool with pool_generator, writes it to a temporary
+file, and times reading it, enumerating and scoring the cycles and chains,
+building the conflict graph, reducing the instance and writing it in DIMACS
+format to /dev/null, using the stages recorded by instrumentation.Stats.
+Each case runs in a fresh process, so that its peak RSS is its own.
+
+The results are written as JSON: a list of cases, each with its parameters,
+the seconds taken by each stage, the counters of the run, throughputs and
+the peak RSS. Given a baseline written by an earlier run, the benchmark
+exits with status 1 if a case's total time, any stage's time, or its peak
+RSS has grown past the tolerance, or if its node or edge counts differ.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from optimality_criteria import get_criteria
+from kep_h_pool_optimiser import PoolOptimiser
+from reductions import get_reductions
+from sweep import parse_shifts
+from instrumentation import Stats, peak_rss_kb
+import pool_generator
+import pool_reader
+
+# name: (number of patients, number of NDDs). The number of chains grows
+# steeply with the chain length limit, and the number of conflict edges with
+# the square of the number of nodes, so the large tier, which takes minutes
+# with a chain limit of 3, is not run by default.
+TIERS = {"small": (50, 3), "medium": (100, 5), "large": (200, 10)}
+
+DEFAULT_TIERS = "small:medium"
+DEFAULT_LIMITS = "3:2,3:3"
+
+# Counters that must match the baseline for the times to be comparable
+CHECKED_COUNTERS = ["chains", "cycles", "nodes", "edges"]
+
+class BenchmarkCase(object):
+    def __init__(self, tier, num_patients, num_ndds, max_cycle, max_chain, seed=0,
+                 criteria="effective:size:backarc:weight", shifts="7:6:36",
+                 reduce_nodes=True, reductions=None):
+        # Criteria, shifts and reductions are strings, since cases are sent
+        # to worker processes
+        self.tier = tier
+        self.num_patients = num_patients
+        self.num_ndds = num_ndds
+        self.max_cycle = max_cycle
+        self.max_chain = max_chain
+        self.seed = seed
+        self.criteria = criteria
+        self.shifts = shifts
+        self.reduce_nodes = reduce_nodes
+        self.reductions = reductions
+
+    def name(self):
+        return "{}-c{}-n{}".format(self.tier, self.max_cycle, self.max_chain)
+
+def parse_limits(s):
+    "Parse a comma-separated list of MAX_CYCLE:MAX_CHAIN pairs"
+    limits = []
+    for item in s.split(","):
+        max_cycle, max_chain = item.split(":")
+        limits.append((int(max_cycle), int(max_chain)))
+    return limits
+
+def make_cases(tier_names, limits, **kwargs):
+    cases = []
+    for tier in tier_names:
+        num_patients, num_ndds = TIERS[tier]
+        for max_cycle, max_chain in limits:
+            cases.append(BenchmarkCase(tier, num_patients, num_ndds, max_cycle, max_chain,
+                                       **kwargs))
+    return cases
+
+def run_case(case):
+    "Run one BenchmarkCase, and return its result as a JSON object"
+    stats = Stats()
+    start_time = time.time()
+    fd, pool_file = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as out:
+            with stats.stage("generate pool"):
+                pool_generator.write_pool(out, pool_generator.generate_pool(
+                        case.num_patients, case.num_ndds, case.seed))
+        with open(pool_file) as json_file:
+            with stats.stage("read pool"):
+                pool = pool_reader.read_file(json_file)
+    finally:
+        os.remove(pool_file)
+
+    opt_criteria = get_criteria(case.criteria)
+    reduction_list = None if case.reductions is None else get_reductions(case.reductions)
+    optimiser = PoolOptimiser(pool, opt_criteria, case.max_cycle, case.max_chain,
+                              stats=stats)
+    with open(os.devnull, "w") as out:
+        optimiser.solve(False, case.reduce_nodes, 0, parse_shifts(case.shifts), out,
+                        reduction_list=reduction_list)
+    seconds = time.time() - start_time
+
+    # A stage such as "write instance" may be recorded more than once
+    stages = {}
+    for stage in stats.stages:
+        stages[stage.name] = stages.get(stage.name, 0.0) + stage.seconds
+    counters = {name: value for name, value in stats.counters}
+
+    throughput = {}
+    num_structures = counters.get("chains", 0) + counters.get("cycles", 0)
+    enumerate_seconds = stages.get("find chains", 0.0) + stages.get("find cycles", 0.0)
+    if enumerate_seconds > 0:
+        throughput["structures_per_second"] = num_structures / enumerate_seconds
+    if stages.get("conflict graph", 0.0) > 0:
+        throughput["edges_per_second"] = counters.get("edges", 0) / stages["conflict graph"]
+    if seconds > 0:
+        throughput["nodes_per_second"] = counters.get("nodes", 0) / seconds
+
+    return {"name": case.name(), "tier": case.tier, "patients": case.num_patients,
+            "ndds": case.num_ndds, "max_cycle": case.max_cycle, "max_chain": case.max_chain,
+            "seed": case.seed, "seconds": seconds, "stages": stages, "counters": counters,
+            "throughput": throughput, "peak_rss_kb": peak_rss_kb()}
+
+def run_cases(cases):
+    # Each case runs in a new process, since peak RSS never decreases
+    workers = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        return workers.map(run_case, cases, 1)
+    finally:
+        workers.close()
+        workers.join()
+
+def compare_results(results, baseline, tolerance=0.25, min_seconds=0.05,
+                    memory_tolerance=0.25, min_rss_kb=10240):
+    """Returns a list of descriptions of the regressions of results from
+    baseline. A time is a regression if it exceeds the baseline's by more
+    than the fraction tolerance and by more than min_seconds, and similarly
+    for the peak RSS. Cases that are not in the baseline are ignored."""
+    baseline_cases = {case["name"]: case for case in baseline}
+    regressions = []
+
+    def check(name, what, value, base, tol, min_diff, unit):
+        if base is not None and value is not None and \
+                value > base * (1 + tol) and value - base > min_diff:
+            regressions.append("{}: {} {:.3f} {} against {:.3f} {} in baseline".format(
+                    name, what, value, unit, base, unit))
+
+    for result in results:
+        base = baseline_cases.get(result["name"])
+        if base is None:
+            continue
+        name = result["name"]
+        for counter in CHECKED_COUNTERS:
+            if result["counters"].get(counter) != base["counters"].get(counter):
+                regressions.append("{}: {} is {} against {} in baseline".format(
+                        name, counter, result["counters"].get(counter),
+                        base["counters"].get(counter)))
+        check(name, "total time", result["seconds"], base["seconds"], tolerance,
+              min_seconds, "s")
+        for stage, seconds in sorted(result["stages"].items()):
+            check(name, "stage " + stage, seconds, base["stages"].get(stage), tolerance,
+                  min_seconds, "s")
+        check(name, "peak RSS", result["peak_rss_kb"], base["peak_rss_kb"],
+              memory_tolerance, min_rss_kb, "kB")
+    return regressions
+
+def report(results, out):
+    out.write("{:<16} {:>8} {:>8} {:>10} {:>10} {:>10}\n".format(
+            "case", "nodes", "edges", "seconds", "nodes/s", "peak kB"))
+    for result in results:
+        out.write("{:<16} {:>8} {:>8} {:>10.3f} {:>10.0f} {:>10}\n".format(
+                result["name"], result["counters"].get("nodes"),
+                result["counters"].get("edges"), result["seconds"],
+                result["throughput"].get("nodes_per_second", 0),
+                result["peak_rss_kb"]))
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Benchmark kep_h on generated pools")
+    parser.add_argument("-t", "--tiers",
+                        help="A colon-separated list of pool sizes, from " +
+                             ", ".join(sorted(TIERS)),
+                        type=str, default=DEFAULT_TIERS)
+    parser.add_argument("-l", "--limits",
+                        help="A comma-separated list of MAX_CYCLE:MAX_CHAIN length limits",
+                        type=str, default=DEFAULT_LIMITS)
+    parser.add_argument("--seed", help="Random seed of the generated pools", type=int,
+                        default=0)
+    parser.add_argument("-c", "--criteria",
+                        help="A colon-separated list of optimality criteria",
+                        type=str, default="effective:size:backarc:weight")
+    parser.add_argument("-s", "--shifts", help="A colon-separated list of bit-shifts",
+                        type=str, default="7:6:36")
+    parser.add_argument("-R", "--reductions",
+                        help="A colon-separated list of MWIS reductions to apply",
+                        type=str)
+    parser.add_argument("-w", "--output-file",
+                        help="Write the results to this file as JSON",
+                        type=str)
+    parser.add_argument("-b", "--baseline",
+                        help="Compare the results with this file, written by an earlier " +
+                             "run, and exit with status 1 if they have regressed",
+                        type=str)
+    parser.add_argument("--tolerance",
+                        help="The fraction by which a time may exceed the baseline's",
+                        type=float, default=0.25)
+    parser.add_argument("--memory-tolerance",
+                        help="The fraction by which the peak RSS may exceed the baseline's",
+                        type=float, default=0.25)
+    args = parser.parse_args()
+
+    tier_names = args.tiers.split(":")
+    unknown = [tier for tier in tier_names if tier not in TIERS]
+    if unknown:
+        print "Unknown tiers: {}".format(", ".join(unknown))
+        sys.exit(1)
+    cases = make_cases(tier_names, parse_limits(args.limits), seed=args.seed,
+                       criteria=args.criteria, shifts=args.shifts,
+                       reductions=args.reductions)
+    results = run_cases(cases)
+    report(results, sys.stdout)
+
+    if args.output_file is not None:
+        with open(args.output_file, "w") as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+            out.write("\n")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance,
+                                      memory_tolerance=args.memory_tolerance)
+        for regression in regressions:
+            print "Regression:", regression
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,205 @@
+"""A binary file format for MWIS instances.
+
+All values are little-endian. The file consists of:
+
+  - a header: the 8-byte magic string MAGIC, then uint32 fields for the format
+    version, the number of nodes n and a set of flags;
+  - the CSR adjacency structure: n+1 uint32 offsets, followed by the uint32
+    neighbour array, in which the neighbours of node i are the entries from
+    offsets[i] up to but not including offsets[i+1];
+  - the n hierarchical scores, each as an int32 byte count followed by that
+    many bytes of magnitude (a negative byte count denotes a negative score);
+  - if FLAG_DESCRIPTIONS is set, the n node descriptions, each as a uint32
+    byte count followed by that many bytes of UTF-8 text.
+
+Node indices are zero-based, and each edge appears in the neighbour lists of
+both of its endpoints.
+"""
+
+import binascii
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = "KEPMWIS\0"
+VERSION = 1
+
+FLAG_INVERTED = 1
+FLAG_DESCRIPTIONS = 2
+
+HEADER = struct.Struct("<8sIII")
+UINT32 = struct.Struct("<I")
+INT32 = struct.Struct("<i")
+
+UINT32_MAX = (1 << 32) - 1
+
+# The array typecode for a four-byte unsigned int
+UINT32_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+
+class BinaryInstanceException(ValueError):
+    pass
+
+def _uint32_array(values):
+    arr = array(UINT32_TYPECODE, values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+def _int_to_bytes(x):
+    "The little-endian bytes of the magnitude of x"
+    hex_digits = "%x" % abs(x)
+    if len(hex_digits) % 2:
+        hex_digits = "0" + hex_digits
+    return binascii.unhexlify(hex_digits)[::-1]
+
+def _int_from_bytes(s):
+    return int(binascii.hexlify(s[::-1]), 16) if s else 0
+
+def _adjacency_row(graph, i, invert_edges):
+    if invert_edges:
+        return graph.non_neighbours(i)
+    return graph.neighbours(i)
+
+def write_binary(out, graph, hier_scores, descriptions=None, invert_edges=False):
+    # param out: a file opened in binary mode
+    num_nodes = len(graph)
+    flags = ((FLAG_INVERTED if invert_edges else 0) |
+             (FLAG_DESCRIPTIONS if descriptions is not None else 0))
+    out.write(HEADER.pack(MAGIC, VERSION, num_nodes, flags))
+
+    offsets = [0]
+    for i in xrange(num_nodes):
+        degree = graph.degree(i)
+        if invert_edges:
+            degree = num_nodes - 1 - degree
+        offsets.append(offsets[-1] + degree)
+    if offsets[-1] > UINT32_MAX:
+        raise BinaryInstanceException(
+                "Too many edges for the binary format: {}".format(offsets[-1] / 2))
+    out.write(_uint32_array(offsets))
+    del offsets
+
+    # The arrays are passed to write() directly, which uses their buffers without copying
+    for i in xrange(num_nodes):
+        out.write(_uint32_array(_adjacency_row(graph, i, invert_edges)))
+
+    for score in hier_scores:
+        magnitude = _int_to_bytes(score)
+        out.write(INT32.pack(-len(magnitude) if score < 0 else len(magnitude)))
+        out.write(magnitude)
+
+    if descriptions is not None:
+        for desc in descriptions:
+            s = desc.encode("utf-8")
+            out.write(UINT32.pack(len(s)))
+            out.write(s)
+
+class BinaryInstance(object):
+    """An MWIS instance read from a file in the binary format.
+
+    The file is memory-mapped, and the adjacency structure is read from the
+    map on demand rather than being loaded into memory.
+    """
+
+    def __init__(self, filename):
+        self._file = open(filename, "rb")
+        self._mmap = None
+        complete = False
+        try:
+            # An empty file cannot be mapped
+            if os.fstat(self._file.fileno()).st_size < HEADER.size:
+                raise BinaryInstanceException("File is too short: {}".format(filename))
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_contents(filename)
+            complete = True
+        finally:
+            if not complete:
+                self.close()
+
+    def _read_contents(self, filename):
+        flags = self._read_header(filename)
+        self.inverted = bool(flags & FLAG_INVERTED)
+
+        self._offsets_pos = HEADER.size
+        self._nbrs_pos = self._offsets_pos + 4 * (self.num_nodes + 1)
+        self._check_length(self._nbrs_pos, filename)
+        self.num_edges = self._offset(self.num_nodes) / 2
+
+        pos = self._nbrs_pos + 4 * self._offset(self.num_nodes)
+        self._check_length(pos, filename)
+        self.hier_scores = []
+        for i in xrange(self.num_nodes):
+            self._check_length(pos + 4, filename)
+            length, = INT32.unpack_from(self._mmap, pos)
+            pos += 4
+            self._check_length(pos + abs(length), filename)
+            score = _int_from_bytes(self._mmap[pos:pos+abs(length)])
+            pos += abs(length)
+            self.hier_scores.append(-score if length < 0 else score)
+
+        self.descriptions = None
+        if flags & FLAG_DESCRIPTIONS:
+            self.descriptions = []
+            for i in xrange(self.num_nodes):
+                self._check_length(pos + 4, filename)
+                length, = UINT32.unpack_from(self._mmap, pos)
+                pos += 4
+                self._check_length(pos + length, filename)
+                self.descriptions.append(self._mmap[pos:pos+length].decode("utf-8"))
+                pos += length
+
+    def _check_length(self, end, filename):
+        # Raise an exception if the file ends before byte offset end
+        if len(self._mmap) < end:
+            raise BinaryInstanceException(
+                    "File is truncated: {} has {} bytes but the header and offsets "
+                    "call for at least {}".format(filename, len(self._mmap), end))
+
+    def _read_header(self, filename):
+        # Returns the flags field of the header
+        if len(self._mmap) < HEADER.size:
+            raise BinaryInstanceException("File is too short: {}".format(filename))
+        magic, version, self.num_nodes, flags = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise BinaryInstanceException("Not a binary MWIS instance: {}".format(filename))
+        if version != VERSION:
+            raise BinaryInstanceException(
+                    "Unsupported binary instance version: {}".format(version))
+        return flags
+
+    def __len__(self):
+        return self.num_nodes
+
+    def _offset(self, i):
+        return UINT32.unpack_from(self._mmap, self._offsets_pos + 4 * i)[0]
+
+    def degree(self, v):
+        return self._offset(v+1) - self._offset(v)
+
+    def neighbours(self, v):
+        start = self._offset(v)
+        degree = self._offset(v+1) - start
+        return struct.unpack_from("<{}I".format(degree), self._mmap, self._nbrs_pos + 4 * start)
+
+    def edges(self):
+        "Generate each edge (i, j) with i < j once, in lexicographic order"
+        for i in xrange(self.num_nodes):
+            for j in self.neighbours(i):
+                if j > i:
+                    yield i, j
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def read_binary(filename):
+    return BinaryInstance(filename)
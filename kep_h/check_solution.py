@@ -1,94 +1,196 @@
-# FIXME: add more checks and make this less hacky
+"""Check a solution written by kep_h.py --solve against its pool.
+
+Each line of the solution is "c INDEX NDD (PATIENT,DONOR) ..." for a chain, or
+"c INDEX (PATIENT,DONOR) ..." for a cycle, using the IDs of the pool file.
+Every patient, donor and NDD must exist and be used at most once, each donor
+must be paired with its patient, every arc must exist, and cycles and chains
+must be within the length limits if these are given. If criteria are given,
+the total under each criterion is reported, and with shifts, the
+hierarchical score, which counts each unused NDD as kep_h.py does.
+"""
 
 import argparse
 import sys
-import json
 from kep_h_pool import *
 from optimality_criteria import *
+from sweep import parse_shifts
 import pool_reader
+import scoring
+
+class SolutionException(Exception):
+    pass
+
+class SolutionChecker(object):
+    def __init__(self, pool, max_cycle=None, max_chain=None):
+        # param max_cycle, max_chain: the length limits in pairs, or None for no limit
+        self.pool = pool
+        self.max_cycle = max_cycle
+        self.max_chain = max_chain
+        self.patients = {patient.nhs_id: patient for patient in pool.patients}
+        self.paired_donors = {donor.nhs_id: donor for donor in pool.paired_donors}
+        self.ndds = {ndd.nhs_id: ndd for ndd in pool.altruists}
+
+        self.used_patients = set()
+        self.used_donors = set()
+        self.used_ndds = set()
+        self.cycles = []
+        self.chains = []
+
+    def find(self, table, nhs_id, kind):
+        try:
+            return table[nhs_id]
+        except KeyError:
+            raise SolutionException("No {} with ID {}".format(kind, nhs_id))
+
+    def find_pair(self, token):
+        if not (token.startswith("(") and token.endswith(")")) or token.count(",") != 1:
+            raise SolutionException("Not a patient-donor pair: {}".format(token))
+        patient_id, donor_id = token[1:-1].split(",")
+        patient = self.find(self.patients, int(patient_id), "patient")
+        donor = self.find(self.paired_donors, int(donor_id), "paired donor")
+        if donor not in patient.paired_donors:
+            raise SolutionException("Donor {} is not paired with patient {}".format(
+                    donor_id, patient_id))
+        return PatientDonorPair(patient, donor)
+
+    def use(self, pairs):
+        # Record that the patients and donors of pairs are used, checking that
+        # none of them is already used
+        for pair in pairs:
+            if pair.patient in self.used_patients:
+                raise SolutionException("Patient {} is used twice".format(pair.patient.nhs_id))
+            if pair.donor in self.used_donors:
+                raise SolutionException("Donor {} is used twice".format(pair.donor.nhs_id))
+            self.used_patients.add(pair.patient)
+            self.used_donors.add(pair.donor)
+
+    def check_arcs(self, pairs):
+        # Check the arc from each pair's donor to the next pair's patient
+        for pair1, pair2 in zip(pairs, pairs[1:]):
+            if not pair1.donor.has_edge_to(pair2.patient):
+                raise SolutionException("Donor {} has no arc to patient {}".format(
+                        pair1.donor.nhs_id, pair2.patient.nhs_id))
+
+    def check_chain(self, tokens):
+        ndd = self.find(self.ndds, int(tokens[0]), "NDD")
+        pairs = [self.find_pair(token) for token in tokens[1:]]
+        if not pairs:
+            raise SolutionException("Chain from NDD {} has no pairs".format(ndd.nhs_id))
+        if self.max_chain is not None and len(pairs) > self.max_chain:
+            raise SolutionException("Chain of {} pairs is longer than {}".format(
+                    len(pairs), self.max_chain))
+        if ndd in self.used_ndds:
+            raise SolutionException("NDD {} is used twice".format(ndd.nhs_id))
+        edge = ndd.edges_by_target.get(pairs[0].patient)
+        if edge is None:
+            raise SolutionException("NDD {} has no arc to patient {}".format(
+                    ndd.nhs_id, pairs[0].patient.nhs_id))
+        self.check_arcs(pairs)
+        self.use(pairs)
+        self.used_ndds.add(ndd)
+        self.chains.append(Chain(edge, pairs, len(self.chains) + 1))
+
+    def check_cycle(self, tokens):
+        pairs = [self.find_pair(token) for token in tokens]
+        # A cycle of one pair is a donor who matches their own paired patient
+        if not pairs:
+            raise SolutionException("Cycle has no pairs")
+        if self.max_cycle is not None and len(pairs) > self.max_cycle:
+            raise SolutionException("Cycle of {} pairs is longer than {}".format(
+                    len(pairs), self.max_cycle))
+        self.check_arcs(pairs + pairs[:1])
+        self.use(pairs)
+        self.cycles.append(Cycle(pairs, len(self.cycles) + 1))
 
-def find_ndd(pool, nhs_id):
-    for ndd in pool.altruists:
-        if ndd.nhs_id == nhs_id:
-            return ndd
-
-def find_patient(pool, nhs_id):
-    for patient in pool.patients:
-        if patient.nhs_id == nhs_id:
-            return patient
-
-def find_paired_donor(pool, nhs_id):
-    for donor in pool.paired_donors:
-        if donor.nhs_id == nhs_id:
-            return donor
-
-def find_pair(pool, token):
-    comma_pos = token.find(",")
-    patient_id = int(token[1:comma_pos])
-    donor_id = int(token[comma_pos+1:-1])
-    patient = find_patient(pool, patient_id)
-    donor = find_paired_donor(pool, donor_id)
-    return PatientDonorPair(patient, donor)
-
-def ndd_has_edge_to_patient(ndd, patient):
-    for edge in ndd.edges:
-        if edge.target_patient == patient:
-            return True
-    return False
-
-def check_chain(pool, tokens):
-    ndd = find_ndd(pool, int(tokens[2]))
-    pairs = [find_pair(pool, token) for token in tokens[3:]]
-    n_backarcs = 1 if len(pairs)==2 else 0
-    if ndd_has_edge_to_patient(ndd, pairs[-1].patient) and len(pairs)==2:
-        n_backarcs += 1
-    assert ndd_has_edge_to_patient(ndd, pairs[0].patient)
-    for i in range(1,len(pairs)):
-        pair1 = pairs[i-1]
-        pair2 = pairs[i]
-        assert pair1.donor.has_edge_to(pair2.patient)
-        if pair2.donor.has_edge_to(pair1.patient) and len(pairs)==2:
-            n_backarcs += 1
-    print tokens[1], n_backarcs
-    c = Chain(AltruistEdge(ndd, pairs[0].patient, 0), pairs, -1)
-    print len(pairs), c.n_backarcs(), n_backarcs
-    assert c.n_backarcs() == n_backarcs
-    return n_backarcs
-
-def check_cycle(pool, tokens):
-    n_backarcs = 0
-    pairs = [find_pair(pool, token) for token in tokens[2:]]
-    for i in range(len(pairs)):
-        pair1 = pairs[i-1]
-        pair2 = pairs[i]
-        assert pair1.donor.has_edge_to(pair2.patient)
-        if pair2.donor.has_edge_to(pair1.patient) and len(pairs)==3:
-            n_backarcs += 1
-    print tokens[1], n_backarcs
-    c = Cycle(pairs, -1)
-    print len(pairs), c.n_backarcs(), n_backarcs
-    assert c.n_backarcs() == n_backarcs
-    return n_backarcs
+    def check_line(self, line):
+        tokens = line.split()
+        if not tokens:
+            return
+        if tokens[0] != "c" or len(tokens) < 3:
+            raise SolutionException("Not a cycle or chain: {}".format(line.strip()))
+        if tokens[2].isdigit():
+            self.check_chain(tokens[2:])
+        else:
+            self.check_cycle(tokens[2:])
+
+    def check_lines(self, lines):
+        for line_number, line in enumerate(lines):
+            try:
+                self.check_line(line)
+            except (SolutionException, ValueError) as e:
+                raise SolutionException("Line {}: {}".format(line_number + 1, e))
+
+    def unused_ndds(self):
+        return [ndd for ndd in self.pool.altruists if ndd not in self.used_ndds]
+
+    def n_transplants(self):
+        return sum(s.n_transplants() for s in self.chains + self.cycles)
+
+    def n_backarcs(self):
+        return sum(s.n_backarcs() for s in self.chains + self.cycles)
+
+    def criterion_columns(self, opt_criteria):
+        """The score of each chain, cycle and unused NDD under each criterion, as
+        integers in the form used by kep_h.py"""
+        rows = ([scoring.criterion_scores(opt_criteria, chain, scoring.chain_val)
+                 for chain in self.chains] +
+                [scoring.criterion_scores(opt_criteria, cycle, scoring.cycle_val)
+                 for cycle in self.cycles] +
+                [scoring.criterion_scores(opt_criteria, ndd, scoring.altruist_val)
+                 for ndd in self.unused_ndds()])
+        return [list(column) for column in zip(*rows)] if rows else \
+               [[] for oc in opt_criteria]
+
+    def hier_score(self, opt_criteria, bit_shifts):
+        "The total hierarchical score, which kep_h.py --solve reports"
+        return sum(scoring.pack_hier_scores(self.criterion_columns(opt_criteria), bit_shifts))
 
 if __name__=="__main__":
-    parser = argparse.ArgumentParser(description="Hierarchical kidney-exchange optimisation")
+    parser = argparse.ArgumentParser(description="Check a kidney-exchange solution")
     parser.add_argument("-f", "--file", help="Input file name", type=str,
                         required=True)
+    parser.add_argument("-c", "--criteria",
+                        help="A colon-separated list of optimality criteria whose totals " +
+                             "are reported",
+                        type=str)
+    parser.add_argument("-s", "--shifts",
+                        help="A colon-separated list of bit-shifts, as for kep_h.py, with " +
+                             "which the hierarchical score is reported",
+                        type=str)
+    parser.add_argument("-e", "--cycle",
+                        help="Maximum cycle length",
+                        type=int)
+    parser.add_argument("-n", "--chain",
+                        help="Maximum chain length",
+                        type=int)
     args = parser.parse_args()
 
-    if args.file.endswith(".json"):
-        with open(args.file) as json_file:
-            pool = pool_reader.read(json.load(json_file)["data"])
-    else:
+    if not args.file.endswith(".json"):
         print "Input file must be in JSON format"
+        sys.exit(1)
 
-    n_backarcs = 0
+    with open(args.file) as json_file:
+        pool = pool_reader.read_file(json_file)
 
-    for line in sys.stdin.readlines():
-        tokens = line.strip().split()
-        if tokens[2].isdigit():
-            n_backarcs += check_chain(pool, tokens)
-        else:
-            n_backarcs += check_cycle(pool, tokens)
+    checker = SolutionChecker(pool, args.cycle, args.chain)
+    try:
+        checker.check_lines(sys.stdin)
+    except SolutionException as e:
+        sys.stderr.write("Infeasible solution: {}\n".format(e))
+        sys.exit(1)
 
-    print n_backarcs
+    print "Cycles", len(checker.cycles)
+    print "Chains", len(checker.chains)
+    print "Transplants", checker.n_transplants()
+    print "Backarcs", checker.n_backarcs()
+    if args.criteria is not None:
+        opt_criteria = get_criteria(args.criteria)
+        for name, column in zip(args.criteria.split(":"),
+                                checker.criterion_columns(opt_criteria)):
+            print "Criterion", name, sum(column)
+        if args.shifts is not None:
+            shifts = parse_shifts(args.shifts)
+            if len(shifts) != len(opt_criteria):
+                print "Length of shifts must be one less than length of optimality criteria."
+                sys.exit(1)
+            print "Score", checker.hier_score(opt_criteria, shifts)
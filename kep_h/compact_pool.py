@@ -0,0 +1,741 @@
+from array import array
+from itertools import izip
+
+class StructureStore(object):
+    """A sequence of tuples of ints, stored in two flat arrays.
+
+    Each stored tuple costs a few bytes per element, rather than a Python
+    object per element.
+    """
+
+    def __init__(self):
+        self.values = array('i')
+        self.offsets = array('l', [0])
+
+    def append(self, items):
+        self.values.extend(items)
+        self.offsets.append(len(self.values))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("StructureStore index out of range")
+        return tuple(self.values[self.offsets[i]:self.offsets[i+1]])
+
+    def __iter__(self):
+        values = self.values
+        offsets = self.offsets
+        for i in xrange(len(offsets) - 1):
+            yield tuple(values[offsets[i]:offsets[i+1]])
+
+    def lengths(self):
+        "An array of the length of each tuple"
+        offsets = self.offsets
+        return array('l', (offsets[i+1] - offsets[i] for i in xrange(len(offsets) - 1)))
+
+    def without(self, dropped):
+        """Return a new store holding the tuples whose indices are not in dropped,
+        which must be sorted. Runs of kept tuples are copied in bulk."""
+        store = StructureStore()
+        for start, end in kept_ranges(len(self), dropped):
+            store._extend_from(self, start, end)
+        return store
+
+    def inserted(self, positions, new_items):
+        """Return a new store in which each of new_items comes just before the
+        tuple of this store whose index is the corresponding one of positions,
+        which must be sorted, or at the end if that is len(self). Runs of old
+        tuples are copied in bulk."""
+        store = StructureStore()
+        start = 0
+        for position, items in izip(positions, new_items):
+            store._extend_from(self, start, position)
+            store.append(items)
+            start = position
+        store._extend_from(self, start, len(self))
+        return store
+
+    def _extend_from(self, other, start, end):
+        # Append tuples start..end-1 of the store other
+        base = len(self.values) - other.offsets[start]
+        self.values.extend(other.values[other.offsets[start]:other.offsets[end]])
+        self.offsets.extend(offset + base for offset in other.offsets[start+1:end+1])
+
+def kept_ranges(n, dropped):
+    "Generate the (start, end) ranges of 0..n-1 that avoid the sorted list dropped"
+    start = 0
+    for i in dropped:
+        if i > start:
+            yield start, i
+        start = i + 1
+    if start < n:
+        yield start, n
+
+def insertion_positions(store, new_items, key):
+    """For each of new_items, which are sorted by key, the index of the first
+    tuple of store, which is also sorted by key, whose key is greater. These
+    are the positions for StructureStore.inserted or ChainStore.inserted that
+    keep the store sorted."""
+    positions = []
+    low = 0
+    for items in new_items:
+        item_key = key(items)
+        high = len(store)
+        while low < high:
+            mid = (low + high) / 2
+            if item_key < key(store[mid]):
+                high = mid
+            else:
+                low = mid + 1
+        positions.append(low)
+    return positions
+
+class ChainStore(object):
+    """A sequence of chain index tuples, stored as a prefix tree.
+
+    Every prefix of a chain is itself a chain, and the enumerators generate
+    each chain straight after its prefixes, so a chain can usually be stored
+    as the index of the chain one pair shorter (its parent) and its last
+    patient and donor: three ints, whatever its length. A chain whose parent
+    is not found this way, such as a chain of one pair, is stored as an
+    explicit tuple in roots. parents[i] is the parent of chain i, or -1 - r
+    if chain i is roots[r]. Parents always come before their children.
+    """
+
+    def __init__(self):
+        self.parents = array('i')
+        # The last patient and donor of each chain
+        self.patients = array('i')
+        self.donors = array('i')
+        self.roots = StructureStore()
+        # The tuple of the last chain appended, and the index of each of its
+        # prefixes, by number of pairs less one, or -1 if it is not known
+        self._last = ()
+        self._last_prefixes = []
+
+    def append(self, items):
+        items = tuple(items)
+        num_pairs = len(items) / 2
+        prefixes = self._last_prefixes
+        index = len(self.parents)
+        if (1 < num_pairs <= len(prefixes) + 1 and prefixes[num_pairs-2] != -1 and
+                self._last[:len(items)-2] == items[:-2]):
+            self.parents.append(prefixes[num_pairs-2])
+            self._last_prefixes = prefixes[:num_pairs-1] + [index]
+        else:
+            self.parents.append(-1 - len(self.roots))
+            self.roots.append(items)
+            self._last_prefixes = [-1] * (num_pairs - 1) + [index]
+        self.patients.append(items[-2])
+        self.donors.append(items[-1])
+        self._last = items
+
+    def _append_child(self, parent, patient, donor):
+        self.parents.append(parent)
+        self.patients.append(patient)
+        self.donors.append(donor)
+
+    def __len__(self):
+        return len(self.parents)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("ChainStore index out of range")
+        pairs = []
+        parent = self.parents[i]
+        while parent >= 0:
+            pairs.append(self.donors[i])
+            pairs.append(self.patients[i])
+            i = parent
+            parent = self.parents[i]
+        pairs.reverse()
+        return self.roots[-1 - parent] + tuple(pairs)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def lengths(self):
+        "An array of the length of each chain's index tuple"
+        lengths = array('l')
+        parents = self.parents
+        roots = self.roots
+        for i in xrange(len(parents)):
+            parent = parents[i]
+            if parent >= 0:
+                lengths.append(lengths[parent] + 2)
+            else:
+                r = -1 - parent
+                lengths.append(roots.offsets[r+1] - roots.offsets[r])
+        return lengths
+
+    def without(self, dropped):
+        """Return a new store holding the chains whose indices are not in dropped,
+        which must be sorted. A chain whose parent is dropped becomes a root."""
+        store = ChainStore()
+        new_index = array('l', [-1]) * len(self)
+        for start, end in kept_ranges(len(self), dropped):
+            for i in xrange(start, end):
+                store._append_from(self, i, new_index)
+        return store
+
+    def inserted(self, positions, new_items):
+        """As StructureStore.inserted. The new chains are added by append, so
+        some of them may be stored as roots although their parents are present."""
+        store = ChainStore()
+        new_index = array('l', [-1]) * len(self)
+        j = 0
+        for i in xrange(len(self)):
+            while j < len(positions) and positions[j] == i:
+                store.append(new_items[j])
+                j += 1
+            store._append_from(self, i, new_index)
+        for items in new_items[j:]:
+            store.append(items)
+        return store
+
+    def _append_from(self, other, i, new_index):
+        # Append chain i of the store other, by its parent if new_index gives
+        # the parent's index in this store, and record its own index there
+        parent = other.parents[i]
+        if parent >= 0 and new_index[parent] != -1:
+            self._append_child(new_index[parent], other.patients[i], other.donors[i])
+        else:
+            self.append(other[i])
+        new_index[i] = len(self) - 1
+
+class StructureList(object):
+    """A read-only sequence of cycles or chains, each of which is created from
+    its entry in a StructureStore only when it is accessed"""
+
+    def __init__(self, store, factory):
+        # param factory: a function taking a tuple from the store and a
+        #                one-based index, and returning a Cycle or Chain
+        self.store = store
+        self.factory = factory
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.store)
+        return self.factory(self.store[i], i+1)
+
+    def __iter__(self):
+        for i, members in enumerate(self.store):
+            yield self.factory(members, i+1)
+
+def _csr(rows):
+    # Returns offsets and values arrays for a list of lists of ints
+    offsets = array('l', [0])
+    values = array('i')
+    for row in rows:
+        values.extend(row)
+        offsets.append(len(values))
+    return offsets, values
+
+class CompactPool(object):
+    """Integer-indexed arrays describing the compatibility graph of a Pool.
+
+    Patients, paired donors and NDDs are numbered from zero in the order in
+    which they appear in the pool's lists. The donors paired with each patient
+    and the edges out of each donor and NDD are stored in CSR form, with edges
+    in the same order as in the pool.
+
+    A cycle found by find_cycles is stored as the tuple (p0, d0, p1, d1, ...)
+    of its patient and donor numbers, where donor d_i donates to patient
+    p_{i+1}. A chain found by find_chains is stored as (k, p0, d0, p1, d1, ...)
+    where k is the number of the NDD edge to p0 in ndd_edge_targets.
+    """
+
+    def __init__(self, pool):
+        patient_ids = {patient: i for i, patient in enumerate(pool.patients)}
+        donor_ids = {donor: i for i, donor in enumerate(pool.paired_donors)}
+
+        self.num_patients = len(pool.patients)
+        self.num_donors = len(pool.paired_donors)
+        self.num_ndds = len(pool.altruists)
+
+        # Cycles may only be extended by patients with higher index values
+        self.patient_index = array('l', (patient.index for patient in pool.patients))
+        self.patient_donor_offsets, self.patient_donors = _csr(
+                [donor_ids[donor] for donor in patient.paired_donors]
+                for patient in pool.patients)
+
+        self.donor_dage = array('d', (donor.dage for donor in pool.paired_donors))
+        self.donor_edge_offsets, self.donor_edge_targets = _csr(
+                [patient_ids[edge.target_patient] for edge in donor.edges_out]
+                for donor in pool.paired_donors)
+        self.donor_edge_scores = array('d', (edge.score for donor in pool.paired_donors
+                                                         for edge in donor.edges_out))
+
+        self.ndd_dage = array('d', (ndd.dage for ndd in pool.altruists))
+        self.ndd_edge_offsets, self.ndd_edge_targets = _csr(
+                [patient_ids[edge.target_patient] for edge in ndd.edges]
+                for ndd in pool.altruists)
+        self.ndd_edge_scores = array('d', (edge.score for ndd in pool.altruists
+                                                       for edge in ndd.edges))
+        self.ndd_edge_ndds = array('i')
+        for i in xrange(self.num_ndds):
+            self.ndd_edge_ndds.extend([i] * (self.ndd_edge_offsets[i+1] - self.ndd_edge_offsets[i]))
+
+        # For each patient v, the patients u such that a donor paired with u
+        # has an arc to v
+        donor_patients = [[] for i in xrange(self.num_donors)]
+        for patient in xrange(self.num_patients):
+            for donor in self.donors_of(patient):
+                donor_patients[donor].append(patient)
+        patient_preds = [set() for i in xrange(self.num_patients)]
+        for donor in xrange(self.num_donors):
+            for target in self.donor_targets(donor):
+                patient_preds[target].update(donor_patients[donor])
+        self.patient_pred_offsets, self.patient_preds = _csr(
+                sorted(preds) for preds in patient_preds)
+        # The patients paired with each donor, which is the inverse of
+        # patient_donors
+        self.donor_patient_offsets, self.donor_patients = _csr(donor_patients)
+
+        # The set of ndd * num_patients + patient such that the NDD has an arc to the patient
+        self.ndd_arcs = {ndd * self.num_patients + patient
+                         for ndd in xrange(self.num_ndds)
+                         for patient in self.ndd_edge_targets[self.ndd_edge_offsets[ndd]:
+                                                              self.ndd_edge_offsets[ndd+1]]}
+
+        # Maps donor * num_patients + patient to the position of the donor's
+        # first edge to the patient among the donor's edges
+        self.arc_positions = {}
+        for donor in xrange(self.num_donors):
+            self._index_arcs(donor)
+
+        # The scoring.ArcValues of the pool, which are built when first needed
+        self.arc_values = None
+
+    def _index_arcs(self, donor):
+        # Record the position of donor's first edge to each patient
+        base = donor * self.num_patients
+        start = self.donor_edge_offsets[donor]
+        for pos in xrange(self.donor_edge_offsets[donor+1] - 1, start - 1, -1):
+            self.arc_positions[base + self.donor_edge_targets[pos]] = pos - start
+
+    def donors_of(self, patient):
+        return self.patient_donors[self.patient_donor_offsets[patient]:
+                                   self.patient_donor_offsets[patient+1]]
+
+    def donor_targets(self, donor):
+        return self.donor_edge_targets[self.donor_edge_offsets[donor]:
+                                       self.donor_edge_offsets[donor+1]]
+
+    def has_patient_arc(self, patient, other_patient):
+        "Does a donor paired with patient have an arc to other_patient?"
+        for donor in self.donors_of(patient):
+            if self.has_arc(donor, other_patient):
+                return True
+        return False
+
+    def ndd_has_arc(self, ndd, patient):
+        return ndd * self.num_patients + patient in self.ndd_arcs
+
+    def preds_of(self, patient):
+        return self.patient_preds[self.patient_pred_offsets[patient]:
+                                  self.patient_pred_offsets[patient+1]]
+
+    def has_arc(self, donor, patient):
+        return donor * self.num_patients + patient in self.arc_positions
+
+    def arc_position(self, donor, patient):
+        "The position in donor_edge_targets of the donor's first edge to the patient"
+        pos = self.arc_positions.get(donor * self.num_patients + patient)
+        return None if pos is None else self.donor_edge_offsets[donor] + pos
+
+    def patients_of(self, donor):
+        "The patients with which donor is paired, in ascending order"
+        return self.donor_patients[self.donor_patient_offsets[donor]:
+                                   self.donor_patient_offsets[donor+1]]
+
+    def distances_to(self, first_patient, max_dist, higher_index_only=True):
+        """Returns a dict mapping patients to their distance to first_patient in the
+        patient graph, in which u has an arc to v iff a donor paired with u has an
+        arc to v. If higher_index_only is True, only paths through patients whose
+        index is higher than first_patient's are used. Only distances up to
+        max_dist are found."""
+        first_patient_index = self.patient_index[first_patient] if higher_index_only else -1
+        patient_index = self.patient_index
+        dist = {first_patient: 0}
+        frontier = [first_patient]
+        for d in xrange(1, max_dist + 1):
+            next_frontier = []
+            for v in frontier:
+                for u in self.preds_of(v):
+                    if u not in dist and (patient_index[u] > first_patient_index or
+                                          not higher_index_only):
+                        dist[u] = d
+                        next_frontier.append(u)
+            frontier = next_frontier
+        return dist
+
+    def _extensions(self, donor, patient_used, donor_used, dist, max_dist):
+        # Generate the (patient, donor) pairs that may be appended to a path ending
+        # in donor. If dist is not None, only patients whose distance in dist is
+        # at most max_dist are used.
+        for patient in self.donor_targets(donor):
+            if dist is not None and dist.get(patient, max_dist + 1) > max_dist:
+                continue
+            if not patient_used[patient]:
+                for next_donor in self.donors_of(patient):
+                    if not donor_used[next_donor]:
+                        yield patient, next_donor
+
+    def _iter_paths(self, path, max_pairs, patient_used, donor_used, dist=None):
+        """Generate path and its extensions by up to max_pairs - 1 patient-donor
+        pairs, in depth-first preorder, using an explicit stack.
+
+        path is modified in place and the same list is yielded each time, so
+        callers must copy anything they keep. The patients and donors in path
+        must be marked in patient_used and donor_used. If dist is not None, a
+        patient may only be added to a path if its distance in dist is small
+        enough that the path could still be closed into a cycle of at most
+        max_pairs pairs.
+        """
+        base_len = len(path)
+        max_len = base_len + 2 * (max_pairs - 1)
+        yield path
+        if base_len >= max_len:
+            return
+        # When stack has k iterators, path has k-1 pairs beyond its base length
+        stack = [self._extensions(path[-1], patient_used, donor_used, dist, max_pairs - 1)]
+        while stack:
+            extension = next(stack[-1], None)
+            if extension is None:
+                stack.pop()
+                if len(path) > base_len:
+                    patient_used[path[-2]] = 0
+                    donor_used[path[-1]] = 0
+                    del path[-2:]
+                continue
+            patient, donor = extension
+            patient_used[patient] = 1
+            donor_used[donor] = 1
+            path.append(patient)
+            path.append(donor)
+            yield path
+            if len(path) < max_len:
+                max_dist = (max_len - len(path)) / 2
+                stack.append(self._extensions(donor, patient_used, donor_used, dist, max_dist))
+            else:
+                patient_used[patient] = 0
+                donor_used[donor] = 0
+                del path[-2:]
+
+    def iter_cycles(self, max_length):
+        "Generate the index tuple of each cycle of up to max_length pairs"
+        for first_patient in xrange(self.num_patients):
+            for cycle in self.iter_cycles_from(first_patient, max_length):
+                yield cycle
+
+    def iter_cycles_from(self, first_patient, max_length):
+        """Generate the index tuple of each cycle of up to max_length pairs whose
+        patient with the lowest index is first_patient.
+
+        A branch of the search is cut as soon as its last patient is too far
+        from the first patient for the cycle to be closed in time.
+        """
+        for path in self._iter_cycle_paths(first_patient, max_length):
+            yield tuple(path)
+
+    def _iter_cycle_paths(self, first_patient, max_length):
+        # As iter_cycles_from, but each cycle is yielded as a list that is
+        # modified in place
+        patient_used = bytearray(self.num_patients)
+        donor_used = bytearray(self.num_donors)
+        dist = self.distances_to(first_patient, max_length - 1)
+        patient_used[first_patient] = 1
+        for first_donor in self.donors_of(first_patient):
+            donor_used[first_donor] = 1
+            for path in self._iter_paths([first_patient, first_donor], max_length,
+                                         patient_used, donor_used, dist):
+                if self.has_arc(path[-1], first_patient):
+                    yield path
+            donor_used[first_donor] = 0
+
+    def iter_chains(self, max_length):
+        "Generate the index tuple of each chain of up to max_length pairs"
+        for ndd_edge in xrange(len(self.ndd_edge_targets)):
+            for chain in self.iter_chains_from(ndd_edge, max_length):
+                yield chain
+
+    def iter_chains_from(self, ndd_edge, max_length):
+        """Generate the index tuple of each chain of up to max_length pairs that
+        starts with the NDD edge numbered ndd_edge"""
+        for path in self._iter_chain_paths(ndd_edge, max_length):
+            yield tuple(path)
+
+    def _iter_chain_paths(self, ndd_edge, max_length):
+        # As iter_chains_from, but each chain is yielded as a list that is
+        # modified in place
+        if max_length == 0:
+            return
+        patient_used = bytearray(self.num_patients)
+        donor_used = bytearray(self.num_donors)
+        first_patient = self.ndd_edge_targets[ndd_edge]
+        patient_used[first_patient] = 1
+        for first_donor in self.donors_of(first_patient):
+            donor_used[first_donor] = 1
+            for path in self._iter_paths([ndd_edge, first_patient, first_donor], max_length,
+                                         patient_used, donor_used):
+                yield path
+            donor_used[first_donor] = 0
+
+    def _path_key(self, members, start):
+        # The position of each choice made by _iter_paths along a path whose
+        # first pair is members[start], members[start+1]: each donor among its
+        # patient's donors, and each arc among its donor's edges
+        key = [self.donors_of(members[start]).index(members[start+1])]
+        for i in xrange(start + 2, len(members), 2):
+            key.append(self.arc_positions[members[i-1] * self.num_patients + members[i]])
+            key.append(self.donors_of(members[i]).index(members[i+1]))
+        return key
+
+    def cycle_key(self, members):
+        "A key by which cycles sort into the order in which iter_cycles generates them"
+        return tuple([members[0]] + self._path_key(members, 0))
+
+    def chain_key(self, members):
+        "A key by which chains sort into the order in which iter_chains generates them"
+        return tuple([members[0]] + self._path_key(members, 1))
+
+    def rotate_cycle(self, members):
+        "Rotate a cycle's index tuple so that its patient with the lowest index is first"
+        patient_index = self.patient_index
+        start = min(xrange(0, len(members), 2), key=lambda i: patient_index[members[i]])
+        return tuple(members[start:]) + tuple(members[:start])
+
+    def iter_cycles_through_pair(self, patient, donor, max_length):
+        """Generate the index tuple of each cycle of up to max_length pairs in which
+        donor donates on behalf of patient"""
+        patient_used = bytearray(self.num_patients)
+        donor_used = bytearray(self.num_donors)
+        dist = self.distances_to(patient, max_length - 1, False)
+        patient_used[patient] = 1
+        donor_used[donor] = 1
+        for path in self._iter_paths([patient, donor], max_length, patient_used, donor_used,
+                                     dist):
+            if self.has_arc(path[-1], patient):
+                yield self.rotate_cycle(path)
+
+    def iter_cycles_through_arc(self, patient, donor, target, max_length):
+        """Generate the index tuple of each cycle of up to max_length pairs in which
+        donor donates to target on behalf of patient"""
+        patient_used = bytearray(self.num_patients)
+        donor_used = bytearray(self.num_donors)
+        dist = self.distances_to(patient, max_length - 1, False)
+        patient_used[target] = 1
+        for first_donor in self.donors_of(target):
+            if target == patient and first_donor != donor:
+                continue
+            donor_used[first_donor] = 1
+            for path in self._iter_paths([target, first_donor], max_length,
+                                         patient_used, donor_used, dist):
+                if path[-2] == patient and path[-1] == donor:
+                    yield self.rotate_cycle(path)
+            donor_used[first_donor] = 0
+
+    def _iter_chain_prefixes(self, patient, donor, max_length, patient_used, donor_used):
+        # Generate each chain of up to max_length pairs that ends with donor
+        # donating on behalf of patient, as a list that is modified in place
+        dist = self.distances_to(patient, max_length - 1, False)
+        for ndd_edge in xrange(len(self.ndd_edge_targets)):
+            first_patient = self.ndd_edge_targets[ndd_edge]
+            if first_patient not in dist:
+                continue
+            patient_used[first_patient] = 1
+            for first_donor in self.donors_of(first_patient):
+                donor_used[first_donor] = 1
+                for path in self._iter_paths([ndd_edge, first_patient, first_donor],
+                                             max_length, patient_used, donor_used, dist):
+                    if path[-2] == patient and path[-1] == donor:
+                        yield path
+                donor_used[first_donor] = 0
+            patient_used[first_patient] = 0
+
+    def iter_chains_through_pair(self, patient, donor, max_length):
+        """Generate the index tuple of each chain of up to max_length pairs in which
+        donor donates on behalf of patient"""
+        if max_length == 0:
+            return
+        patient_used = bytearray(self.num_patients)
+        donor_used = bytearray(self.num_donors)
+        for prefix in self._iter_chain_prefixes(patient, donor, max_length,
+                                                patient_used, donor_used):
+            num_pairs = len(prefix) / 2
+            for path in self._iter_paths(list(prefix), max_length - num_pairs + 1,
+                                         patient_used, donor_used):
+                yield tuple(path)
+
+    def iter_chains_through_arc(self, patient, donor, target, max_length):
+        """Generate the index tuple of each chain of up to max_length pairs in which
+        donor donates to target on behalf of patient"""
+        if max_length < 2:
+            return
+        patient_used = bytearray(self.num_patients)
+        donor_used = bytearray(self.num_donors)
+        for prefix in self._iter_chain_prefixes(patient, donor, max_length - 1,
+                                                patient_used, donor_used):
+            if patient_used[target]:
+                continue
+            num_pairs = len(prefix) / 2
+            patient_used[target] = 1
+            for next_donor in self.donors_of(target):
+                if not donor_used[next_donor]:
+                    donor_used[next_donor] = 1
+                    for path in self._iter_paths(list(prefix) + [target, next_donor],
+                                                 max_length - num_pairs,
+                                                 patient_used, donor_used):
+                        yield tuple(path)
+                    donor_used[next_donor] = 0
+            patient_used[target] = 0
+
+    def find_cycles(self, max_length):
+        cycles = StructureStore()
+        for members in self.iter_cycles(max_length):
+            cycles.append(members)
+        return cycles
+
+    def find_chains(self, max_length):
+        chains = ChainStore()
+        for members in self.iter_chains(max_length):
+            chains.append(members)
+        return chains
+
+    def count_cycles(self, max_length, patient_counts, donor_counts):
+        """Count the cycles of up to max_length pairs without storing them.
+        Returns a list whose element k is the number of cycles of k pairs, and
+        adds the number of cycles containing each patient and donor to its
+        element of patient_counts or donor_counts."""
+        by_length = [0] * (max_length + 1)
+        for first_patient in xrange(self.num_patients):
+            for path in self._iter_cycle_paths(first_patient, max_length):
+                by_length[len(path) / 2] += 1
+                for i in xrange(0, len(path), 2):
+                    patient_counts[path[i]] += 1
+                    donor_counts[path[i+1]] += 1
+        return by_length
+
+    def count_chains(self, max_length, patient_counts, donor_counts, ndd_counts):
+        """Count the chains of up to max_length pairs without storing them, as for
+        count_cycles, also adding the number of chains from each NDD to its
+        element of ndd_counts"""
+        by_length = [0] * (max_length + 1)
+        for ndd_edge in xrange(len(self.ndd_edge_targets)):
+            ndd = self.ndd_edge_ndds[ndd_edge]
+            for path in self._iter_chain_paths(ndd_edge, max_length):
+                by_length[len(path) / 2] += 1
+                ndd_counts[ndd] += 1
+                for i in xrange(1, len(path), 2):
+                    patient_counts[path[i]] += 1
+                    donor_counts[path[i+1]] += 1
+        return by_length
+
+    # Changes to the pool. Each of these updates the arrays as if a new
+    # CompactPool had been built for the changed pool, and patches arc_values
+    # if they have been built. Patients and paired donors cannot be added or
+    # removed this way, since every lookup key is built from their numbers and
+    # from num_patients and num_donors.
+
+    def add_arc(self, donor, patient, score):
+        "Add an arc from donor to patient, which has none, after the donor's other edges"
+        pos = self.donor_edge_offsets[donor+1]
+        self.arc_positions[donor * self.num_patients + patient] = (
+                pos - self.donor_edge_offsets[donor])
+        self.donor_edge_targets.insert(pos, patient)
+        self.donor_edge_scores.insert(pos, score)
+        _shift(self.donor_edge_offsets, donor + 1, 1)
+        sources = self.patients_of(donor)
+        self._set_preds(patient, set(self.preds_of(patient)).union(sources))
+        if self.arc_values is not None:
+            self.arc_values.add_arc(self, sources, donor, patient)
+
+    def remove_arc(self, donor, patient):
+        "Remove every edge from donor to patient"
+        start = self.donor_edge_offsets[donor]
+        end = self.donor_edge_offsets[donor+1]
+        kept = [pos for pos in xrange(start, end) if self.donor_edge_targets[pos] != patient]
+        if len(kept) == end - start:
+            return
+        self.donor_edge_targets[start:end] = array(
+                'i', [self.donor_edge_targets[pos] for pos in kept])
+        self.donor_edge_scores[start:end] = array(
+                'd', [self.donor_edge_scores[pos] for pos in kept])
+        _shift(self.donor_edge_offsets, donor + 1, len(kept) - (end - start))
+        del self.arc_positions[donor * self.num_patients + patient]
+        self._index_arcs(donor)
+        sources = self.patients_of(donor)
+        preds = set(self.preds_of(patient))
+        preds.difference_update(u for u in sources if not self.has_patient_arc(u, patient))
+        self._set_preds(patient, preds)
+        if self.arc_values is not None:
+            self.arc_values.remove_arc(self, sources, donor, patient)
+
+    def _set_preds(self, patient, preds):
+        start = self.patient_pred_offsets[patient]
+        end = self.patient_pred_offsets[patient+1]
+        self.patient_preds[start:end] = array('i', sorted(preds))
+        _shift(self.patient_pred_offsets, patient + 1, len(preds) - (end - start))
+
+    def add_ndd_edge(self, ndd, patient, score):
+        """Add an edge from ndd to patient after the NDD's other edges, and return
+        its number. The edges of later NDDs move up by one."""
+        k = self.ndd_edge_offsets[ndd+1]
+        self.ndd_edge_targets.insert(k, patient)
+        self.ndd_edge_scores.insert(k, score)
+        self.ndd_edge_ndds.insert(k, ndd)
+        _shift(self.ndd_edge_offsets, ndd + 1, 1)
+        self.ndd_arcs.add(ndd * self.num_patients + patient)
+        if self.arc_values is not None:
+            self.arc_values.add_ndd_edge(self, k)
+        return k
+
+    def remove_ndd_edges(self, ndd, patient):
+        """Remove every edge from ndd to patient. The edges after them move down."""
+        removed = [k for k in xrange(self.ndd_edge_offsets[ndd], self.ndd_edge_offsets[ndd+1])
+                   if self.ndd_edge_targets[k] == patient]
+        for k in reversed(removed):
+            del self.ndd_edge_targets[k]
+            del self.ndd_edge_scores[k]
+            del self.ndd_edge_ndds[k]
+            if self.arc_values is not None:
+                self.arc_values.remove_ndd_edge(k)
+        _shift(self.ndd_edge_offsets, ndd + 1, -len(removed))
+        self.ndd_arcs.discard(ndd * self.num_patients + patient)
+
+    def add_ndd(self, dage):
+        "Add an NDD with no edges, and return its number"
+        self.ndd_dage.append(dage)
+        self.ndd_edge_offsets.append(self.ndd_edge_offsets[-1])
+        self.num_ndds += 1
+        return self.num_ndds - 1
+
+    def remove_ndd(self, ndd):
+        "Remove an NDD and its edges. Later NDDs and their edges move down."
+        for patient in set(self.ndd_edge_targets[self.ndd_edge_offsets[ndd]:
+                                                 self.ndd_edge_offsets[ndd+1]]):
+            self.remove_ndd_edges(ndd, patient)
+        del self.ndd_dage[ndd]
+        del self.ndd_edge_offsets[ndd+1]
+        self.num_ndds -= 1
+        for k in xrange(self.ndd_edge_offsets[ndd], len(self.ndd_edge_ndds)):
+            self.ndd_edge_ndds[k] -= 1
+        bound = (ndd + 1) * self.num_patients
+        self.ndd_arcs = {key - self.num_patients if key >= bound else key
+                         for key in self.ndd_arcs}
+
+def _shift(offsets, start, delta):
+    # Add delta to offsets[start:], after delta items are inserted before them
+    for i in xrange(start, len(offsets)):
+        offsets[i] += delta
@@ -0,0 +1,275 @@
+def bit_indices(bits):
+    "Generate the positions of the set bits of a non-negative int, in ascending order"
+    s = bin(bits)[:1:-1]
+    i = s.find("1")
+    while i != -1:
+        yield i
+        i = s.find("1", i+1)
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+def bits_from_indices(indices, num_bits):
+    "An int whose set bits are at the given positions, each of which is less than num_bits"
+    digits = bytearray("0" * num_bits)
+    for i in indices:
+        digits[num_bits - 1 - i] = "1"
+    return int(str(digits), 2) if num_bits else 0
+
+def _runs(new_ids, kept):
+    # The [start, end, new_start] of each maximal run start..end-1 of the nodes
+    # in kept, which is sorted, that are mapped to consecutive new ids
+    runs = []
+    for v in kept:
+        if runs and runs[-1][1] == v and runs[-1][2] + v - runs[-1][0] == new_ids[v]:
+            runs[-1][1] = v + 1
+        else:
+            runs.append([v, v + 1, new_ids[v]])
+    return runs
+
+def _compress_moves(mask, width):
+    """The (move, shift) steps that squeeze the bits of an int that are selected
+    by mask down into its lowest bits, keeping their order. Applied in reverse,
+    the same steps spread the lowest bits out to the positions in mask. This is
+    the method of Hacker's Delight, sections 7-4 and 7-5, for width bits."""
+    full = (1 << width) - 1
+    # Bit j of zeros is set if bit j-1 of mask is clear
+    zeros = ~mask << 1 & full
+    moves = []
+    shift = 1
+    while shift < width:
+        # Bit j of parity is the parity of the number of set bits of zeros at
+        # or below j
+        parity = zeros ^ zeros << 1
+        s = 2
+        while s < width:
+            parity ^= parity << s
+            s <<= 1
+        parity &= full
+        move = parity & mask
+        mask = mask ^ move | move >> shift
+        if move:
+            moves.append((move, shift))
+        zeros &= ~parity
+        shift <<= 1
+    return moves
+
+class ConflictGraph(object):
+    """An undirected graph on the nodes 0..n-1 of an MWIS instance.
+
+    Each node's neighbourhood is stored as an integer bitset, with bit j of
+    rows[i] set iff i and j are adjacent. A row only takes as many bits as its
+    highest-numbered neighbour, which for the dense conflict graphs built from
+    kidney pools is far smaller than a set or a list of Python bools.
+
+    The graph therefore takes O(n^2) bits in the worst case, not memory in
+    proportion to the number of edges as adjacency sets would. A set entry
+    costs hundreds of bits, so the bitsets are smaller unless fewer than about
+    one pair of nodes in a few hundred is adjacent. size_estimate counts the
+    graph this way.
+    """
+
+    def __init__(self, num_nodes):
+        self.rows = [0] * num_nodes
+        self.num_edges = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def num_nodes(self):
+        return len(self.rows)
+
+    def add_edge(self, u, v):
+        if u != v and not self.rows[u] >> v & 1:
+            self.rows[u] |= 1 << v
+            self.rows[v] |= 1 << u
+            self.num_edges += 1
+
+    def add_clique(self, node_ids):
+        if len(node_ids) < 2:
+            return
+        mask = bits_from_indices(node_ids, max(node_ids) + 1)
+        num_new_arcs = 0
+        for v in node_ids:
+            new_nbrs = mask & ~self.rows[v] & ~(1 << v)
+            if new_nbrs:
+                num_new_arcs += popcount(new_nbrs)
+                self.rows[v] |= new_nbrs
+        self.num_edges += num_new_arcs / 2
+
+    def join_new_nodes(self, new_nodes, node_lists):
+        """Add an edge between each of new_nodes, which must have no edges yet,
+        and every other node of each of node_lists that contains it. Each other
+        node gains the new nodes of a list in one step, and only the rows of the
+        new nodes are counted."""
+        is_new = set(new_nodes)
+        new_mask = bits_from_indices(new_nodes, len(self.rows))
+        for node_ids in node_lists:
+            mask = bits_from_indices(node_ids, len(self.rows))
+            added = mask & new_mask
+            if not added:
+                continue
+            for v in node_ids:
+                self.rows[v] |= mask if v in is_new else added
+        # An edge between two new nodes is seen from both of them
+        num_arcs = 0
+        num_new_arcs = 0
+        for v in new_nodes:
+            self.rows[v] &= ~(1 << v)
+            num_arcs += popcount(self.rows[v])
+            num_new_arcs += popcount(self.rows[v] & new_mask)
+        self.num_edges += num_arcs - num_new_arcs / 2
+
+    def has_edge(self, u, v):
+        return bool(self.rows[u] >> v & 1)
+
+    def neighbours(self, v):
+        "A list of the neighbours of v, in ascending order"
+        return list(bit_indices(self.rows[v]))
+
+    def later_neighbours(self, v):
+        "Generate the neighbours of v that are greater than v, in ascending order"
+        for j in bit_indices(self.rows[v] >> (v+1)):
+            yield j + v + 1
+
+    def non_neighbours(self, v):
+        "A list of the nodes other than v that are not adjacent to v, in ascending order"
+        all_nodes = (1 << len(self.rows)) - 1
+        return list(bit_indices(all_nodes & ~self.rows[v] & ~(1 << v)))
+
+    def later_non_neighbours(self, v):
+        "Generate the nodes greater than v that are not adjacent to v, in ascending order"
+        num_later = len(self.rows) - v - 1
+        for j in bit_indices(~(self.rows[v] >> (v+1)) & ((1 << num_later) - 1)):
+            yield j + v + 1
+
+    def degree(self, v):
+        return popcount(self.rows[v])
+
+    def bitset(self, v):
+        "The neighbourhood of v as an integer with bit j set iff v is adjacent to j"
+        return self.rows[v]
+
+    def remove_node(self, v):
+        "Delete every edge incident to v. The node itself keeps its number."
+        bit = 1 << v
+        for w in bit_indices(self.rows[v]):
+            self.rows[w] &= ~bit
+        self.num_edges -= popcount(self.rows[v])
+        self.rows[v] = 0
+
+    def twin_classes(self, node_ids):
+        """Return the classes of two or more of node_ids that have the same closed
+        neighbourhood, each as a list in the order of node_ids.
+
+        Nodes with the same closed neighbourhood are necessarily adjacent. The
+        classes are found by hashing each node's closed neighbourhood bitset
+        into a bucket, rather than by comparing pairs of rows."""
+        buckets = {}
+        for v in node_ids:
+            buckets.setdefault(self.rows[v] | (1 << v), []).append(v)
+        return [bucket for bucket in buckets.itervalues() if len(bucket) > 1]
+
+    def components(self):
+        """Return the connected components, each as an ascending list of nodes,
+        in order of their lowest-numbered nodes"""
+        components = []
+        unvisited = (1 << len(self.rows)) - 1
+        while unvisited:
+            component = frontier = unvisited & -unvisited
+            while frontier:
+                reached = 0
+                for v in bit_indices(frontier):
+                    reached |= self.rows[v]
+                frontier = reached & ~component
+                component |= frontier
+            unvisited &= ~component
+            components.append(list(bit_indices(component)))
+        return components
+
+    def edges(self):
+        "Generate each edge (i, j) with i < j once, in lexicographic order"
+        for i in xrange(len(self.rows)):
+            for j in self.later_neighbours(i):
+                yield i, j
+
+    def copy(self):
+        graph = ConflictGraph(0)
+        graph.rows = list(self.rows)
+        graph.num_edges = self.num_edges
+        return graph
+
+    def subgraph(self, node_ids):
+        """Return the subgraph induced by node_ids, where node node_ids[k] of
+        this graph becomes node k of the new graph"""
+        new_index = [-1] * len(self.rows)
+        for k, v in enumerate(node_ids):
+            new_index[v] = k
+        sub = ConflictGraph(len(node_ids))
+        num_arcs = 0
+        for k, v in enumerate(node_ids):
+            nbrs = [new_index[w] for w in bit_indices(self.rows[v]) if new_index[w] != -1]
+            num_arcs += len(nbrs)
+            sub.rows[k] = bits_from_indices(nbrs, len(node_ids))
+        sub.num_edges = num_arcs / 2
+        return sub
+
+    def relabel(self, new_ids, num_nodes):
+        """Return a graph on num_nodes nodes in which node v of this graph becomes
+        node new_ids[v], or is left out if new_ids[v] is -1. new_ids must be
+        increasing over the nodes that are kept, and the nodes of the new graph
+        that no node is mapped to have no edges.
+
+        Rows are moved as bitsets rather than edge by edge. Each run of nodes
+        that stay consecutive is shifted in one step, or, if there are many runs,
+        the nodes left out are squeezed out of each row and the rest spread to
+        their new positions with a fixed number of masked shifts."""
+        width = max(len(self.rows), num_nodes)
+        kept = [v for v in xrange(len(self.rows)) if new_ids[v] != -1]
+        runs = _runs(new_ids, kept)
+        keep_mask = bits_from_indices(kept, width)
+        target_mask = bits_from_indices([new_ids[v] for v in kept], width)
+        # Nothing needs to be squeezed out if the kept nodes are 0..len(kept)-1,
+        # and nothing spread out if they are mapped to 0..len(kept)-1
+        compress = []
+        if kept and kept[-1] != len(kept) - 1:
+            compress = _compress_moves(keep_mask, width)
+        expand = []
+        if kept and new_ids[kept[-1]] != len(kept) - 1:
+            expand = _compress_moves(target_mask, width)
+
+        graph = ConflictGraph(num_nodes)
+        if 3 * len(runs) <= 4 * (len(compress) + len(expand)):
+            run_masks = [(start, (1 << (end - start)) - 1, new_start)
+                         for start, end, new_start in runs]
+            for v in kept:
+                row = self.rows[v]
+                new_row = 0
+                for start, mask, new_start in run_masks:
+                    new_row |= (row >> start & mask) << new_start
+                graph.rows[new_ids[v]] = new_row
+        else:
+            for v in kept:
+                x = self.rows[v] & keep_mask
+                for move, shift in compress:
+                    t = x & move
+                    x = x ^ t | t >> shift
+                for move, shift in reversed(expand):
+                    x = x & ~move | x << shift & move
+                graph.rows[new_ids[v]] = x & target_mask
+
+        # Count the edges on whichever side of the split is smaller
+        if 2 * len(kept) < len(self.rows):
+            graph.num_edges = sum(popcount(row) for row in graph.rows) / 2
+        else:
+            dropped = [v for v in xrange(len(self.rows)) if new_ids[v] == -1]
+            dropped_mask = bits_from_indices(dropped, width)
+            num_arcs = sum(2 * popcount(self.rows[v]) - popcount(self.rows[v] & dropped_mask)
+                           for v in dropped)
+            graph.num_edges = self.num_edges - num_arcs / 2
+        return graph
+
+    def adj_mat_row_string(self, v):
+        row = self.rows[v]
+        return " ".join("X" if row >> w & 1 else "." for w in xrange(len(self.rows)))
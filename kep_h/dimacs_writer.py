@@ -0,0 +1,44 @@
+# Number of "n" records to join into a single chunk of output
+NODE_CHUNK_SIZE = 4096
+
+# Buffer size used when writing an instance to a named file
+BUFFER_SIZE = 1 << 20
+
+def dimacs_records(graph, hier_scores, descriptions, invert_edges=False):
+    """Generate the "c", "p", "e" and "n" lines of a DIMACS MWIS instance.
+
+    Lines are yielded in chunks of many lines each; edges are generated one
+    row at a time, so the complement graph is never built in full.
+    """
+    num_nodes = len(graph)
+
+    if num_nodes < 30:
+        yield "c Adjacency matrix\n"
+        for i in xrange(num_nodes):
+            yield "c {}\n".format(graph.adj_mat_row_string(i))
+
+    for start in xrange(0, len(descriptions), NODE_CHUNK_SIZE):
+        yield "".join("c {} {}\n".format(i+1, descriptions[i])
+                      for i in xrange(start, min(start + NODE_CHUNK_SIZE, len(descriptions))))
+
+    if invert_edges:
+        num_edges = (num_nodes*num_nodes - num_nodes) / 2 - graph.num_edges
+    else:
+        num_edges = graph.num_edges
+    yield "p edge {} {}\n".format(num_nodes, num_edges)
+
+    for i in xrange(num_nodes):
+        if invert_edges:
+            row = graph.later_non_neighbours(i)
+        else:
+            row = graph.later_neighbours(i)
+        chunk = "".join("e %d %d\n" % (i+1, j+1) for j in row)
+        if chunk:
+            yield chunk
+
+    for start in xrange(0, num_nodes, NODE_CHUNK_SIZE):
+        yield "".join("n %d %d\n" % (i+1, hier_scores[i])
+                      for i in xrange(start, min(start + NODE_CHUNK_SIZE, num_nodes)))
+
+def write_dimacs(out, graph, hier_scores, descriptions, invert_edges=False):
+    out.writelines(dimacs_records(graph, hier_scores, descriptions, invert_edges))
@@ -0,0 +1,130 @@
+"""Timing, memory and counter statistics for the stages of a run.
+
+A Stats object records the wall time of each named stage, the peak resident
+set size of the process when the stage ends, and named counters. The stats
+can be written as "c stat" comment lines or as a JSON object. NullStats has
+the same interface and records nothing, so code can be instrumented
+unconditionally.
+
+Python 2 has no tracemalloc, so memory is measured as the peak RSS reported
+by getrusage, which only ever increases; a stage's rss_growth_kb is the
+increase in the peak during the stage.
+"""
+
+import cProfile
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss_kb():
+    "The peak resident set size of this process in kilobytes, or None if unknown"
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, and macOS bytes
+    return peak / 1024 if sys.platform == "darwin" else peak
+
+class StageStats(object):
+    def __init__(self, name, seconds, peak_rss_kb, rss_growth_kb):
+        self.name = name
+        self.seconds = seconds
+        self.peak_rss_kb = peak_rss_kb
+        self.rss_growth_kb = rss_growth_kb
+
+class Stats(object):
+    def __init__(self):
+        self.stages = []
+        self.counters = []
+        self.counter_index = {}
+
+    @contextmanager
+    def stage(self, name):
+        "A context manager that records the time and memory of the code it encloses"
+        start_rss = peak_rss_kb()
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start_time
+            end_rss = peak_rss_kb()
+            growth = None if end_rss is None else end_rss - start_rss
+            self.stages.append(StageStats(name, seconds, end_rss, growth))
+
+    def count(self, name, value):
+        "Set a counter, keeping the position of its first setting"
+        if name not in self.counter_index:
+            self.counter_index[name] = len(self.counters)
+            self.counters.append([name, value])
+        else:
+            self.counters[self.counter_index[name]][1] = value
+
+    def add(self, name, value):
+        "Add value to a counter, which starts at 0"
+        if name in self.counter_index:
+            value += self.counters[self.counter_index[name]][1]
+        self.count(name, value)
+
+    def comment_lines(self):
+        "The stats as lines for a DIMACS file, without newlines"
+        lines = []
+        for stage in self.stages:
+            line = "c stat stage {} {:.6f} s".format(stage.name.replace(" ", "_"),
+                                                     stage.seconds)
+            if stage.peak_rss_kb is not None:
+                line += " peak_rss {} kB growth {} kB".format(stage.peak_rss_kb,
+                                                              stage.rss_growth_kb)
+            lines.append(line)
+        for name, value in self.counters:
+            lines.append("c stat count {} {}".format(name.replace(" ", "_"), value))
+        return lines
+
+    def to_json(self):
+        return {"stages": [{"name": stage.name, "seconds": stage.seconds,
+                            "peak_rss_kb": stage.peak_rss_kb,
+                            "rss_growth_kb": stage.rss_growth_kb}
+                           for stage in self.stages],
+                "counters": {name: value for name, value in self.counters},
+                "peak_rss_kb": peak_rss_kb()}
+
+    def write_json(self, out):
+        json.dump(self.to_json(), out, indent=2, sort_keys=True)
+        out.write("\n")
+
+class NullStats(object):
+    "Stats that records nothing"
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def count(self, name, value):
+        pass
+
+    def add(self, name, value):
+        pass
+
+def count_lengths(stats, kind, store, is_chain):
+    # Set a counter for the number of cycles or chains of each length in pairs.
+    # A cycle's index tuple has two entries per pair, and a chain's has one
+    # more, for its NDD edge.
+    counts = {}
+    for length in store.lengths():
+        counts[length / 2] = counts.get(length / 2, 0) + 1
+    stats.count(kind, len(store))
+    for length in sorted(counts):
+        stats.count("{} of length {}".format(kind, length), counts[length])
+
+def run_profiled(filename, fun, *args, **kwargs):
+    """Call fun with args and kwargs under cProfile, write the profile to
+    filename for the pstats module, and return fun's result"""
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(fun, *args, **kwargs)
+    finally:
+        profile.dump_stats(filename)
@@ -1,14 +1,16 @@
 import argparse
 import sys
-import json
 from kep_h_pool import *
 from optimality_criteria import *
 from kep_h_pool_optimiser import PoolOptimiser
+from reductions import get_reductions
+from structure_cache import StructureCache, cache_key
+from size_estimate import SizeEstimate
+from instrumentation import Stats, run_profiled
+from dimacs_writer import BUFFER_SIZE
+from sweep import parse_shifts, read_sweep_configs
 import pool_reader
 
-def parse_shifts(input):
-    return [int(s) for s in input.split(":")] + [0]
-
 if __name__=="__main__":
     parser = argparse.ArgumentParser(description="Hierarchical kidney-exchange optimisation")
     parser.add_argument("-f", "--file", help="Input file name", type=str,
@@ -16,14 +18,12 @@ if __name__=="__main__":
     parser.add_argument("-c", "--criteria",
                         help="A colon-separated list of optimality criteria," +
                              "such as effective:size:3way:backarc:weight",
-                        type=str,
-                        required=True)
+                        type=str)
     parser.add_argument("-s", "--shifts",
                         help="A colon-separated list of bit-shifts" +
                              " specifying the width in bits of the last n-1 criterion-scores" +
                              " such as 7:6:7:36",
-                        type=str,
-                        required=True)
+                        type=str)
     parser.add_argument("-e", "--cycle",
                         help="Maximum cycle length",
                         type=int,
@@ -40,20 +40,160 @@ if __name__=="__main__":
     parser.add_argument("-r", "--reduce-nodes",
                         help="Remove some nodes that can't be part of a solution",
                         action='store_true') 
+    parser.add_argument("-R", "--reductions",
+                        help="A colon-separated list of MWIS reductions to apply, " +
+                             "such as domination:simplicial:degree1:isolated:twin",
+                        type=str)
     parser.add_argument("-i", "--invert-edges",
                         help="Create complement graph",
                         action='store_true') 
+    parser.add_argument("-w", "--output-file",
+                        help="Write the instance to this file instead of standard output",
+                        type=str)
+    parser.add_argument("-b", "--binary",
+                        help="Write the instance in the binary format of binary_instance.py " +
+                             "instead of DIMACS",
+                        action='store_true') 
+    parser.add_argument("-S", "--solve",
+                        help="Solve the instance, and write the chosen cycles and chains " +
+                             "in the format read by check_solution.py instead of the instance",
+                        action='store_true')
+    parser.add_argument("-H", "--heuristic",
+                        help="Like --solve, but find a good solution quickly by local search " +
+                             "instead of an optimal one",
+                        action='store_true')
+    parser.add_argument("-t", "--time-limit",
+                        help="Time limit in seconds for --solve or --heuristic, after which " +
+                             "the best solution found is written",
+                        type=float)
+    parser.add_argument("-C", "--components",
+                        help="Solve each connected component of the conflict graph separately, " +
+                             "or without --solve write component k to OUTPUT_FILE.k",
+                        action='store_true')
+    parser.add_argument("-j", "--jobs",
+                        help="Number of processes to use for enumerating cycles and chains, " +
+                             "and for solving components",
+                        type=int,
+                        default=1)
+    parser.add_argument("--sweep",
+                        help="A file of criteria, shifts and node orders, one configuration " +
+                             "per line, used instead of --criteria, --shifts and --node-order. " +
+                             "The output for configuration k is written to OUTPUT_FILE.k",
+                        type=str)
+    parser.add_argument("--cache-dir",
+                        help="A directory in which to cache the enumerated cycles and chains " +
+                             "of each pool, for reuse by runs with other criteria or shifts",
+                        type=str)
+    parser.add_argument("--cache-size",
+                        help="The size limit of the cache directory in megabytes, beyond " +
+                             "which the least recently used entries are deleted",
+                        type=int,
+                        default=1024)
+    parser.add_argument("--stats",
+                        help="Write the time and peak memory of each stage, and counts of " +
+                             "cycles, chains, nodes and edges, as 'c stat' lines at the end " +
+                             "of a DIMACS instance, or otherwise to standard error",
+                        action='store_true')
+    parser.add_argument("--metrics",
+                        help="Write the statistics of --stats to this file as JSON",
+                        type=str)
+    parser.add_argument("--profile",
+                        help="Run the optimisation under cProfile, and write the profile " +
+                             "to this file for the pstats module",
+                        type=str)
+    parser.add_argument("--estimate",
+                        help="Count the cycles and chains without storing them, and print " +
+                             "the number of nodes, a bound on the number of edges, and the " +
+                             "projected memory and output size, instead of optimising",
+                        action='store_true')
     args = parser.parse_args()
 
-    opt_criteria = get_criteria(args.criteria)
-    shifts = parse_shifts(args.shifts)
+    if args.sweep is not None:
+        with open(args.sweep) as sweep_file:
+            configs = read_sweep_configs(sweep_file)
+        opt_criteria = configs[0].criteria if configs else []
+        shifts = configs[0].bit_shifts if configs else []
+    elif args.criteria is not None and args.shifts is not None:
+        opt_criteria = get_criteria(args.criteria)
+        shifts = parse_shifts(args.shifts)
+    else:
+        parser.error("--criteria and --shifts are required unless --sweep is given")
+    solving = args.solve or args.heuristic
+    reduction_list = None if args.reductions is None else get_reductions(args.reductions)
 
     if not args.file.endswith(".json"):
         print "Input file must be in JSON format"
     elif len(opt_criteria) != len(shifts):
         print "Length of shifts must be one less than length of optimality criteria."
+    elif args.estimate:
+        with open(args.file) as json_file:
+            pool = pool_reader.read_file(json_file)
+        estimate = SizeEstimate(pool, args.cycle, args.chain)
+        # The top criterion's scores are assumed to fit in a byte
+        score_bits = sum(shifts) + 8
+        for line in estimate.report_lines(len(opt_criteria), score_bits,
+                                          args.reduce_nodes or reduction_list is not None,
+                                          args.invert_edges):
+            print line
+    elif args.components and not solving and args.output_file is None:
+        print "An output file is needed to write components as separate instances."
+    elif args.sweep is not None and args.output_file is None:
+        print "An output file is needed to write the output of each sweep configuration."
+    elif args.sweep is not None and args.components:
+        print "--components cannot be used with --sweep."
     else:
+        stats = Stats() if args.stats or args.metrics is not None else None
         with open(args.file) as json_file:
-            pool = pool_reader.read(json.load(json_file)["data"])
-            pool_optimiser = PoolOptimiser(pool, opt_criteria, args.cycle, args.chain)
-            pool_optimiser.solve(args.invert_edges, args.reduce_nodes, args.node_order, shifts)
+            if stats is not None:
+                with stats.stage("read pool"):
+                    pool = pool_reader.read_file(json_file)
+            else:
+                pool = pool_reader.read_file(json_file)
+            structures = None
+            if args.cache_dir is not None:
+                cache = StructureCache(args.cache_dir, args.cache_size << 20)
+                key = cache_key(args.file, args.cycle, args.chain)
+                structures = cache.load(key)
+            pool_optimiser = PoolOptimiser(pool, opt_criteria, args.cycle, args.chain,
+                                           args.jobs, structures, stats)
+            if args.cache_dir is not None and structures is None:
+                cache.save(key, pool_optimiser.chain_members, pool_optimiser.cycle_members)
+            mode = "wb" if args.binary and not solving else "w"
+            component_out = lambda k: open("{}.{}".format(args.output_file, k+1), mode,
+                                           BUFFER_SIZE)
+            if args.heuristic:
+                output_format = "heuristic"
+            elif args.solve:
+                output_format = "solution"
+            elif args.binary:
+                output_format = "binary"
+            else:
+                output_format = "dimacs"
+            if args.profile is not None:
+                run = lambda fun, *fun_args: run_profiled(args.profile, fun, *fun_args)
+            else:
+                run = lambda fun, *fun_args: fun(*fun_args)
+            out = sys.stdout
+            try:
+                if args.sweep is not None:
+                    run(pool_optimiser.sweep, configs, args.invert_edges, args.reduce_nodes,
+                        component_out, output_format, reduction_list, args.time_limit)
+                else:
+                    if args.output_file is not None and not (args.components and not solving):
+                        out = open(args.output_file, mode, BUFFER_SIZE)
+                    run(pool_optimiser.solve, args.invert_edges, args.reduce_nodes,
+                        args.node_order, shifts, out, output_format, reduction_list,
+                        args.time_limit, args.components, component_out)
+                if args.stats:
+                    # Comment lines can only be added to a single DIMACS instance
+                    single_dimacs = (output_format == "dimacs" and args.sweep is None and
+                                     not args.components)
+                    stats_out = out if single_dimacs else sys.stderr
+                    for line in stats.comment_lines():
+                        stats_out.write(line + "\n")
+                if args.metrics is not None:
+                    with open(args.metrics, "w") as metrics_file:
+                        stats.write_json(metrics_file)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
@@ -0,0 +1,342 @@
+"""Run kep_h on many pool files, each in a child process of its own, with
+several running at once.
+
+Each input file gives one output file in the output directory, named after
+the input, and one row of a summary CSV file with the numbers of nodes and
+conflict edges and the time taken by each stage, which is left empty for
+stages that were not run, such as reductions when none were asked for. A file
+that cannot be read or optimised, whose child process dies, or that takes
+longer than the per-file timeout gets a row with status "error", and the
+other files are still processed.
+"""
+
+import argparse
+import csv
+import glob
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from instrumentation import Stats
+from optimality_criteria import get_criteria
+from kep_h_pool_optimiser import PoolOptimiser, OptimisationException
+from reductions import get_reductions
+from dimacs_writer import BUFFER_SIZE
+from sweep import parse_shifts
+import pool_reader
+
+SUMMARY_FIELDS = ["file", "status", "nodes", "edges", "read_seconds", "enumerate_seconds",
+                  "score_seconds", "graph_seconds", "reduce_seconds", "solve_seconds",
+                  "write_seconds", "total_seconds", "output", "error"]
+
+# The summary field in which the time of each instrumentation stage is counted.
+# The time of any other stage is only included in total_seconds.
+STAGE_FIELDS = {"read pool": "read_seconds",
+                "cached chains": "enumerate_seconds",
+                "cached cycles": "enumerate_seconds",
+                "find chains": "enumerate_seconds",
+                "find cycles": "enumerate_seconds",
+                "chain scores": "score_seconds",
+                "cycle scores": "score_seconds",
+                "hierarchical scores": "score_seconds",
+                "conflict graph": "graph_seconds",
+                "reduce nodes": "reduce_seconds",
+                "reductions": "reduce_seconds",
+                "node order": "reduce_seconds",
+                "components": "solve_seconds",
+                "solve": "solve_seconds",
+                "write instance": "write_seconds"}
+
+# How often, in seconds, run_batch checks on its child processes
+POLL_INTERVAL = 0.05
+
+# The extension of the output file for each output format
+EXTENSIONS = {"dimacs": ".clq", "binary": ".bin", "solution": ".sol", "heuristic": ".sol"}
+
+def find_pool_files(paths):
+    """The JSON files named by paths, each of which is a directory, whose .json
+    files are used, or a file name or glob pattern. Each file appears once,
+    in order of first appearance."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(glob.glob(os.path.join(path, "*.json")))
+        else:
+            matches = sorted(glob.glob(path))
+        for match in matches:
+            if match not in files:
+                files.append(match)
+    return files
+
+def output_path(output_dir, pool_file, output_format):
+    name = os.path.splitext(os.path.basename(pool_file))[0]
+    return os.path.join(output_dir, name + EXTENSIONS[output_format])
+
+class BatchOptions(object):
+    # The options of a run that apply to every file. These are sent to the
+    # worker processes, so criteria and reductions are kept as strings.
+    def __init__(self, criteria, shifts, max_cycle, max_chain, output_dir,
+                 output_format="dimacs", node_order=0, reduce_nodes=False, reductions=None,
+                 invert_edges=False, time_limit=None):
+        self.criteria = criteria
+        self.shifts = shifts
+        self.max_cycle = max_cycle
+        self.max_chain = max_chain
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.node_order = node_order
+        self.reduce_nodes = reduce_nodes
+        self.reductions = reductions
+        self.invert_edges = invert_edges
+        self.time_limit = time_limit
+
+def run_file(task):
+    "Optimise one pool file, given (file name, BatchOptions). Returns a summary row."
+    pool_file, options = task
+    row = {"file": pool_file, "status": "ok"}
+    start_time = time.time()
+    try:
+        opt_criteria = get_criteria(options.criteria)
+        shifts = parse_shifts(options.shifts)
+        if len(opt_criteria) != len(shifts):
+            raise OptimisationException(
+                    "Length of shifts must be one less than length of optimality criteria.")
+        reduction_list = None if options.reductions is None else \
+                get_reductions(options.reductions)
+
+        stats = Stats()
+        with stats.stage("read pool"):
+            with open(pool_file) as json_file:
+                pool = pool_reader.read_file(json_file)
+
+        pool_optimiser = PoolOptimiser(pool, opt_criteria, options.max_cycle,
+                                       options.max_chain, stats=stats)
+
+        path = output_path(options.output_dir, pool_file, options.output_format)
+        mode = "wb" if options.output_format == "binary" else "w"
+        with open(path, mode, BUFFER_SIZE) as out:
+            pool_optimiser.solve(options.invert_edges, options.reduce_nodes,
+                                 options.node_order, shifts, out, options.output_format,
+                                 reduction_list, options.time_limit)
+        for stage in stats.stages:
+            field = STAGE_FIELDS.get(stage.name)
+            if field is None:
+                continue
+            row[field] = row.get(field, 0.0) + stage.seconds
+        row["output"] = path
+        graph = pool_optimiser.conflict_graph()
+        row["nodes"] = len(graph)
+        row["edges"] = graph.num_edges
+    except Exception as e:
+        row["status"] = "error"
+        row["error"] = "{}: {}".format(type(e).__name__, e)
+        row["traceback"] = traceback.format_exc()
+    row["total_seconds"] = time.time() - start_time
+    return row
+
+def error_row(pool_file, message, start_time):
+    # The summary row of a file whose child process did not send one back
+    return {"file": pool_file, "status": "error", "error": message,
+            "traceback": message + "\n", "total_seconds": time.time() - start_time}
+
+def _run_child(task, connection):
+    # The body of the child process for one file, which sends its row back
+    connection.send(run_file(task))
+    connection.close()
+
+class Child(object):
+    "A child process that optimises one pool file"
+
+    def __init__(self, task):
+        self.pool_file = task[0]
+        self.start_time = time.time()
+        self.connection, child_connection = multiprocessing.Pipe(False)
+        self.process = multiprocessing.Process(target=_run_child,
+                                               args=(task, child_connection))
+        self.process.start()
+        child_connection.close()
+
+    def result(self, timeout):
+        """The summary row of the file, or None if the child is still running.
+        A child that dies without sending a row, or that has run for more than
+        timeout seconds, gives an error row."""
+        # A child that has exited has already sent any row it will send, so
+        # its liveness is checked before its pipe. The pipe is also readable
+        # once a child has exited without sending a row.
+        alive = self.process.is_alive()
+        row = None
+        if self.connection.poll():
+            try:
+                row = self.connection.recv()
+            except EOFError:
+                alive = False
+        if row is None and alive:
+            if timeout is None or time.time() - self.start_time <= timeout:
+                return None
+            self.kill()
+            row = error_row(self.pool_file, "Timed out after {} s".format(timeout),
+                            self.start_time)
+        else:
+            self.process.join()
+            if row is None:
+                if self.process.exitcode < 0:
+                    message = "Child process killed by signal {}".format(
+                            -self.process.exitcode)
+                else:
+                    message = "Child process exited with code {}".format(
+                            self.process.exitcode)
+                row = error_row(self.pool_file, message, self.start_time)
+        self.connection.close()
+        return row
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+
+def format_row(row):
+    return {field: "{:.3f}".format(row[field]) if isinstance(row.get(field), float)
+                   else row.get(field, "")
+            for field in SUMMARY_FIELDS}
+
+def run_batch(pool_files, options, summary_file, jobs=1, timeout=None):
+    """Optimise each of pool_files in a child process, with up to jobs at once,
+    writing a summary row to the open file summary_file as each finishes.
+    A child still running after timeout seconds, if that is not None, is
+    killed. Returns the number of files that failed."""
+    writer = csv.DictWriter(summary_file, SUMMARY_FIELDS)
+    writer.writeheader()
+    tasks = [(pool_file, options) for pool_file in pool_files]
+    tasks.reverse()
+    num_errors = 0
+    # Each child handles one file, so the memory of a large pool is given
+    # back when it exits, and a crash affects only that file's row
+    children = []
+    try:
+        while tasks or children:
+            while tasks and len(children) < jobs:
+                children.append(Child(tasks.pop()))
+            time.sleep(POLL_INTERVAL)
+            running = []
+            for child in children:
+                row = child.result(timeout)
+                if row is None:
+                    running.append(child)
+                else:
+                    num_errors += report(row, writer, summary_file)
+            children = running
+    finally:
+        for child in children:
+            child.kill()
+    return num_errors
+
+def report(row, writer, summary_file):
+    # Write a summary row, and the traceback of a failure to stderr. Returns 1
+    # if the row is a failure, else 0.
+    writer.writerow(format_row(row))
+    summary_file.flush()
+    if row["status"] != "ok":
+        sys.stderr.write("Failed: {}\n{}".format(row["file"], row["traceback"]))
+        return 1
+    return 0
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(
+            description="Hierarchical kidney-exchange optimisation of many pools")
+    parser.add_argument("files", nargs="+",
+                        help="Input JSON files, directories of them, or glob patterns")
+    parser.add_argument("-c", "--criteria",
+                        help="A colon-separated list of optimality criteria," +
+                             "such as effective:size:3way:backarc:weight",
+                        type=str,
+                        required=True)
+    parser.add_argument("-s", "--shifts",
+                        help="A colon-separated list of bit-shifts" +
+                             " specifying the width in bits of the last n-1 criterion-scores" +
+                             " such as 7:6:7:36",
+                        type=str,
+                        required=True)
+    parser.add_argument("-e", "--cycle",
+                        help="Maximum cycle length",
+                        type=int,
+                        required=True)
+    parser.add_argument("-n", "--chain",
+                        help="Maximum chain length",
+                        type=int,
+                        required=True)
+    parser.add_argument("-d", "--output-dir",
+                        help="The directory to which an output file for each input is written",
+                        type=str,
+                        required=True)
+    parser.add_argument("--summary",
+                        help="The summary CSV file (default: summary.csv in the output " +
+                             "directory)",
+                        type=str)
+    parser.add_argument("-o", "--node-order",
+                        help="Node order (0=default, 1=random, 2=score asc., 3=score desc., " +
+                             "4=degree asc., 5=degree desc.)",
+                        type=int,
+                        default=0)
+    parser.add_argument("-r", "--reduce-nodes",
+                        help="Remove some nodes that can't be part of a solution",
+                        action='store_true')
+    parser.add_argument("-R", "--reductions",
+                        help="A colon-separated list of MWIS reductions to apply, " +
+                             "such as domination:simplicial:degree1:isolated:twin",
+                        type=str)
+    parser.add_argument("-i", "--invert-edges",
+                        help="Create complement graph",
+                        action='store_true')
+    parser.add_argument("-b", "--binary",
+                        help="Write each instance in the binary format of binary_instance.py " +
+                             "instead of DIMACS",
+                        action='store_true')
+    parser.add_argument("-S", "--solve",
+                        help="Solve each instance, and write the chosen cycles and chains",
+                        action='store_true')
+    parser.add_argument("-H", "--heuristic",
+                        help="Like --solve, but find a good solution quickly by local search",
+                        action='store_true')
+    parser.add_argument("-t", "--time-limit",
+                        help="Time limit in seconds for each instance for --solve or " +
+                             "--heuristic",
+                        type=float)
+    parser.add_argument("-j", "--jobs",
+                        help="Number of files to process at once",
+                        type=int,
+                        default=1)
+    parser.add_argument("--file-timeout",
+                        help="Time limit in seconds for each file, after which its child " +
+                             "process is killed and the file recorded as failed",
+                        type=float)
+    args = parser.parse_args()
+
+    if args.heuristic:
+        output_format = "heuristic"
+    elif args.solve:
+        output_format = "solution"
+    elif args.binary:
+        output_format = "binary"
+    else:
+        output_format = "dimacs"
+
+    pool_files = find_pool_files(args.files)
+    output_paths = [output_path(args.output_dir, f, output_format) for f in pool_files]
+    if not pool_files:
+        print "No input files found"
+        sys.exit(1)
+    if len(set(output_paths)) < len(output_paths):
+        print "Input files in different directories have the same name"
+        sys.exit(1)
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    summary_path = args.summary or os.path.join(args.output_dir, "summary.csv")
+    options = BatchOptions(args.criteria, args.shifts, args.cycle, args.chain, args.output_dir,
+                           output_format, args.node_order, args.reduce_nodes, args.reductions,
+                           args.invert_edges, args.time_limit)
+    with open(summary_path, "wb") as summary_file:
+        num_errors = run_batch(pool_files, options, summary_file, args.jobs,
+                               args.file_timeout)
+    if num_errors:
+        sys.stderr.write("{} of {} files failed\n".format(num_errors, len(pool_files)))
+        sys.exit(1)
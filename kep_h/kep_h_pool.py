@@ -1,63 +1,149 @@
 from collections import namedtuple
+from itertools import izip
+from compact_pool import CompactPool
 
 class Pool(object):
     def __init__(self):
         self.patients = []
         self.paired_donors = []
         self.altruists = []
+        self.compact = None
+        self.pd_pairs = None
+        # The number in self.compact of each patient, paired donor and altruist
+        self.patient_numbers = None
+        self.donor_numbers = None
+        self.altruist_numbers = None
 
     def associate_patient_with_donor(self, patient, paired_donor):
         patient.paired_donors.append(paired_donor)
         paired_donor.paired_patients.append(patient)
 
-    def find_cycles(self, max_length):
-        cycles = []
+    def build_indices(self):
+        # Build the lookup tables used by get_edge_to, has_edge_to and
+        # has_backarc_to, and the integer-indexed arrays in self.compact that
+        # are used for enumeration. This must be called again if edges or
+        # pairings change.
+        for donor in self.paired_donors:
+            donor.build_edge_index()
+        for altruist in self.altruists:
+            altruist.build_edge_index()
         for patient in self.patients:
-            for donor in patient.paired_donors:
-                p_d_pair = PatientDonorPair(patient, donor)
-                self._cycle(max_length, [p_d_pair], cycles)
-        return cycles
-
-    def _cycle(self, max_length, current_list, cycles):
-        last_pd_pair = current_list[-1]
-        first_patient = current_list[0].patient
-        if last_pd_pair.donor.has_edge_to(first_patient):
-            cycles.append(Cycle(current_list[:], len(cycles)+1))
-        if len(current_list) < max_length:
-            for edge in last_pd_pair.donor.edges_out:
-                patient = edge.target_patient
-                if patient.index > first_patient.index and not patient.is_in(current_list):
-                    for donor in patient.paired_donors:
-                        if not donor.is_in(current_list):
-                            pd_pair = PatientDonorPair(patient, donor)
-                            current_list.append(pd_pair)
-                            self._cycle(max_length, current_list, cycles)
-                            del current_list[-1]
+            patient.build_backarc_index()
+        self.patient_numbers = {patient: i for i, patient in enumerate(self.patients)}
+        self.donor_numbers = {donor: i for i, donor in enumerate(self.paired_donors)}
+        self.altruist_numbers = {altruist: i for i, altruist in enumerate(self.altruists)}
+        self.compact = CompactPool(self)
+        # The PatientDonorPair for each pairing, keyed by patient * num_donors + donor,
+        # where patient and donor are numbers in self.compact
+        num_donors = len(self.paired_donors)
+        self.pd_pairs = {}
+        for p, patient in enumerate(self.patients):
+            for d in self.compact.donors_of(p):
+                self.pd_pairs[p * num_donors + d] = PatientDonorPair(patient, self.paired_donors[d])
+
+    # Changes to arcs and NDDs. Each of these keeps the indices up to date if
+    # they have been built, rather than requiring build_indices to be called
+    # again. Pairings, patients and donors have no such methods, as their
+    # numbers in self.compact would all change.
+
+    def add_arc(self, donor, patient, score):
+        "Add an arc from donor to patient, which has none"
+        donor.edges_out.append(DonorPatientMatch(patient, score))
+        if self.compact is not None:
+            self._index_donor(donor)
+            self.compact.add_arc(self.donor_numbers[donor], self.patient_numbers[patient], score)
+
+    def remove_arc(self, donor, patient):
+        "Remove every arc from donor to patient"
+        donor.edges_out = [edge for edge in donor.edges_out
+                           if edge.target_patient is not patient]
+        if self.compact is not None:
+            self._index_donor(donor)
+            self.compact.remove_arc(self.donor_numbers[donor], self.patient_numbers[patient])
+
+    def _index_donor(self, donor):
+        donor.build_edge_index()
+        for patient in donor.paired_patients:
+            patient.build_backarc_index()
+
+    def add_altruist_edge(self, altruist, patient, score):
+        "Add an edge from altruist to patient, and return it"
+        edge = AltruistEdge(altruist, patient, score)
+        altruist.edges.append(edge)
+        if self.compact is not None:
+            altruist.build_edge_index()
+            self.compact.add_ndd_edge(self.altruist_numbers[altruist],
+                                      self.patient_numbers[patient], score)
+        return edge
+
+    def remove_altruist_edge(self, altruist, patient):
+        "Remove every edge from altruist to patient"
+        altruist.edges = [edge for edge in altruist.edges if edge.target_patient is not patient]
+        if self.compact is not None:
+            altruist.build_edge_index()
+            self.compact.remove_ndd_edges(self.altruist_numbers[altruist],
+                                          self.patient_numbers[patient])
+
+    def add_altruist(self, altruist):
+        "Add an altruist, with its edges in altruist.edges"
+        self.altruists.append(altruist)
+        if self.compact is not None:
+            altruist.build_edge_index()
+            ndd = self.compact.add_ndd(altruist.dage)
+            self.altruist_numbers[altruist] = ndd
+            for edge in altruist.edges:
+                self.compact.add_ndd_edge(ndd, self.patient_numbers[edge.target_patient],
+                                          edge.score)
+
+    def remove_altruist(self, altruist):
+        if self.compact is None:
+            self.altruists.remove(altruist)
+            return
+        ndd = self.altruist_numbers.pop(altruist)
+        del self.altruists[ndd]
+        for later_altruist in self.altruists[ndd:]:
+            self.altruist_numbers[later_altruist] -= 1
+        self.compact.remove_ndd(ndd)
+
+    def find_cycles(self, max_length):
+        self.build_indices()
+        return [self.make_cycle(members, i+1)
+                for i, members in enumerate(self.compact.find_cycles(max_length))]
 
     def find_chains(self, max_length):
         if max_length==0:
             return []
-        chains = []
-        for altruist in self.altruists:
-            for edge in altruist.edges:
-                patient = edge.target_patient
-                for paired_donor in patient.paired_donors:
-                    pd_pair = PatientDonorPair(patient, paired_donor)
-                    self._chain(edge, max_length, [pd_pair], chains)
-        return chains
-
-    def _chain(self, altruist_edge, max_length, pd_pairs, chains):
-        chains.append(Chain(altruist_edge, pd_pairs[:], len(chains)+1))
-        if len(pd_pairs) < max_length:
-            for edge in pd_pairs[-1].donor.edges_out:
-                patient = edge.target_patient
-                if not patient.is_in(pd_pairs):
-                    for donor in patient.paired_donors:
-                        if not donor.is_in(pd_pairs):
-                            pd_pair = PatientDonorPair(patient, donor)
-                            pd_pairs.append(pd_pair)
-                            self._chain(altruist_edge, max_length, pd_pairs, chains)
-                            del pd_pairs[-1]
+        self.build_indices()
+        return [self.make_chain(members, i+1)
+                for i, members in enumerate(self.compact.find_chains(max_length))]
+
+    def iter_cycles(self, max_length):
+        self.build_indices()
+        for i, members in enumerate(self.compact.iter_cycles(max_length)):
+            yield self.make_cycle(members, i+1)
+
+    def iter_chains(self, max_length):
+        self.build_indices()
+        for i, members in enumerate(self.compact.iter_chains(max_length)):
+            yield self.make_chain(members, i+1)
+
+    def make_pd_pairs(self, members):
+        # param members: a sequence of alternating patient and donor numbers
+        #                in self.compact
+        pd_pairs = self.pd_pairs
+        num_donors = len(self.paired_donors)
+        return [pd_pairs[p * num_donors + d] for p, d in izip(members[0::2], members[1::2])]
+
+    def make_cycle(self, members, index):
+        "Create a Cycle from a cycle found by CompactPool.find_cycles"
+        return Cycle(self.make_pd_pairs(members), index)
+
+    def make_chain(self, members, index):
+        "Create a Chain from a chain found by CompactPool.find_chains"
+        ndd = self.compact.ndd_edge_ndds[members[0]]
+        altruist = self.altruists[ndd]
+        altruist_edge = altruist.edges[members[0] - self.compact.ndd_edge_offsets[ndd]]
+        return Chain(altruist_edge, self.make_pd_pairs(members[1:]), index)
 
 class Cycle(object):
     def __init__(self, pd_pairs, index):
@@ -112,11 +198,8 @@ class Chain(object):
         for i in range(1, len(self.pd_pairs)):
             if self.pd_pairs[i].patient.has_backarc_to(self.pd_pairs[i-1].patient):
                 n_backarcs_ += 1
-        final_patient = self.pd_pairs[-1].patient
-        for edge in self.altruist_edge.altruist.edges:
-            if edge.target_patient == final_patient:
-                n_backarcs_ += 1
-                break
+        if self.altruist_edge.altruist.has_edge_to(self.pd_pairs[-1].patient):
+            n_backarcs_ += 1
         return n_backarcs_
 
     def __str__(self):
@@ -142,6 +225,18 @@ class Altruist(object):
         self.dage = dage
         self.nhs_id = nhs_id
         self.mip_var = None
+        self.edges_by_target = None
+
+    def build_edge_index(self):
+        self.edges_by_target = _index_edges(self.edges)
+
+    def has_edge_to(self, patient):
+        if self.edges_by_target is not None:
+            return patient in self.edges_by_target
+        for edge in self.edges:
+            if patient == edge.target_patient:
+                return True
+        return False
 
     def __str__(self):
         return "altruist " + str(self.nhs_id)
@@ -158,6 +253,10 @@ class PairedDonor(object):
         self.edges_out = []
         self.dage = dage
         self.nhs_id = nhs_id
+        self.edges_by_target = None
+
+    def build_edge_index(self):
+        self.edges_by_target = _index_edges(self.edges_out)
 
     def is_in(self, pd_pairs):
         "Is this donor in the passed list of patient-donor pairs?"
@@ -170,6 +269,8 @@ class PairedDonor(object):
         return self.get_edge_to(patient) is not None
 
     def get_edge_to(self, patient):
+        if self.edges_by_target is not None:
+            return self.edges_by_target.get(patient)
         for edge in self.edges_out:
             if patient == edge.target_patient:
                 return edge
@@ -180,6 +281,13 @@ class Patient(object):
         self.paired_donors = []
         self.nhs_id = nhs_id
         self.index = index
+        self.backarc_targets = None
+
+    def build_backarc_index(self):
+        # The set of patients to which one of this patient's donors has an edge
+        self.backarc_targets = {edge.target_patient
+                                for paired_donor in self.paired_donors
+                                for edge in paired_donor.edges_out}
 
     def is_in(self, pd_pairs):
         "Is this patient in the passed list of patient-donor pairs?"
@@ -189,12 +297,21 @@ class Patient(object):
         return False
 
     def has_backarc_to(self, other_patient):
+        if self.backarc_targets is not None:
+            return other_patient in self.backarc_targets
         for paired_donor in self.paired_donors:
             for edge in paired_donor.edges_out:
                 if edge.target_patient == other_patient:
                     return True
         return False
 
+def _index_edges(edges):
+    # Returns a dict mapping each target patient to the first edge to that patient
+    edges_by_target = {}
+    for edge in reversed(edges):
+        edges_by_target[edge.target_patient] = edge
+    return edges_by_target
+
 PatientDonorPair = namedtuple('PatientDonorPair', ['patient', 'donor'])
 
 DonorPatientMatch = namedtuple('DonorPatientMatch', ['target_patient', 'score'])
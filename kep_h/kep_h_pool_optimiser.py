@@ -1,194 +1,968 @@
 import sys
 import random
-import optimality_criteria
+import multiprocessing
+import scoring
+import reductions
+import instrumentation
+from array import array
+from itertools import izip
+from compact_pool import StructureStore, ChainStore, StructureList, kept_ranges
+from compact_pool import insertion_positions
+from conflict_graph import ConflictGraph
+from dimacs_writer import write_dimacs
+from binary_instance import write_binary
+from mwis_solver import MWISSolver
+from mwis_heuristic import MWISHeuristic
 
 class OptimisationException(Exception):
     pass
 
+# The pool and criteria used by worker processes for parallel enumeration.
+# These are set by _init_worker, and are inherited rather than pickled
+# when the workers are forked.
+_worker_pool = None
+_worker_criteria = None
+
+def _init_worker(pool, opt_criteria):
+    global _worker_pool, _worker_criteria
+    _worker_pool = pool
+    _worker_criteria = opt_criteria
+
+def _score_structures(structures, factory, is_chain):
+    # Returns a ChainStore or StructureStore of the index tuples generated by
+    # structures, and their criterion score columns. These are cheaper to send
+    # back to the parent process than a list of tuples.
+    store = ChainStore() if is_chain else StructureStore()
+    for members in structures:
+        store.append(members)
+    return store, scoring.criterion_columns(_worker_criteria, _worker_pool.compact, store,
+                                            is_chain, factory)
+
+def _score_chains_from(args):
+    ndd_edge, max_length = args
+    return _score_structures(_worker_pool.compact.iter_chains_from(ndd_edge, max_length),
+                             _worker_pool.make_chain, True)
+
+def _score_cycles_from(args):
+    first_patient, max_length = args
+    return _score_structures(_worker_pool.compact.iter_cycles_from(first_patient, max_length),
+                             _worker_pool.make_cycle, False)
+
+def _solve_component(args):
+    graph, weights, time_limit, heuristic, report = args
+    if heuristic:
+        return MWISHeuristic(graph, weights, time_limit, report).solve()
+    return MWISSolver(graph, weights, time_limit).solve()
+
+def renumber_cycles(store, patient_map, donor_map):
+    """Return a copy of a store of cycle index tuples with each patient p
+    replaced by patient_map[p] and each donor d by donor_map[d]. Every cycle
+    has an even length, so patients are at the even positions of store.values."""
+    values = list(store.values)
+    values[0::2] = [patient_map[p] for p in values[0::2]]
+    values[1::2] = [donor_map[d] for d in values[1::2]]
+    result = StructureStore()
+    result.values = array('i', values)
+    result.offsets = array('l', store.offsets)
+    return result
+
+def renumber_chains(store, ndd_edge_map, patient_map, donor_map):
+    """As renumber_cycles, for a ChainStore or a StructureStore of chain index
+    tuples, whose first element is an NDD edge renumbered by ndd_edge_map. If
+    patient_map is None, only the NDD edges are renumbered."""
+    if isinstance(store, ChainStore):
+        result = ChainStore()
+        result.parents = array('i', store.parents)
+        if patient_map is None:
+            result.patients = array('i', store.patients)
+            result.donors = array('i', store.donors)
+        else:
+            result.patients = array('i', (patient_map[p] for p in store.patients))
+            result.donors = array('i', (donor_map[d] for d in store.donors))
+        result.roots = renumber_chains(store.roots, ndd_edge_map, patient_map, donor_map)
+        return result
+    values = list(store.values)
+    offsets = store.offsets
+    for i in xrange(len(offsets) - 1):
+        start = offsets[i]
+        end = offsets[i+1]
+        values[start] = ndd_edge_map[values[start]]
+        if patient_map is not None:
+            values[start+1:end:2] = [patient_map[p] for p in values[start+1:end:2]]
+            values[start+2:end:2] = [donor_map[d] for d in values[start+2:end:2]]
+    result = StructureStore()
+    result.values = array('i', values)
+    result.offsets = array('l', offsets)
+    return result
+
+def remap_node_lists(node_lists, index_map, num_indices, node_map):
+    """Given lists of node ids for each of some patients, donors or NDDs, return
+    the lists for each of num_indices new indices. Old list i becomes list
+    index_map[i], or is discarded if that is -1. Each node id v becomes
+    node_map[v], and is left out if that is -1."""
+    result = [[] for i in xrange(num_indices)]
+    for old_index, nodes in enumerate(node_lists):
+        new_index = index_map[old_index]
+        if new_index != -1:
+            mapped = [node_map[v] for v in nodes]
+            result[new_index] = [v for v in mapped if v != -1]
+    return result
+
+def _map_kept_nodes(node_map, old_base, num_old, dropped, new_base, positions):
+    # Set node_map for the old nodes old_base..old_base+num_old-1 that are not
+    # in dropped, a sorted list of offsets from old_base. The kept nodes keep
+    # their order from new_base on, and a new node is inserted before the kept
+    # node at each of positions.
+    rank = 0
+    j = 0
+    for start, end in kept_ranges(num_old, dropped):
+        for i in xrange(old_base + start, old_base + end):
+            while j < len(positions) and positions[j] <= rank:
+                j += 1
+            node_map[i] = new_base + rank + j
+            rank += 1
+
+def _imap_scored(workers, fun, args_list, jobs):
+    # Apply fun to each element of args_list in a worker process, and generate
+    # the (store, criterion score columns) results in order
+    chunksize = max(1, len(args_list) / (jobs * 8))
+    return workers.imap(fun, args_list, chunksize)
+
 class PoolOptimiser(object):
     EPSILON = 1e-7
 
-    def __init__(self, pool, opt_criteria, max_cycle, max_chain):
+    def __init__(self, pool, opt_criteria, max_cycle, max_chain, jobs=1, structures=None,
+                 stats=None):
+        # param jobs: the number of processes used to enumerate and score
+        #             cycles and chains, and to solve components
+        # param structures: if not None, the (chains, cycles) StructureStores
+        #                   of the pool for these length limits, such as those
+        #                   from a StructureCache, which are used instead of
+        #                   enumerating them
+        # param stats: if not None, an instrumentation.Stats in which the time
+        #              and memory of each stage, and counts of structures and
+        #              nodes, are recorded
         self.opt_criteria = opt_criteria
+        self.stats = instrumentation.NullStats() if stats is None else stats
+        self.jobs = jobs
         self.pool = pool
-        self.cycles = pool.find_cycles(max_cycle)
-        self.chains = pool.find_chains(max_chain)
-
-    def add_clique(self, adj_mat, node_ids):
-        for i in range(len(node_ids) - 1):
-            for j in range(i+1, len(node_ids)):
-                x = node_ids[i]
-                y = node_ids[j]
-                adj_mat[x][y] = True
-                adj_mat[y][x] = True
+        self.max_cycle = max_cycle
+        self.max_chain = max_chain
+        if pool.compact is None:
+            pool.build_indices()
+        compact = pool.compact
+
+        # We'll use "node" to denote a vertex in our MWIS instance. Chains are
+        # numbered first, then cycles, then one node per NDD for leaving the
+        # NDD unused. Cycles and chains are streamed from the enumerators, and
+        # only their memberships and index tuples in pool.compact are kept.
+        # Their scores are computed a whole column at a time. self.cycles and
+        # self.chains create Cycle and Chain objects on demand.
+        self.reset_nodes()
+
+        stats = self.stats
+        if structures is not None:
+            chains, cycles = structures
+            with stats.stage("cached chains"):
+                for members in chains:
+                    self.add_chain(members)
+            with stats.stage("chain scores"):
+                self.record_criterion_columns(scoring.criterion_columns(
+                        opt_criteria, compact, self.chain_members, True, pool.make_chain))
+            with stats.stage("cached cycles"):
+                for members in cycles:
+                    self.add_cycle(members)
+            with stats.stage("cycle scores"):
+                self.record_criterion_columns(scoring.criterion_columns(
+                        opt_criteria, compact, self.cycle_members, False, pool.make_cycle))
+        elif jobs > 1:
+            # Work is split by NDD edge and by first patient. imap returns the
+            # results in order, so nodes are numbered as in a serial run.
+            # Each stage includes the scoring done by the workers.
+            workers = multiprocessing.Pool(jobs, _init_worker, (pool, opt_criteria))
+            try:
+                with stats.stage("find chains"):
+                    for store, columns in _imap_scored(
+                            workers, _score_chains_from,
+                            [(k, max_chain) for k in xrange(len(compact.ndd_edge_targets))],
+                            jobs):
+                        for members in store:
+                            self.add_chain(members)
+                        self.record_criterion_columns(columns)
+                with stats.stage("find cycles"):
+                    for store, columns in _imap_scored(
+                            workers, _score_cycles_from,
+                            [(p, max_cycle) for p in xrange(compact.num_patients)], jobs):
+                        for members in store:
+                            self.add_cycle(members)
+                        self.record_criterion_columns(columns)
+                workers.close()
+            except:
+                workers.terminate()
+                raise
+            finally:
+                workers.join()
+        else:
+            with stats.stage("find chains"):
+                for members in compact.iter_chains(max_chain):
+                    self.add_chain(members)
+            with stats.stage("chain scores"):
+                self.record_criterion_columns(scoring.criterion_columns(
+                        opt_criteria, compact, self.chain_members, True, pool.make_chain))
+            with stats.stage("find cycles"):
+                for members in compact.iter_cycles(max_cycle):
+                    self.add_cycle(members)
+            with stats.stage("cycle scores"):
+                self.record_criterion_columns(scoring.criterion_columns(
+                        opt_criteria, compact, self.cycle_members, False, pool.make_cycle))
+
+        instrumentation.count_lengths(stats, "chains", self.chain_members, True)
+        instrumentation.count_lengths(stats, "cycles", self.cycle_members, False)
+        self.add_altruist_nodes()
+
+    def reset_nodes(self):
+        # Remove all nodes, ready for chains, then cycles, then NDDs to be added
+        compact = self.pool.compact
+        self.patient_to_nodes = [[] for i in xrange(compact.num_patients)]
+        self.paired_donor_to_nodes = [[] for i in xrange(compact.num_donors)]
+        self.ndd_to_nodes = [[] for i in xrange(compact.num_ndds)]
+
+        # criterion_scores[k][node_id] is the score of a node under opt_criteria[k]
+        self.criterion_scores = [[] for oc in self.opt_criteria]
+
+        self.chain_members = ChainStore()
+        self.cycle_members = StructureStore()
+
+    def add_altruist_nodes(self):
+        # Add a node for leaving each NDD unused, once all chains and cycles are added
+        pool = self.pool
+        for i, ndd in enumerate(pool.altruists):
+            node_id = len(self.chain_members) + len(self.cycle_members) + i
+            self.ndd_to_nodes[i].append(node_id)
+            self.record_criterion_scores(self.calc_criterion_scores(ndd, scoring.altruist_val))
+
+        # The conflict graph, built on demand
+        self.graph = None
+        self.index_nodes()
+
+    def index_nodes(self):
+        # Set up access to the current nodes, once all of them are added
+        pool = self.pool
+        self.num_nodes = len(self.chain_members) + len(self.cycle_members) + len(pool.altruists)
+
+        self.cycles = StructureList(self.cycle_members, pool.make_cycle)
+        self.chains = StructureList(self.chain_members, pool.make_chain)
+
+        # The score column of each criterion class that has been computed for
+        # the current nodes
+        self.column_memo = {type(oc): column
+                            for oc, column in zip(self.opt_criteria, self.criterion_scores)}
+
+    def add_chain(self, members):
+        # Add a node for a chain, given its index tuple. All chains must be
+        # added before any cycles, and the caller records the chain's scores.
+        node_id = len(self.chain_members)
+        self.chain_members.append(members)
+        for i in range(1, len(members), 2):
+            self.patient_to_nodes[members[i]].append(node_id)
+            self.paired_donor_to_nodes[members[i+1]].append(node_id)
+        self.ndd_to_nodes[self.pool.compact.ndd_edge_ndds[members[0]]].append(node_id)
+
+    def add_cycle(self, members):
+        # Add a node for a cycle, given its index tuple. The caller records the
+        # cycle's scores.
+        node_id = len(self.chain_members) + len(self.cycle_members)
+        self.cycle_members.append(members)
+        for i in range(0, len(members), 2):
+            self.patient_to_nodes[members[i]].append(node_id)
+            self.paired_donor_to_nodes[members[i+1]].append(node_id)
+
+    # Incremental updates. Each of these methods changes the pool, and updates
+    # the nodes to match, as if a new PoolOptimiser had been created for the
+    # changed pool. Only the cycles and chains containing a new arc, pairing or
+    # NDD edge are enumerated, and only those whose backarcs might have changed
+    # are rescored. The rest keep their scores, and their index tuples are
+    # renumbered if patients, donors or NDD edges have been removed. Nodes are
+    # numbered as a new PoolOptimiser would number them, and a conflict graph
+    # that has been built is updated rather than discarded.
+    #
+    # Changes to arcs and NDDs patch pool.compact in place, using the Pool
+    # methods for them. Changes to patients and pairings rebuild it, since
+    # they renumber the patients or donors, and every lookup key in it is
+    # built from those numbers.
+
+    def add_arc(self, donor, patient, score):
+        if donor.has_edge_to(patient):
+            raise OptimisationException("Donor {} already has an arc to patient {}".format(
+                    donor.nhs_id, patient.nhs_id))
+        def find_new(patient_ids, donor_ids, ndd_edge_ids):
+            compact = self.pool.compact
+            d = donor_ids[donor]
+            p = patient_ids[patient]
+            chains, cycles = [], []
+            for q in donor.paired_patients:
+                chains.extend(compact.iter_chains_through_arc(
+                        patient_ids[q], d, p, self.max_chain))
+                cycles.extend(compact.iter_cycles_through_arc(
+                        patient_ids[q], d, p, self.max_cycle))
+            return chains, cycles
+        self.update(lambda: self.pool.add_arc(donor, patient, score), set(),
+                    self.nodes_with_patients(donor.paired_patients, [patient]), find_new,
+                    reindex=False)
+
+    def remove_arc(self, donor, patient):
+        d = self.donor_ids()[donor]
+        p = self.patient_ids()[patient]
+        dropped = {node_id for node_id in self.paired_donor_to_nodes[d]
+                   if self.uses_arc(node_id, d, p)}
+        self.update(lambda: self.pool.remove_arc(donor, patient), dropped,
+                    self.nodes_with_patients(donor.paired_patients, [patient]), reindex=False)
+
+    def add_altruist_edge(self, altruist, patient, score):
+        if altruist.has_edge_to(patient):
+            raise OptimisationException("NDD {} already has an arc to patient {}".format(
+                    altruist.nhs_id, patient.nhs_id))
+        def find_new(patient_ids, donor_ids, ndd_edge_ids):
+            return (list(self.pool.compact.iter_chains_from(ndd_edge_ids[altruist.edges[-1]],
+                                                            self.max_chain)),
+                    [])
+        self.update(lambda: self.pool.add_altruist_edge(altruist, patient, score), set(),
+                    self.nodes_with_altruist_and_patient(altruist, patient), find_new,
+                    reindex=False)
+
+    def remove_altruist_edge(self, altruist, patient):
+        ndd_edge_ids = self.ndd_edge_ids()
+        edges = [edge for edge in altruist.edges if edge.target_patient is patient]
+        ks = {ndd_edge_ids[edge] for edge in edges}
+        dropped = {node_id for node_id in self.ndd_to_nodes[self.altruist_ids()[altruist]]
+                   if node_id < len(self.chain_members) and
+                      self.chain_members[node_id][0] in ks}
+        self.update(lambda: self.pool.remove_altruist_edge(altruist, patient), dropped,
+                    self.nodes_with_altruist_and_patient(altruist, patient), reindex=False)
+
+    def add_patient(self, patient):
+        "Add a patient with no paired donors or arcs"
+        if patient.paired_donors:
+            raise OptimisationException("A new patient must not have paired donors")
+        self.update(lambda: self.pool.patients.append(patient), set(), set())
+
+    def remove_patient(self, patient):
+        "Remove a patient, with its pairings and the arcs to it"
+        pool = self.pool
+        dropped = set(self.patient_to_nodes[self.patient_ids()[patient]])
+        def mutate():
+            pool.patients.remove(patient)
+            for donor in patient.paired_donors:
+                donor.paired_patients.remove(patient)
+            patient.paired_donors = []
+            for donor in pool.paired_donors:
+                donor.edges_out = [edge for edge in donor.edges_out
+                                   if edge.target_patient is not patient]
+            for altruist in pool.altruists:
+                altruist.edges = [edge for edge in altruist.edges
+                                  if edge.target_patient is not patient]
+        self.update(mutate, dropped, set())
+
+    def add_paired_donor(self, donor, patient):
+        """Pair donor with patient. The donor is added to the pool if it is not
+        already there, with its arcs in donor.edges_out."""
+        pool = self.pool
+        def mutate():
+            if donor not in self.donor_ids():
+                pool.paired_donors.append(donor)
+            pool.associate_patient_with_donor(patient, donor)
+        def find_new(patient_ids, donor_ids, ndd_edge_ids):
+            compact = pool.compact
+            p = patient_ids[patient]
+            d = donor_ids[donor]
+            return (list(compact.iter_chains_through_pair(p, d, self.max_chain)),
+                    list(compact.iter_cycles_through_pair(p, d, self.max_cycle)))
+        targets = [edge.target_patient for edge in donor.edges_out]
+        self.update(mutate, set(), self.nodes_with_patients([patient], targets), find_new)
+
+    def remove_paired_donor(self, donor):
+        "Remove a paired donor, with its pairings and its arcs"
+        dropped = set(self.paired_donor_to_nodes[self.donor_ids()[donor]])
+        patients = list(donor.paired_patients)
+        def mutate():
+            self.pool.paired_donors.remove(donor)
+            for patient in patients:
+                patient.paired_donors.remove(donor)
+            donor.paired_patients = []
+        targets = [edge.target_patient for edge in donor.edges_out]
+        self.update(mutate, dropped, self.nodes_with_patients(patients, targets))
+
+    def add_altruist(self, altruist):
+        "Add an NDD, with its arcs in altruist.edges"
+        def find_new(patient_ids, donor_ids, ndd_edge_ids):
+            compact = self.pool.compact
+            chains = []
+            for edge in altruist.edges:
+                chains.extend(compact.iter_chains_from(ndd_edge_ids[edge], self.max_chain))
+            return chains, []
+        self.update(lambda: self.pool.add_altruist(altruist), set(), set(), find_new,
+                    reindex=False)
+
+    def remove_altruist(self, altruist):
+        dropped = set(self.ndd_to_nodes[self.altruist_ids()[altruist]])
+        self.update(lambda: self.pool.remove_altruist(altruist), dropped, set(),
+                    reindex=False)
+
+    # Each of these maps the pool's objects to their numbers in pool.compact,
+    # and is kept up to date by the pool
+
+    def patient_ids(self):
+        return self.pool.patient_numbers
+
+    def donor_ids(self):
+        return self.pool.donor_numbers
+
+    def altruist_ids(self):
+        return self.pool.altruist_numbers
+
+    def ndd_edge_ids(self):
+        "Maps each AltruistEdge to its number in pool.compact"
+        return {edge: k for k, edge in enumerate(edge for altruist in self.pool.altruists
+                                                      for edge in altruist.edges)}
+
+    def nodes_with_patients(self, patients_a, patients_b):
+        "The cycles and chains that contain a patient in each of patients_a and patients_b"
+        patient_ids = self.patient_ids()
+        nodes_a = {node_id for patient in patients_a
+                           for node_id in self.patient_to_nodes[patient_ids[patient]]}
+        return {node_id for patient in patients_b if patient in patient_ids
+                        for node_id in self.patient_to_nodes[patient_ids[patient]]
+                        if node_id in nodes_a}
+
+    def nodes_with_altruist_and_patient(self, altruist, patient):
+        "The chains starting from altruist that contain patient"
+        ndd_nodes = set(self.ndd_to_nodes[self.altruist_ids()[altruist]])
+        return {node_id for node_id in self.patient_to_nodes[self.patient_ids()[patient]]
+                if node_id in ndd_nodes}
+
+    def uses_arc(self, node_id, donor, patient):
+        "Does the cycle or chain node_id include the arc from donor to patient?"
+        if node_id < len(self.chain_members):
+            members = self.chain_members[node_id][1:]
+            is_chain = True
+        else:
+            members = self.cycle_members[node_id - len(self.chain_members)]
+            is_chain = False
+        for i in xrange(1, len(members), 2):
+            if members[i] == donor:
+                if i + 1 < len(members):
+                    return members[i+1] == patient
+                return not is_chain and members[0] == patient
+        return False
+
+    def update(self, mutate, dropped, rescored, find_new=None, reindex=True):
+        """Change the pool by calling mutate, and update the nodes.
+
+        dropped and rescored are sets of ids of nodes that must be removed, and
+        that must be scored again. If find_new is not None, it is called with
+        dicts mapping patients, donors and NDD edges to their numbers in the
+        changed pool, and returns lists of the index tuples of the new chains
+        and cycles. If reindex is False, mutate must keep the pool's indices
+        up to date itself."""
+        pool = self.pool
+        old_patients = list(pool.patients)
+        old_donors = list(pool.paired_donors)
+        old_ndds = list(pool.altruists)
+        old_ndd_edges = [edge for altruist in pool.altruists for edge in altruist.edges]
+        num_old_chains = len(self.chain_members)
+        num_old_cycles = len(self.cycle_members)
+        old_num_nodes = self.num_nodes
+
+        mutate()
+        if reindex:
+            pool.build_indices()
+        compact = pool.compact
+        patient_ids = self.patient_ids()
+        donor_ids = self.donor_ids()
+        ndd_edge_ids = self.ndd_edge_ids()
+        ndd_ids = self.altruist_ids()
+        if find_new is None:
+            new_chains, new_cycles = [], []
+        else:
+            new_chains, new_cycles = find_new(patient_ids, donor_ids, ndd_edge_ids)
+
+        # The new number of each old patient, donor, NDD edge and NDD, or -1 if
+        # removed
+        patient_map = [patient_ids.get(patient, -1) for patient in old_patients]
+        donor_map = [donor_ids.get(donor, -1) for donor in old_donors]
+        ndd_edge_map = [ndd_edge_ids.get(edge, -1) for edge in old_ndd_edges]
+        ndd_map = [ndd_ids.get(ndd, -1) for ndd in old_ndds]
+        renumber_pairs = (patient_map != range(len(patient_map)) or
+                          donor_map != range(len(donor_map)))
+        renumber_ndd_edges = ndd_edge_map != range(len(ndd_edge_map))
+
+        # The surviving chains and cycles are copied in bulk, and keep their
+        # order. The new ones are inserted where enumeration would find them.
+        dropped = sorted(dropped)
+        dropped_chains = [i for i in dropped if i < num_old_chains]
+        dropped_cycles = [i - num_old_chains for i in dropped
+                          if num_old_chains <= i < num_old_chains + num_old_cycles]
+        chains = self.chain_members.without(dropped_chains)
+        cycles = self.cycle_members.without(dropped_cycles)
+        if renumber_pairs or renumber_ndd_edges:
+            chains = renumber_chains(chains, ndd_edge_map,
+                                     patient_map if renumber_pairs else None, donor_map)
+        if renumber_pairs:
+            cycles = renumber_cycles(cycles, patient_map, donor_map)
+        new_chains = sorted(new_chains, key=compact.chain_key)
+        new_cycles = sorted(new_cycles, key=compact.cycle_key)
+        chain_positions = insertion_positions(chains, new_chains, compact.chain_key)
+        cycle_positions = insertion_positions(cycles, new_cycles, compact.cycle_key)
+        self.chain_members = chains.inserted(chain_positions, new_chains)
+        self.cycle_members = cycles.inserted(cycle_positions, new_cycles)
+        num_chains = len(self.chain_members)
+        num_structures = num_chains + len(self.cycle_members)
+
+        # The new id of each old node, or -1 if dropped, and the ids of the new
+        # chains, cycles and NDD nodes
+        node_map = array('l', [-1]) * old_num_nodes
+        _map_kept_nodes(node_map, 0, num_old_chains, dropped_chains, 0, chain_positions)
+        _map_kept_nodes(node_map, num_old_chains, num_old_cycles, dropped_cycles, num_chains,
+                        cycle_positions)
+        for i, j in enumerate(ndd_map):
+            if j != -1:
+                node_map[num_old_chains + num_old_cycles + i] = num_structures + j
+        new_chain_ids = [position + j for j, position in enumerate(chain_positions)]
+        new_cycle_ids = [num_chains + position + j for j, position in enumerate(cycle_positions)]
+        new_ndds = sorted(set(xrange(compact.num_ndds)).difference(ndd_map))
+
+        old_scores = self.criterion_scores
+        self.criterion_scores = [[None] * (num_structures + compact.num_ndds)
+                                 for oc in self.opt_criteria]
+        for old_column, column in zip(old_scores, self.criterion_scores):
+            for v, score in enumerate(old_column):
+                if node_map[v] != -1:
+                    column[node_map[v]] = score
+        rescored = [node_map[v] for v in rescored if node_map[v] != -1]
+        self.record_scores_of([v for v in rescored if v < num_chains] + new_chain_ids, True)
+        self.record_scores_of([v for v in rescored if v >= num_chains] + new_cycle_ids, False)
+        for i in new_ndds:
+            scores = self.calc_criterion_scores(pool.altruists[i], scoring.altruist_val)
+            for column, score in zip(self.criterion_scores, scores):
+                column[num_structures + i] = score
+
+        # The old node lists are carried over through node_map, and each list
+        # that gains a node is sorted again
+        self.patient_to_nodes = remap_node_lists(self.patient_to_nodes, patient_map,
+                                                 compact.num_patients, node_map)
+        self.paired_donor_to_nodes = remap_node_lists(self.paired_donor_to_nodes, donor_map,
+                                                      compact.num_donors, node_map)
+        self.ndd_to_nodes = remap_node_lists(self.ndd_to_nodes, ndd_map, compact.num_ndds,
+                                             node_map)
+        changed = {}
+        for node_id, members in izip(new_chain_ids, new_chains):
+            self.record_memberships(changed, node_id, members[1:],
+                                    compact.ndd_edge_ndds[members[0]])
+        for node_id, members in izip(new_cycle_ids, new_cycles):
+            self.record_memberships(changed, node_id, members, None)
+        for i in new_ndds:
+            self.ndd_to_nodes[i].append(num_structures + i)
+            changed[id(self.ndd_to_nodes[i])] = self.ndd_to_nodes[i]
+        for node_ids in changed.itervalues():
+            node_ids.sort()
+
+        # The conflict graph keeps the edges between the nodes that remain.
+        # Every new edge joins a new node to another in one of its lists.
+        old_graph = self.graph
+        self.index_nodes()
+        if old_graph is not None:
+            self.graph = old_graph.relabel(node_map, self.num_nodes)
+            self.graph.join_new_nodes(
+                    new_chain_ids + new_cycle_ids + [num_structures + i for i in new_ndds],
+                    changed.values())
+
+    def record_scores_of(self, node_ids, is_chain):
+        # Score the chains, or the cycles, with the given node ids
+        pool = self.pool
+        store = self.chain_members if is_chain else self.cycle_members
+        base = 0 if is_chain else len(self.chain_members)
+        to_score = StructureStore()
+        for node_id in node_ids:
+            to_score.append(store[node_id - base])
+        columns = scoring.criterion_columns(self.opt_criteria, pool.compact, to_score, is_chain,
+                                            pool.make_chain if is_chain else pool.make_cycle)
+        for column, new_column in zip(self.criterion_scores, columns):
+            for node_id, score in izip(node_ids, new_column):
+                column[node_id] = score
+
+    def record_memberships(self, changed, node_id, pairs, ndd):
+        # Add a new node to the lists of the patients and donors of pairs, a
+        # sequence of alternating patient and donor numbers, and of ndd if it is
+        # not None. Each list changed is recorded in the dict changed by id.
+        lists = []
+        for i in xrange(0, len(pairs), 2):
+            lists.append(self.patient_to_nodes[pairs[i]])
+            lists.append(self.paired_donor_to_nodes[pairs[i+1]])
+        if ndd is not None:
+            lists.append(self.ndd_to_nodes[ndd])
+        for node_ids in lists:
+            node_ids.append(node_id)
+            changed[id(node_ids)] = node_ids
+
+    def add_clique(self, graph, node_ids):
+        graph.add_clique(node_ids)
+
+    def criterion_columns_for(self, opt_criteria):
+        """Returns the score column of every node under each of opt_criteria.
+        Columns are memoised by criterion class, and those not yet known are
+        computed together, so a set of criteria shares one pass over the
+        structures."""
+        pool = self.pool
+        missing = []
+        for oc in opt_criteria:
+            if type(oc) not in self.column_memo and type(oc) not in map(type, missing):
+                missing.append(oc)
+        if missing:
+            chain_columns = scoring.criterion_columns(missing, pool.compact, self.chain_members,
+                                                      True, pool.make_chain)
+            cycle_columns = scoring.criterion_columns(missing, pool.compact, self.cycle_members,
+                                                      False, pool.make_cycle)
+            altruist_rows = [scoring.criterion_scores(missing, ndd, scoring.altruist_val)
+                             for ndd in pool.altruists]
+            altruist_columns = zip(*altruist_rows) if altruist_rows else [[]] * len(missing)
+            for oc, chain_column, cycle_column, altruist_column in zip(
+                    missing, chain_columns, cycle_columns, altruist_columns):
+                self.column_memo[type(oc)] = (list(chain_column) + list(cycle_column) +
+                                              list(altruist_column))
+        return [self.column_memo[type(oc)] for oc in opt_criteria]
+
+    def conflict_graph(self):
+        """The conflict graph of all nodes, before any reduction or reordering.
+        This is built once for the current nodes, and must not be modified."""
+        if self.graph is None:
+            self.graph = ConflictGraph(self.num_nodes)
+            for node_lists in [self.patient_to_nodes, self.paired_donor_to_nodes,
+                               self.ndd_to_nodes]:
+                for node_ids in node_lists:
+                    self.add_clique(self.graph, node_ids)
+        return self.graph
+
+    def calc_criterion_scores(self, item, score_accessor):
+        return scoring.criterion_scores(self.opt_criteria, item, score_accessor)
+
+    def record_criterion_scores(self, scores):
+        # Append one node's score under each criterion
+        for column, score in zip(self.criterion_scores, scores):
+            column.append(score)
+
+    def record_criterion_columns(self, columns):
+        # Append the scores of a run of nodes, given as one list per criterion
+        for column, scores in zip(self.criterion_scores, columns):
+            column.extend(scores)
 
     def calc_hier_score(self, item, bit_shifts, score_accessor):
-        val = 0
-        for oc, bit_shift in zip(self.opt_criteria, bit_shifts):
-            assert oc.sense == 'MAX'
-            if isinstance(oc, optimality_criteria.MaxWeight):
-                val += int(round(score_accessor(oc, item) * 100000))
-            else:
-                val += int(score_accessor(oc, item))
-            val <<= bit_shift
-        return val
-
-    def are_adj_mat_rows_almost_equal(self, row1, row2, i, j):
-        # Returns True iff row1 and row2 are equal except in positions i and j
-        for k in range(len(row1)):
-            if k != i and k != j and row1[k] != row2[k]:
-                return False
-        return True
-
-    def reduce_instance(self, adj_mat, hier_scores, descriptions):
-        assert len(adj_mat) == len(hier_scores)
-
-        # For each node that is "almost equal" to another node, this gives the equivalence class.
-        # i and j are "almost equal" if they are connected by an edge, and if
-        # their neighbourhoods with i and j excluded are equal
-        node_to_equiv_class = {}
-
-        for i in range(len(adj_mat)-1):
-            # TODO: I don't think we need the j loop if i is in node_to_equiv_class
-            for j in range(i+1, len(adj_mat)):
-                if adj_mat[i][j] and self.are_adj_mat_rows_almost_equal(adj_mat[i], adj_mat[j], i, j):
-                    if i in node_to_equiv_class:
-                        equiv_class = node_to_equiv_class[i]
-                    else:
-                        assert j not in node_to_equiv_class
-                        equiv_class = NodeEquivClass()
-                        equiv_class.add_node(i, hier_scores[i])
-                        node_to_equiv_class[i] = equiv_class
-                        node_to_equiv_class[j] = equiv_class
-                    equiv_class.add_node(j, hier_scores[j])
-
-        nodes_to_keep = []
-        for i in range(len(adj_mat)):
-            if i not in node_to_equiv_class or node_to_equiv_class[i].best_node_id == i:
-                nodes_to_keep.append(i)
-
-        reduced_hier_scores = [hier_scores[i] for i in nodes_to_keep]
-        reduced_adj_mat = [[adj_mat[i][j] for j in nodes_to_keep] for i in nodes_to_keep]
-        reduced_descriptions = [descriptions[i] for i in nodes_to_keep]
-
-        return len(nodes_to_keep), reduced_hier_scores, reduced_adj_mat, reduced_descriptions
-
-    def solve(self, invert_edges, reduce_nodes, node_order, bit_shifts):
-        # param node_order: 0=default, 1=random, 2=score ascending, 3=score descending
-        #                   4=degree asc., 5=degree desc.
-        
-        print "c Node order {}".format(node_order)
-        print "c Bit shifts {}".format(":".join(str(s) for s in bit_shifts[:-1]))
-        print "c Reduce number of nodes? {}".format(reduce_nodes)
+        scores = self.calc_criterion_scores(item, score_accessor)
+        return scoring.pack_hier_scores([[score] for score in scores], bit_shifts)[0]
 
+    def describe_pd_pairs(self, members):
         patients = self.pool.patients
         paired_donors = self.pool.paired_donors
-        altruists = self.pool.altruists
-
-#        for c in self.cycles:
-#            print c.index, "   ", " ".join(str(pdp.patient.index) for pdp in c.pd_pairs)
-
-        chain_node_ids = range(len(self.chains))
-        cycle_node_ids = [len(chain_node_ids) + i for i in range(len(self.cycles))]
-        unused_ndd_node_ids = [len(chain_node_ids) + len(cycle_node_ids) + i for i in range(len(altruists))]
-        num_nodes = len(chain_node_ids) + len(cycle_node_ids) + len(unused_ndd_node_ids)
-        #print chain_node_ids
-        #print cycle_node_ids
-        #print unused_ndd_node_ids
-
-        # We'll use "node" to denote a vertex in our MWIS instance
-        # Nodes have zero-based indices, but we'll print them out using 1-based indexing
-        patient_to_nodes = {patient: [] for patient in patients}
-        paired_donor_to_node = {donor: [] for donor in paired_donors}
-        ndd_to_node = {ndd: [] for ndd in altruists}
-
-        # Each element of hier_scores will be the full hierarchy of scores for a node, compressed
-        # into a single int
-        hier_scores = [0] * num_nodes
+        return " ".join("({},{})".format(patients[members[i]].nhs_id,
+                                         paired_donors[members[i+1]].nhs_id)
+                        for i in range(0, len(members), 2))
 
-        descriptions = [] # A description of each node, for printing in the comments
-
-        for c, node_id in zip(self.chains, chain_node_ids):
-            for pd_pair in c.pd_pairs:
-                patient_to_nodes[pd_pair.patient].append(node_id)
-                paired_donor_to_node[pd_pair.donor].append(node_id)
-            ndd_to_node[c.altruist_edge.altruist].append(node_id)
-            hier_scores[node_id] = self.calc_hier_score(
-                    c, bit_shifts, lambda oc, c: oc.chain_val(c))
+    def node_descriptions(self):
+        # A description of each node, for printing in the comments
+        compact = self.pool.compact
+        altruists = self.pool.altruists
+        descriptions = []
+        for members in self.chain_members:
             descriptions.append("{} {}".format(
-                    c.altruist_edge.altruist.nhs_id,
-                    " ".join("({},{})".format(pd_pair.patient.nhs_id, pd_pair.donor.nhs_id)
-                                              for pd_pair in c.pd_pairs)))
-
-        for c, node_id in zip(self.cycles, cycle_node_ids):
-            for pd_pair in c.pd_pairs:
-                patient_to_nodes[pd_pair.patient].append(node_id)
-                paired_donor_to_node[pd_pair.donor].append(node_id)
-            hier_scores[node_id] = self.calc_hier_score(
-                    c, bit_shifts, lambda oc, c: oc.cycle_val(c))
-            descriptions.append(" ".join("({},{})".format(
-                    pd_pair.patient.nhs_id, pd_pair.donor.nhs_id) for pd_pair in c.pd_pairs))
-
-        for ndd, node_id in zip(altruists, unused_ndd_node_ids):
-            ndd_to_node[ndd].append(node_id)
-            hier_scores[node_id] = self.calc_hier_score(
-                    ndd, bit_shifts, lambda oc, ndd: oc.altruist_val(ndd))
+                    altruists[compact.ndd_edge_ndds[members[0]]].nhs_id,
+                    self.describe_pd_pairs(members[1:])))
+        for members in self.cycle_members:
+            descriptions.append(self.describe_pd_pairs(members))
+        for ndd in altruists:
             descriptions.append(str(ndd.nhs_id))
-
-        adj_mat = [[False]*num_nodes for i in range(num_nodes)]
-        
-        for d in [patient_to_nodes, paired_donor_to_node, ndd_to_node]:
-            for key, val in d.iteritems():
-                self.add_clique(adj_mat, val)
+        return descriptions
+
+    def reduce_instance(self, graph, hier_scores, node_ids):
+        # Removes some nodes that can't be part of a solution from graph, in
+        # place, and returns the list of remaining nodes out of node_ids.
+        # Nodes i and j are "almost equal" if they are connected by an edge,
+        # and if their neighbourhoods with i and j excluded are equal; that is,
+        # if they have the same closed neighbourhood. Only the best-scoring node
+        # of each class of almost-equal nodes is kept.
+        nodes_to_remove = set()
+        for node_class in graph.twin_classes(node_ids):
+            equiv_class = NodeEquivClass()
+            for i in node_class:
+                equiv_class.add_node(i, hier_scores[i])
+            nodes_to_remove.update(i for i in node_class if i != equiv_class.best_node_id)
+
+        for i in nodes_to_remove:
+            graph.remove_node(i)
+
+        return [i for i in node_ids if i not in nodes_to_remove]
+
+    def solve(self, invert_edges, reduce_nodes, node_order, bit_shifts, out=sys.stdout,
+              output_format="dimacs", reduction_list=None, time_limit=None,
+              split_components=False, component_out=None, opt_criteria=None):
+        # param out: the file to which the instance or solution is written
+        # param output_format: "dimacs" for DIMACS text, "binary" for the format
+        #                      in binary_instance (in which case out must be opened
+        #                      in binary mode), "solution" to solve the instance
+        #                      with mwis_solver and write the chosen cycles and chains,
+        #                      or "heuristic" to do the same with mwis_heuristic
+        # param time_limit: for "solution" or "heuristic", the solver's time limit in
+        #                   seconds for each component
+        # param split_components: if True, each connected component of the conflict
+        #                         graph is solved or written as a separate instance
+        # param component_out: for "dimacs" or "binary" with split_components, a
+        #                      function that takes a zero-based component number and
+        #                      returns the file to which the component's instance is
+        #                      written. solve closes these files, and out is unused.
+        # param opt_criteria: as for build_instance
+
+        comments = []
+        graph, hier_scores, descriptions = self.build_instance(
+                reduce_nodes, node_order, bit_shifts, comments, reduction_list, opt_criteria)
+
+        if output_format not in ["dimacs", "binary", "solution", "heuristic"]:
+            raise OptimisationException(
+                    "Unrecognised output format: {}".format(output_format))
+
+        if split_components:
+            with self.stats.stage("components"):
+                components = graph.components()
+            comments.append("Components {}".format(len(components)))
+            self.stats.count("components", len(components))
+        else:
+            components = [range(len(graph))]
+
+        if output_format in ["solution", "heuristic"]:
+            heuristic = output_format == "heuristic"
+            with self.stats.stage("solve"):
+                nodes, weight, optimal = self.solve_components(
+                        graph, hier_scores, components, time_limit, heuristic)
+            if heuristic:
+                status = "heuristic"
+            else:
+                status = "optimal" if optimal else "time limit reached"
+            sys.stderr.write("Score {} ({}) from {} components\n".format(
+                    weight + self.reduction_log.weight_offset, status, len(components)))
+            self.write_solution(out, self.expand_solution(nodes))
+        elif not split_components:
+            with self.stats.stage("write instance"):
+                self.write_instance(out, output_format, comments, graph, hier_scores,
+                                    descriptions, invert_edges)
+        else:
+            if component_out is None:
+                raise OptimisationException(
+                        "A file must be given for each component")
+            with self.stats.stage("write instance"):
+                for k, nodes in enumerate(components):
+                    component_comments = comments + ["Component {} of {}".format(
+                            k+1, len(components))]
+                    out = component_out(k)
+                    try:
+                        self.write_instance(out, output_format, component_comments,
+                                            graph.subgraph(nodes),
+                                            [hier_scores[i] for i in nodes],
+                                            [descriptions[i] for i in nodes], invert_edges)
+                    finally:
+                        out.close()
+
+    def sweep(self, configs, invert_edges, reduce_nodes, config_out, output_format="dimacs",
+              reduction_list=None, time_limit=None):
+        """Solve or write an instance for each of configs, which are objects with
+        criteria, bit_shifts and node_order attributes, such as sweep.SweepConfig.
+        The structures are enumerated and the conflict graph is built only once,
+        and each criterion's scores are computed once, so each further config
+        costs only the packing of scores and the output.
+        config_out is a function that takes a zero-based config number and
+        returns the file to which that config's output is written. sweep
+        closes these files."""
+        for k, config in enumerate(configs):
+            out = config_out(k)
+            try:
+                self.solve(invert_edges, reduce_nodes, config.node_order, config.bit_shifts,
+                           out, output_format, reduction_list, time_limit,
+                           opt_criteria=config.criteria)
+            finally:
+                out.close()
+
+    def write_instance(self, out, output_format, comments, graph, hier_scores, descriptions,
+                       invert_edges):
+        if output_format == "dimacs":
+            for comment in comments:
+                out.write("c {}\n".format(comment))
+            write_dimacs(out, graph, hier_scores, descriptions, invert_edges)
+        else:
+            write_binary(out, graph, hier_scores, descriptions, invert_edges)
+
+    def report_score(self, seconds, weight):
+        sys.stderr.write("Best score {} after {:.3f} s\n".format(
+                weight + self.reduction_log.weight_offset, seconds))
+
+    def solve_components(self, graph, hier_scores, components, time_limit, heuristic=False):
+        # Solve the instance restricted to each component, in parallel if self.jobs > 1.
+        # Returns the nodes of the combined solution, its weight, and whether it
+        # is optimal. If heuristic is True, mwis_heuristic is used instead of the
+        # exact solver, and the best score over time is reported if there is only
+        # one component.
+        report = self.report_score if len(components) == 1 else None
+        tasks = [(graph.subgraph(nodes), [hier_scores[i] for i in nodes], time_limit,
+                  heuristic, report)
+                 for nodes in components]
+        if self.jobs > 1 and len(components) > 1:
+            workers = multiprocessing.Pool(self.jobs)
+            try:
+                results = workers.map(_solve_component, tasks, 1)
+                workers.close()
+            except:
+                workers.terminate()
+                raise
+            finally:
+                workers.join()
+        else:
+            results = [_solve_component(task) for task in tasks]
+
+        nodes = []
+        for component, result in zip(components, results):
+            nodes.extend(component[i] for i in result.nodes)
+        return (sorted(nodes), sum(result.weight for result in results),
+                all(result.optimal for result in results))
+
+    def build_instance(self, reduce_nodes, node_order, bit_shifts, comments=None,
+                       reduction_list=None, opt_criteria=None):
+        # Returns the conflict graph, hierarchical scores and node descriptions of
+        # the MWIS instance. Afterwards, self.instance_node_ids[k] is the original
+        # node id of node k of the instance, and self.reduction_log records the
+        # nodes removed by reduction_list.
+        # param node_order: 0=default, 1=random, 2=score ascending, 3=score descending
+        #                   4=degree asc., 5=degree desc.
+        # param comments: if not None, a list to which comments about the instance
+        #                 are appended
+        # param reduction_list: if not None, a list of reductions.Reduction to apply
+        #                       after the "almost equal" node reduction
+        # param opt_criteria: if not None, the criteria by which nodes are scored
+        #                     instead of self.opt_criteria. The conflict graph does
+        #                     not depend on the criteria, so it is shared.
+
+        if comments is None:
+            comments = []
+        comments.append("Node order {}".format(node_order))
+        comments.append("Bit shifts {}".format(":".join(str(s) for s in bit_shifts[:-1])))
+        comments.append("Reduce number of nodes? {}".format(reduce_nodes))
+
+        num_nodes = self.num_nodes
+
+        # Each element of hier_scores is the full hierarchy of scores for a node, compressed
+        # into a single int
+        stats = self.stats
+        if opt_criteria is None:
+            opt_criteria = self.opt_criteria
+        with stats.stage("hierarchical scores"):
+            hier_scores = scoring.pack_hier_scores(self.criterion_columns_for(opt_criteria),
+                                                   bit_shifts)
+
+        descriptions = self.node_descriptions()
+        instance_node_ids = range(num_nodes)
+        self.reduction_log = reductions.ReductionLog()
+
+        # Nodes have zero-based indices, but they are printed using 1-based indexing.
+        # The reductions modify the graph in place, so they work on a copy.
+        with stats.stage("conflict graph"):
+            graph = self.conflict_graph()
+        stats.count("nodes", len(graph))
+        stats.count("edges", graph.num_edges)
+        if reduce_nodes or reduction_list:
+            graph = graph.copy()
 
         if reduce_nodes:
-            old_num_nodes = None
-            while old_num_nodes is None or old_num_nodes > num_nodes:
-                print "c Reducing ...", num_nodes, "nodes"
-                old_num_nodes = num_nodes
-                num_nodes, hier_scores, adj_mat, descriptions = self.reduce_instance(
-                        adj_mat, hier_scores, descriptions)
-                
+            # Nodes are removed from graph in place, and the remaining nodes are
+            # renumbered once the reduction reaches a fixed point
+            with stats.stage("reduce nodes"):
+                nodes_to_keep = range(num_nodes)
+                old_num_nodes = None
+                num_passes = 0
+                while old_num_nodes is None or old_num_nodes > num_nodes:
+                    comments.append("Reducing ... {} nodes".format(num_nodes))
+                    old_num_nodes = num_nodes
+                    nodes_to_keep = self.reduce_instance(graph, hier_scores, nodes_to_keep)
+                    num_nodes = len(nodes_to_keep)
+                    num_passes += 1
+                hier_scores = [hier_scores[i] for i in nodes_to_keep]
+                graph = graph.subgraph(nodes_to_keep)
+                descriptions = [descriptions[i] for i in nodes_to_keep]
+                instance_node_ids = [instance_node_ids[i] for i in nodes_to_keep]
+            stats.count("reduce nodes passes", num_passes)
+            stats.count("nodes after reduce nodes", num_nodes)
+            stats.count("edges after reduce nodes", graph.num_edges)
+
+        if reduction_list:
+            comments.append("Reductions {}".format(":".join(r.name for r in reduction_list)))
+            kernel = reductions.Kernel(graph, hier_scores, instance_node_ids)
+            with stats.stage("reductions"):
+                reduction_stats = reductions.ReductionPipeline(reduction_list).run(kernel)
+            for stat in reduction_stats:
+                comments.append(str(stat))
+                stats.count("nodes removed by {}".format(stat.name), stat.nodes_removed)
+            self.reduction_log = kernel.log
+            self.describe_reduction_log(comments)
+            nodes_to_keep = kernel.live_nodes()
+            num_nodes = len(nodes_to_keep)
+            hier_scores = [kernel.weights[i] for i in nodes_to_keep]
+            graph = graph.subgraph(nodes_to_keep)
+            descriptions = [descriptions[i] for i in nodes_to_keep]
+            instance_node_ids = [instance_node_ids[i] for i in nodes_to_keep]
+
         if node_order in [1, 2, 3, 4, 5]:
-            if node_order == 1:
-                order = range(num_nodes)
-                random.shuffle(order)
-            elif node_order == 2:
-                order = sorted(range(num_nodes), key=lambda i: hier_scores[i])
-            elif node_order == 3:
-                order = sorted(range(num_nodes), key=lambda i: hier_scores[i], reverse=True)
-            elif node_order == 4:
-                order = sorted(range(num_nodes), key=lambda i: sum(adj_mat[i]))
-            elif node_order == 5:
-                order = sorted(range(num_nodes), key=lambda i: sum(adj_mat[i]), reverse=True)
-            hier_scores = [hier_scores[i] for i in order]
-            adj_mat = [[adj_mat[i][j] for j in order] for i in order]
-            descriptions = [descriptions[i] for i in order]
-
-        if num_nodes < 30:
-            print "c Adjacency matrix"
-            for row in adj_mat:
-                print "c " + " ".join("X" if x else "." for x in row)
-
-        for i, desc in enumerate(descriptions):
-            print "c {} {}".format(i+1, desc)
-
-        if invert_edges:
-            print "p edge {} {}".format(num_nodes,
-                (num_nodes*num_nodes - num_nodes) / 2 - sum(sum(row) for row in adj_mat) / 2)
-        else:
-            print "p edge {} {}".format(num_nodes, sum(sum(row) for row in adj_mat) / 2)
-
-        for i in range(num_nodes-1):
-            for j in range(i+1, num_nodes):
-                edge_exists = adj_mat[i][j]
-                if invert_edges:
-                    edge_exists = not edge_exists
-                if edge_exists:
-                    print "e", i+1, j+1
-
-        for i, score in enumerate(hier_scores):
-            print "n", i+1, score
+            with stats.stage("node order"):
+                if node_order == 1:
+                    order = range(num_nodes)
+                    random.shuffle(order)
+                elif node_order == 2:
+                    order = sorted(range(num_nodes), key=lambda i: hier_scores[i])
+                elif node_order == 3:
+                    order = sorted(range(num_nodes), key=lambda i: hier_scores[i], reverse=True)
+                elif node_order == 4:
+                    order = sorted(range(num_nodes), key=lambda i: graph.degree(i))
+                elif node_order == 5:
+                    order = sorted(range(num_nodes), key=lambda i: graph.degree(i),
+                                   reverse=True)
+                hier_scores = [hier_scores[i] for i in order]
+                graph = graph.subgraph(order)
+                descriptions = [descriptions[i] for i in order]
+                instance_node_ids = [instance_node_ids[i] for i in order]
+
+        self.instance_node_ids = instance_node_ids
+        return graph, hier_scores, descriptions
+
+    def write_solution(self, out, node_ids):
+        # Write the cycles and chains among node_ids, which are original node ids,
+        # in the format read by check_solution.py
+        descriptions = self.node_descriptions()
+        num_structures = len(self.chain_members) + len(self.cycle_members)
+        for i in node_ids:
+            if i < num_structures:
+                out.write("c {} {}\n".format(i+1, descriptions[i]))
+
+    def describe_reduction_log(self, comments):
+        # Append a comment for each node fixed or folded by the reductions, and
+        # the amount by which they reduced the total score
+        descriptions = self.node_descriptions()
+        for v, u in self.reduction_log.steps:
+            if u is None:
+                comments.append("Fixed by reductions: {}".format(descriptions[v]))
+            else:
+                comments.append("Folded by reductions: {} unless {}".format(
+                        descriptions[v], descriptions[u]))
+        comments.append("Score removed by reductions {}".format(
+                self.reduction_log.weight_offset))
+
+    def expand_solution(self, solution):
+        """Given the nodes of an independent set of the last instance built, as
+        zero-based indices, return the original node ids of the corresponding
+        set of cycles, chains and unused NDDs"""
+        return self.reduction_log.expand_solution(
+                self.instance_node_ids[k] for k in solution)
 
 class NodeEquivClass(object):
     def __init__(self):
@@ -0,0 +1,161 @@
+"""A heuristic for maximum weight independent set on a ConflictGraph.
+
+The search starts from the better of two greedy solutions, taking nodes in
+order of descending weight and of ascending degree. It then runs an iterated
+local search: each iteration forces a random node into the solution, and
+then applies (omega,1)-swaps (insert a node, removing its lighter neighbours
+in the solution) and (1,2)-swaps (replace one node by two non-adjacent
+neighbours of it that have no other neighbour in the solution) until neither
+improves the solution. The best solution found within the time budget is
+returned.
+"""
+
+import random
+import time
+from conflict_graph import bit_indices
+from mwis_solver import MWISResult
+
+# The time budget in seconds when none is given
+DEFAULT_TIME_LIMIT = 1.0
+
+class MWISHeuristic(object):
+    def __init__(self, graph, weights, time_limit=None, report=None, seed=0):
+        # param time_limit: the time budget in seconds, or None for DEFAULT_TIME_LIMIT
+        # param report: if not None, a function called with the time in seconds
+        #               and the weight each time a better solution is found
+        self.graph = graph
+        self.weights = weights
+        self.time_limit = DEFAULT_TIME_LIMIT if time_limit is None else time_limit
+        self.report = report
+        self.rand = random.Random(seed)
+
+    def greedy(self, order):
+        "Returns the bitset of nodes chosen by taking each node of order if possible"
+        rows = self.graph.rows
+        weights = self.weights
+        solution = 0
+        blocked = 0
+        for v in order:
+            if weights[v] > 0 and not blocked >> v & 1:
+                solution |= 1 << v
+                blocked |= rows[v]
+        return solution
+
+    def weight(self, solution):
+        return sum(self.weights[v] for v in bit_indices(solution))
+
+    def change(self, solution, inserted, removed):
+        """Returns the solution with the nodes of bitset inserted added and those
+        of bitset removed taken out, and bitsets of the nodes outside and inside
+        the new solution whose neighbourhoods in the solution may now allow an
+        improving swap"""
+        rows = self.graph.rows
+        solution = (solution & ~removed) | inserted
+        # The nodes that lost a neighbour in the solution
+        loosened = 0
+        for u in bit_indices(removed):
+            loosened |= rows[u]
+        loosened &= ~solution
+        # A solution node has a new candidate for a (1,2)-swap if one of those
+        # nodes now has it as its only neighbour in the solution. The new
+        # solution nodes may also have candidates.
+        affected = inserted
+        for v in bit_indices(loosened):
+            tight = rows[v] & solution
+            if tight & (tight - 1) == 0:
+                affected |= tight
+        return solution, loosened, affected
+
+    def insert(self, solution, v):
+        "As change, for adding v to the solution and removing its neighbours"
+        return self.change(solution, 1 << v, solution & self.graph.rows[v])
+
+    def omega_one_swap(self, solution, v):
+        """Returns the nodes of solution adjacent to v if their total weight is
+        less than v's, or None"""
+        if solution >> v & 1 or self.weights[v] <= 0:
+            return None
+        removed = solution & self.graph.rows[v]
+        if self.weights[v] > sum(self.weights[u] for u in bit_indices(removed)):
+            return removed
+        return None
+
+    def one_two_swap(self, solution, u):
+        """Returns two non-adjacent neighbours of u whose only neighbour in
+        solution is u, and whose total weight exceeds u's, or None"""
+        if not solution >> u & 1:
+            return None
+        rows = self.graph.rows
+        weights = self.weights
+        u_bit = 1 << u
+        candidates = sorted((v for v in bit_indices(rows[u]) if rows[v] & solution == u_bit),
+                            key=lambda v: -weights[v])
+        for i, v in enumerate(candidates):
+            for w in candidates[i+1:]:
+                if weights[v] + weights[w] <= weights[u]:
+                    break
+                if not rows[v] >> w & 1:
+                    return v, w
+        return None
+
+    def local_search(self, solution, free_to_check, solution_to_check):
+        """Apply improving swaps until none remains. free_to_check and
+        solution_to_check are bitsets of the nodes outside and inside the
+        solution at which a swap may be possible."""
+        while free_to_check or solution_to_check:
+            if free_to_check:
+                low_bit = free_to_check & -free_to_check
+                free_to_check ^= low_bit
+                v = low_bit.bit_length() - 1
+                removed = self.omega_one_swap(solution, v)
+                if removed is None:
+                    continue
+                solution, loosened, affected = self.change(solution, low_bit, removed)
+            else:
+                low_bit = solution_to_check & -solution_to_check
+                solution_to_check ^= low_bit
+                swap = self.one_two_swap(solution, low_bit.bit_length() - 1)
+                if swap is None:
+                    continue
+                solution, loosened, affected = self.change(
+                        solution, (1 << swap[0]) | (1 << swap[1]), low_bit)
+            free_to_check |= loosened
+            solution_to_check |= affected
+        return solution
+
+    def improve(self, solution):
+        "Run a local search that checks every node"
+        return self.local_search(solution, ((1 << len(self.graph)) - 1) & ~solution, solution)
+
+    def solve(self):
+        start_time = time.time()
+        num_nodes = len(self.graph)
+        weights = self.weights
+        history = []
+
+        orders = [sorted(xrange(num_nodes), key=lambda v: -weights[v]),
+                  sorted(xrange(num_nodes), key=lambda v: self.graph.degree(v))]
+        best = max((self.improve(self.greedy(order)) for order in orders),
+                   key=self.weight)
+        best_weight = self.weight(best)
+        history.append((time.time() - start_time, best_weight))
+        if self.report is not None:
+            self.report(*history[-1])
+
+        solution = best
+        num_iterations = 0
+        while num_nodes and time.time() - start_time < self.time_limit:
+            num_iterations += 1
+            solution = self.local_search(*self.insert(solution, self.rand.randrange(num_nodes)))
+            solution_weight = self.weight(solution)
+            if solution_weight > best_weight:
+                best = solution
+                best_weight = solution_weight
+                history.append((time.time() - start_time, best_weight))
+                if self.report is not None:
+                    self.report(*history[-1])
+            elif solution_weight < best_weight:
+                solution = best
+
+        return MWISResult(list(bit_indices(best)), best_weight, False, num_iterations,
+                          time.time() - start_time, history)
@@ -0,0 +1,114 @@
+"""An exact solver for maximum weight independent set on a ConflictGraph.
+
+This is a branch and bound in the style of bitset maximum clique algorithms,
+applied to the conflict graph rather than its complement. The bound on the
+weight obtainable from a set of candidate nodes is the sum, over a greedy
+cover of the candidates by cliques of the conflict graph, of the heaviest
+weight in each clique; an independent set takes at most one node of each
+clique. Weights are Python ints, so hierarchical scores of any width are
+handled exactly.
+"""
+
+import time
+
+# The number of branches between checks of the time limit
+TIME_CHECK_INTERVAL = 1000
+
+class MWISResult(object):
+    def __init__(self, nodes, weight, optimal, num_branches, seconds, history=None):
+        # param nodes: the nodes of the best independent set found, in ascending order
+        # param optimal: True iff the search finished, so that nodes is optimal
+        # param num_branches: the number of branches, or of iterations for a heuristic
+        # param history: if not None, a list of (seconds, weight) pairs for each
+        #                improvement of the best solution
+        self.nodes = nodes
+        self.weight = weight
+        self.optimal = optimal
+        self.num_branches = num_branches
+        self.seconds = seconds
+        self.history = history
+
+class MWISSolver(object):
+    def __init__(self, graph, weights, time_limit=None):
+        # param time_limit: the number of seconds after which the search stops
+        #                   and the incumbent is returned, or None for no limit
+        self.time_limit = time_limit
+
+        # Nodes with weight zero or less never improve a solution. The rest are
+        # renumbered in order of decreasing weight, so that the lowest set bit
+        # of a bitset is its heaviest node.
+        self.original_ids = sorted((v for v in xrange(len(graph)) if weights[v] > 0),
+                                   key=lambda v: -weights[v])
+        self.graph = graph.subgraph(self.original_ids)
+        self.weights = [weights[v] for v in self.original_ids]
+
+    def clique_cover(self, candidates):
+        """Greedily cover the bitset candidates by cliques. Returns the nodes in
+        order of clique, and for each position the sum of the heaviest weight
+        in each clique up to and including the node's own clique"""
+        rows = self.graph.rows
+        weights = self.weights
+        order = []
+        bounds = []
+        bound = 0
+        uncovered = candidates
+        while uncovered:
+            # The first node added to each clique is its heaviest
+            clique_candidates = uncovered
+            bound += weights[(uncovered & -uncovered).bit_length() - 1]
+            while clique_candidates:
+                low_bit = clique_candidates & -clique_candidates
+                v = low_bit.bit_length() - 1
+                order.append(v)
+                bounds.append(bound)
+                uncovered ^= low_bit
+                clique_candidates &= rows[v]
+        return order, bounds
+
+    def solve(self):
+        start_time = time.time()
+        rows = self.graph.rows
+        weights = self.weights
+        best_weight = 0
+        best_nodes = []
+        num_branches = 0
+        optimal = True
+
+        # Each frame of the stack is [candidates, weight, order, bounds, i], where
+        # order[i] is the next node to branch on. chosen holds the node chosen
+        # at each frame except the first.
+        chosen = []
+        order, bounds = self.clique_cover((1 << len(weights)) - 1)
+        stack = [[(1 << len(weights)) - 1, 0, order, bounds, len(order) - 1]]
+        while stack:
+            frame = stack[-1]
+            candidates, weight, order, bounds, i = frame
+            if i < 0 or weight + bounds[i] <= best_weight:
+                stack.pop()
+                if stack:
+                    chosen.pop()
+                continue
+
+            num_branches += 1
+            if self.time_limit is not None and num_branches % TIME_CHECK_INTERVAL == 0:
+                if time.time() - start_time > self.time_limit:
+                    optimal = False
+                    break
+
+            v = order[i]
+            frame[0] = candidates = candidates & ~(1 << v)
+            frame[4] = i - 1
+            weight += weights[v]
+            chosen.append(v)
+            if weight > best_weight:
+                best_weight = weight
+                best_nodes = list(chosen)
+            new_candidates = candidates & ~rows[v]
+            if new_candidates:
+                order, bounds = self.clique_cover(new_candidates)
+                stack.append([new_candidates, weight, order, bounds, len(order) - 1])
+            else:
+                chosen.pop()
+
+        return MWISResult(sorted(self.original_ids[v] for v in best_nodes), best_weight,
+                          optimal, num_branches, time.time() - start_time)
@@ -35,6 +35,23 @@ class OptCriterion(object):
     def altruist_val(self, altruist):
         pass
 
+    # chain_column and cycle_column take a scoring.StructureFeatures and return
+    # the value of every chain or cycle it describes. The defaults return None,
+    # in which case chain_val or cycle_val is called on each structure instead.
+
+    def chain_column(self, features):
+        return None
+
+    def cycle_column(self, features):
+        return None
+
+    # arc_aggregates returns the (op, name) pairs, as in
+    # StructureFeatures.prepare, that chain_column or cycle_column will request,
+    # so that the aggregates of all criteria are computed in a single pass.
+
+    def arc_aggregates(self, is_chain):
+        return []
+
 class MaxTransplants(OptCriterion):
     sense = 'MAX'
 
@@ -44,6 +61,12 @@ class MaxTransplants(OptCriterion):
     def cycle_val(self, cycle):
         return cycle.n_transplants()
 
+    def chain_column(self, features):
+        return features.n_transplants()
+
+    def cycle_column(self, features):
+        return features.n_transplants()
+
     def altruist_val(self, altruist):
         return 1
 
@@ -59,6 +82,15 @@ class MaxEffectivePairwise(OptCriterion):
                 return 1
         return 0
 
+    def chain_column(self, features):
+        return [1] * len(features)
+
+    def cycle_column(self, features):
+        return features.arc_any("backarc")
+
+    def arc_aggregates(self, is_chain):
+        return [] if is_chain else [("any", "backarc")]
+
     def altruist_val(self, altruist):
         return 0
 
@@ -71,6 +103,22 @@ class MaxBackarcs(OptCriterion):
     def cycle_val(self, cycle):
         return cycle.n_backarcs()
 
+    def chain_column(self, features):
+        # The donor paired with the last patient can donate to the NDD, and
+        # the backarcs between pairs are counted as for cycles
+        return [1 + n + ndd_backarc if n_transplants >= 3 else 0
+                for n, ndd_backarc, n_transplants in
+                zip(features.arc_count("backarc"), features.ndd_backarcs(),
+                    features.n_transplants())]
+
+    def cycle_column(self, features):
+        return [n if n_transplants >= 3 else 0
+                for n, n_transplants in
+                zip(features.arc_count("backarc"), features.n_transplants())]
+
+    def arc_aggregates(self, is_chain):
+        return [("count", "backarc")]
+
     def altruist_val(self, altruist):
         return 0
 
@@ -83,6 +131,12 @@ class MinThreeWay(OptCriterion):
     def cycle_val(self, cycle):
         return cycle.n_transplants() == 3
 
+    def chain_column(self, features):
+        return [n == 3 for n in features.n_transplants()]
+
+    def cycle_column(self, features):
+        return [n == 3 for n in features.n_transplants()]
+
     def altruist_val(self, altruist):
         return 0
 
@@ -96,6 +150,12 @@ class MaxInverseThreeWay(OptCriterion):
     def cycle_val(self, cycle):
         return (cycle.n_transplants() == 2) * 2
 
+    def chain_column(self, features):
+        return [(n == 2) * 2 for n in features.n_transplants()]
+
+    def cycle_column(self, features):
+        return [(n == 2) * 2 for n in features.n_transplants()]
+
     def altruist_val(self, altruist):
         return 1
 
@@ -118,6 +178,15 @@ class MaxWeight(OptCriterion):
     def cycle_val(self, cycle):
         return cycle.weight(self.weight_fun)
 
+    def chain_column(self, features):
+        return features.arc_sum(("weight", self.weight_fun))
+
+    def cycle_column(self, features):
+        return features.arc_sum(("weight", self.weight_fun))
+
+    def arc_aggregates(self, is_chain):
+        return [("sum", ("weight", self.weight_fun))]
+
     def altruist_val(self, altruist):
         return 0
 
@@ -130,6 +199,12 @@ class MaxNull(OptCriterion):
     def cycle_val(self, cycle):
         return 0
 
+    def chain_column(self, features):
+        return [0] * len(features)
+
+    def cycle_column(self, features):
+        return [0] * len(features)
+
     def altruist_val(self, altruist):
         return 0
 
@@ -0,0 +1,172 @@
+"""Generate random pools in the JSON format read by pool_reader.
+
+Pools are generated in the style of Saidman et al. (2006). Each patient and
+donor gets a blood type, drawn from BLOOD_TYPE_FREQUENCIES, and each patient
+a PRA (the probability that a crossmatch with a random donor is positive),
+drawn from PRA_LEVELS. Each patient's paired donors are redrawn until they
+are incompatible with the patient, since a compatible pair would not enter
+the pool. A donor has an arc to a patient if their blood types are
+compatible and the crossmatch, which fails with probability equal to the
+patient's PRA, is negative. Some patients have more than one paired donor,
+and some donors are paired with two patients, like donor 5 of tiny.json.
+"""
+
+import argparse
+import json
+import random
+import sys
+
+# Blood types, with their frequencies in the donor and patient populations
+BLOOD_TYPE_FREQUENCIES = [("O", 0.48), ("A", 0.34), ("B", 0.14), ("AB", 0.04)]
+
+# (probability, PRA) for low, medium and high sensitisation
+PRA_LEVELS = [(0.2, 0.6), (0.4, 0.9), (0.4, 0.98)]
+
+def blood_type_compatible(donor_type, patient_type):
+    return donor_type == "O" or patient_type == "AB" or donor_type == patient_type
+
+def _choose(rand, weighted):
+    # Choose the value of a list of (value, weight) pairs with probability
+    # proportional to its weight
+    x = rand.random() * sum(weight for value, weight in weighted)
+    for value, weight in weighted:
+        x -= weight
+        if x < 0:
+            return value
+    return weighted[-1][0]
+
+class PoolGenerator(object):
+    def __init__(self, seed=0, extra_donor_prob=0.1, shared_donor_prob=0.02,
+                 pra_levels=PRA_LEVELS, max_score=10, min_dage=18, max_dage=70,
+                 max_ndd_arcs=None):
+        # param extra_donor_prob: the probability that a patient has another
+        #                         paired donor, applied repeatedly
+        # param shared_donor_prob: the probability that a donor is also paired
+        #                          with the next patient
+        # param pra_levels: (probability, PRA) pairs from which each patient's PRA
+        #                   is drawn. Higher PRAs give sparser pools.
+        # param max_ndd_arcs: if not None, the largest number of arcs from each NDD
+        if any(pra <= 0 for prob, pra in pra_levels):
+            # A patient of blood type AB with a PRA of 0 has no incompatible donors
+            raise ValueError("Each PRA must be positive")
+        self.rand = random.Random(seed)
+        self.extra_donor_prob = extra_donor_prob
+        self.shared_donor_prob = shared_donor_prob
+        self.pra_levels = [(pra, prob) for prob, pra in pra_levels]
+        self.max_score = max_score
+        self.min_dage = min_dage
+        self.max_dage = max_dage
+        self.max_ndd_arcs = max_ndd_arcs
+
+    def blood_type(self):
+        return _choose(self.rand, BLOOD_TYPE_FREQUENCIES)
+
+    def dage(self):
+        return self.rand.randint(self.min_dage, self.max_dage)
+
+    def incompatible_donor_type(self, patient_type, pra):
+        # Draw donor blood types until one is incompatible with the patient,
+        # by blood type or by a positive crossmatch
+        while True:
+            donor_type = self.blood_type()
+            if (not blood_type_compatible(donor_type, patient_type) or
+                    self.rand.random() < pra):
+                return donor_type
+
+    def arcs_to(self, donor_type, patients, exclude=()):
+        # The matches from a donor of donor_type to the (id, blood type, PRA) of
+        # each of patients, other than those in exclude
+        rand = self.rand
+        return [{"recipient": patient_id, "score": rand.randint(1, self.max_score)}
+                for patient_id, patient_type, pra in patients
+                if patient_id not in exclude and
+                   blood_type_compatible(donor_type, patient_type) and rand.random() >= pra]
+
+    def generate(self, num_patients, num_ndds):
+        "Returns the JSON object of a pool with num_patients patients and num_ndds NDDs"
+        rand = self.rand
+        patients = [(i + 1, self.blood_type(), _choose(rand, self.pra_levels))
+                    for i in xrange(num_patients)]
+
+        # Each donor is (patient IDs, blood type)
+        donors = []
+        for i, (patient_id, patient_type, pra) in enumerate(patients):
+            sources = [patient_id]
+            if i + 1 < num_patients and rand.random() < self.shared_donor_prob:
+                # The donor is also paired with the next patient, and must be
+                # incompatible with both
+                next_id, next_type, next_pra = patients[i + 1]
+                while True:
+                    donor_type = self.incompatible_donor_type(patient_type, pra)
+                    if (not blood_type_compatible(donor_type, next_type) or
+                            rand.random() < next_pra):
+                        break
+                sources.append(next_id)
+            else:
+                donor_type = self.incompatible_donor_type(patient_type, pra)
+            donors.append((sources, donor_type))
+            while rand.random() < self.extra_donor_prob:
+                donors.append(([patient_id], self.incompatible_donor_type(patient_type, pra)))
+
+        data = {}
+        for sources, donor_type in donors:
+            data[str(len(data) + 1)] = {"sources": sources,
+                                        "dage": self.dage(),
+                                        "matches": self.arcs_to(donor_type, patients,
+                                                                set(sources))}
+        for i in xrange(num_ndds):
+            matches = self.arcs_to(self.blood_type(), patients)
+            if self.max_ndd_arcs is not None and len(matches) > self.max_ndd_arcs:
+                matches = rand.sample(matches, self.max_ndd_arcs)
+            data[str(len(data) + 1)] = {"altruistic": True,
+                                        "dage": self.dage(),
+                                        "matches": matches}
+        return {"data": data}
+
+def generate_pool(num_patients, num_ndds, seed=0, **kwargs):
+    return PoolGenerator(seed, **kwargs).generate(num_patients, num_ndds)
+
+def write_pool(out, pool_json):
+    # Donors are written in order of ID, one per line, so that the files are
+    # reproducible and can be compared with diff
+    data = pool_json["data"]
+    out.write('{ "data" :\n    {\n')
+    ids = sorted(data, key=int)
+    for k, id in enumerate(ids):
+        out.write('    "{}" : {}{}\n'.format(id, json.dumps(data[id], sort_keys=True),
+                                             "," if k + 1 < len(ids) else ""))
+    out.write("    }\n}\n")
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Generate a random kidney-exchange pool")
+    parser.add_argument("-p", "--patients", help="Number of patients", type=int,
+                        required=True)
+    parser.add_argument("-a", "--altruists", help="Number of NDDs", type=int, default=0)
+    parser.add_argument("--seed", help="Random seed", type=int, default=0)
+    parser.add_argument("--extra-donor-prob",
+                        help="Probability that a patient has another paired donor",
+                        type=float, default=0.1)
+    parser.add_argument("--shared-donor-prob",
+                        help="Probability that a donor is paired with two patients",
+                        type=float, default=0.02)
+    parser.add_argument("--pra-scale",
+                        help="Multiply each PRA by this factor, capped at 1, to make the " +
+                             "pool sparser (>1) or denser (<1)",
+                        type=float, default=1.0)
+    parser.add_argument("--max-ndd-arcs", help="Maximum number of arcs from each NDD",
+                        type=int)
+    parser.add_argument("-w", "--output-file",
+                        help="Write the pool to this file instead of standard output",
+                        type=str)
+    args = parser.parse_args()
+
+    pra_levels = [(prob, min(1.0, pra * args.pra_scale)) for prob, pra in PRA_LEVELS]
+    pool_json = generate_pool(args.patients, args.altruists, args.seed,
+                              extra_donor_prob=args.extra_donor_prob,
+                              shared_donor_prob=args.shared_donor_prob,
+                              pra_levels=pra_levels, max_ndd_arcs=args.max_ndd_arcs)
+    if args.output_file is None:
+        write_pool(sys.stdout, pool_json)
+    else:
+        with open(args.output_file, "w") as out:
+            write_pool(out, pool_json)
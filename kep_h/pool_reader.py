@@ -1,60 +1,185 @@
+"""Create a Pool from the "data" object of a pool JSON file.
+
+Each member of the data object is a donor, keyed by its ID, with the donor's
+age "dage", its matches, each of which has a "recipient" patient ID and a
+"score", and either "altruistic": true or the IDs of its paired patients in
+"sources".
+
+read takes the data object of an already-parsed file. read_file instead
+parses a file one donor record at a time, so that the whole document is
+never held in memory as a dict.
+"""
+
+import json
+import re
+from itertools import izip
 from kep_h_pool import *
 
+# The number of bytes read from a file at a time by read_file
+CHUNK_SIZE = 1 << 20
+
 def read(data):
-    pool = read_people(data)
-    create_pairings_and_edges(data, pool)
-    return pool
+    """Read a Pool from a data object that has already been parsed.
 
-def read_people(data):
-    pool = Pool()
+    Patients, donors and NDDs are numbered in the order in which data yields
+    its members. For a dict from json.load this is not the order of the file,
+    so the nodes of the MWIS instance may be numbered differently than after
+    read_file, which kep_h.py and the other scripts use. Pass a dict made with
+    object_pairs_hook=collections.OrderedDict to match read_file."""
+    return read_records(data.iteritems())
 
-    patient_ids_seen = set()  # The set of IDs of patients who have been created
+def read_file(json_file):
+    "Read a Pool from the data object of a JSON file opened for reading"
+    return read_records(_data_records(JSONStream(json_file)))
 
-    for id in data:
-        dage = data[id]["dage"]
-        is_altruistic = data[id].has_key("altruistic") and data[id]["altruistic"]
-        if is_altruistic:
-            altruist = Altruist(dage, int(id))
-            pool.altruists.append(altruist)
+def read_records(records):
+    """Create a Pool from an iterable of (ID, record) pairs, in one pass.
+
+    Patients are numbered in order of their first appearance in the sources
+    of a donor. A match may name a patient who first appears in a later
+    record, so each donor's matches are kept as lists of patient IDs and
+    scores until every record has been seen.
+
+    Each patient ID is interned through a dict, so that the recipient lists
+    share one ID object per patient rather than holding a copy per match."""
+    pool = Pool()
+    id_to_patient = {}
+    patient_ids = {}
+    intern_id = patient_ids.setdefault
+    pending = []  # (donor, recipient IDs, scores) for each donor with matches
+    for id, record in records:
+        dage = record["dage"]
+        if record.get("altruistic"):
+            donor = Altruist(dage, int(id))
+            pool.altruists.append(donor)
         else:
-            paired_donor = PairedDonor(dage, int(id))
-            pool.paired_donors.append(paired_donor)
-            for patient_id in data[id]["sources"]:
-                if patient_id not in patient_ids_seen:
-                    patient_ids_seen.add(patient_id)
+            donor = PairedDonor(dage, int(id))
+            pool.paired_donors.append(donor)
+            for patient_id in record["sources"]:
+                patient_id = intern_id(patient_id, patient_id)
+                patient = id_to_patient.get(patient_id)
+                if patient is None:
                     patient = Patient(patient_id, len(pool.patients))
+                    id_to_patient[patient_id] = patient
                     pool.patients.append(patient)
+                pool.associate_patient_with_donor(patient, donor)
+        matches = record.get("matches")
+        if matches:
+            pending.append((donor, [intern_id(match["recipient"], match["recipient"])
+                                    for match in matches],
+                            [match["score"] for match in matches]))
+
+    # Create edges from altruists and edges between patient-donor pairs
+    for donor, recipients, scores in pending:
+        patients = [id_to_patient[recipient] for recipient in recipients]
+        if isinstance(donor, Altruist):
+            donor.edges.extend(AltruistEdge(donor, patient, score)
+                               for patient, score in izip(patients, scores))
+        else:
+            donor.edges_out.extend(map(DonorPatientMatch, patients, scores))
 
+    pool.build_indices()
     return pool
 
-def create_pairings_and_edges(data, pool):
-    id_to_patient = {patient.nhs_id: patient for patient in pool.patients}
-    id_to_donor = {donor.nhs_id: donor for donor in pool.paired_donors}
-    id_to_altruist = {altruist.nhs_id: altruist for altruist in pool.altruists}
-
-    # Create patient-donor pairs
-    for id in data:
-        if int(id) in id_to_donor:
-            paired_donor = id_to_donor[int(id)]
-            for source_id in data[id]["sources"]:
-                patient = id_to_patient[source_id]
-                pool.associate_patient_with_donor(patient, paired_donor)
-        
-    # Create edges from altruists and edges between patient-donor pairs
-    for id in data:
-        if int(id) in id_to_donor and data[id].has_key("matches"):
-            paired_donor = id_to_donor[int(id)]
-            for match in data[id]["matches"]:
-                patient = id_to_patient[match["recipient"]]
-                score = match["score"]
-                dp_match = DonorPatientMatch(patient, score)
-                paired_donor.edges_out.append(dp_match)
-        
-        elif int(id) in id_to_altruist:
-            altruist = id_to_altruist[int(id)]
-            if "matches" in data[id]:
-                for match in data[id]["matches"]:
-                    patient = id_to_patient[match["recipient"]]
-                    score = match["score"]
-                    altruist.edges.append(AltruistEdge(altruist, patient, score))
+def _data_records(stream):
+    # Generate the (ID, record) pairs of the data object of the document in
+    # stream. The values of other top-level members are parsed and discarded.
+    found_data = False
+    for key in stream.members():
+        if key == "data" and not found_data:
+            found_data = True
+            for id in stream.members():
+                yield id, stream.value()
+        else:
+            stream.value()
+    stream.end()
+    if not found_data:
+        raise ValueError("No data object in pool file")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+class JSONStream(object):
+    """A JSON document read from a file a piece at a time.
+
+    Objects can be walked member by member with members, and any value can
+    be parsed whole with value, which uses the json module's scanner on the
+    buffered text. At most one value, plus one chunk, is buffered at once.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.file = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.buf_offset = 0  # the offset in the file of the start of buf
+        self.eof = False
+        self.scan_once = json.JSONDecoder().scan_once
+
+    def fill(self):
+        "Read another chunk into the buffer, dropping the text already consumed"
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buf_offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        "Skip whitespace, and return the next character, or '' at the end of the file"
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos+1]
+            self.fill()
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise ValueError("Expected {!r} at offset {} of pool file".format(
+                    c, self.buf_offset + self.pos))
+        self.pos += 1
+
+    def value(self):
+        "Parse and return the next value"
+        self.peek()
+        while True:
+            try:
+                obj, end = self.scan_once(self.buf, self.pos)
+            except (StopIteration, ValueError):
+                # The value is incomplete, or is not valid JSON
+                if self.eof:
+                    raise ValueError("Invalid JSON at offset {} of pool file".format(
+                            self.buf_offset + self.pos))
+                self.fill()
+                continue
+            if end == len(self.buf) and not self.eof:
+                # A number may continue in the next chunk
+                self.fill()
+                continue
+            self.pos = end
+            return obj
+
+    def members(self):
+        """Generate the key of each member of the object that starts at the
+        next value. The caller must consume the member's value, with value or
+        members, before asking for the next key."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, basestring):
+                raise ValueError("Expected a string key in pool file")
+            self.expect(":")
+            yield key
+            c = self.peek()
+            self.pos += 1
+            if c == "}":
+                return
+            if c != ",":
+                raise ValueError("Expected ',' or '}}' in pool file, not {!r}".format(c))
 
+    def end(self):
+        "Check that only whitespace remains"
+        if self.peek() != "":
+            raise ValueError("Extra data after the end of the pool file")
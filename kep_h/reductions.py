@@ -0,0 +1,204 @@
+"""Reductions that shrink an MWIS instance without changing its optimal value.
+
+Each reduction removes nodes from a Kernel in place. Every removal is recorded
+in the kernel's ReductionLog, so that an independent set of the reduced
+instance can be expanded to one of the original instance with the same total
+score plus the log's weight_offset.
+"""
+
+import time
+from conflict_graph import bit_indices
+
+class ReductionException(Exception):
+    pass
+
+def get_reductions(s):
+    return [get_reduction(name) for name in s.split(":")]
+
+def get_reduction(name):
+    if name=="twin":        return TwinReduction()
+    if name=="domination":  return DominationReduction()
+    if name=="simplicial":  return SimplicialReduction()
+    if name=="isolated":    return IsolatedVertexReduction()
+    if name=="degree1":     return DegreeOneReduction()
+    raise ReductionException(
+            "Unrecognised reduction: {}".format(name))
+
+class ReductionLog(object):
+    """The nodes fixed in or folded out of an instance by reductions, as node
+    ids of the original instance, in the order in which they were removed."""
+
+    def __init__(self):
+        self.steps = []
+        self.weight_offset = 0
+
+    def include(self, v, weight):
+        "Record that v is in some optimal solution"
+        self.steps.append((v, None))
+        self.weight_offset += weight
+
+    def fold(self, v, u, weight):
+        "Record that v is in the solution iff its only neighbour u is not"
+        self.steps.append((v, u))
+        self.weight_offset += weight
+
+    def expand_solution(self, solution):
+        """Given the original node ids of an independent set of the reduced
+        instance, return those of the corresponding set of the original instance"""
+        solution = set(solution)
+        for v, u in reversed(self.steps):
+            if u is None or u not in solution:
+                solution.add(v)
+        return sorted(solution)
+
+class Kernel(object):
+    """A conflict graph and node weights that reductions modify in place.
+
+    Removed nodes keep their numbers but lose all of their edges.
+    node_ids[v] is the original node id of v, used in the log.
+    """
+
+    def __init__(self, graph, weights, node_ids):
+        self.graph = graph
+        self.weights = list(weights)
+        self.node_ids = node_ids
+        self.live = [True] * len(graph)
+        self.num_live = len(graph)
+        self.log = ReductionLog()
+
+    def live_nodes(self):
+        return [v for v in xrange(len(self.live)) if self.live[v]]
+
+    def remove(self, v):
+        self.graph.remove_node(v)
+        self.live[v] = False
+        self.num_live -= 1
+
+    def include(self, v):
+        "Put v in the solution, removing it and its neighbours"
+        self.log.include(self.node_ids[v], self.weights[v])
+        for w in self.graph.neighbours(v):
+            self.remove(w)
+        self.remove(v)
+
+    def closed_bitset(self, v):
+        return self.graph.bitset(v) | (1 << v)
+
+class Reduction(object):
+    # Subclasses define name, and apply, which makes one pass over the live
+    # nodes of a kernel
+
+    def apply(self, kernel):
+        pass
+
+class TwinReduction(Reduction):
+    "Keep only the best node of each class of nodes with the same closed neighbourhood"
+    name = "twin"
+
+    def apply(self, kernel):
+        weights = kernel.weights
+        for node_class in kernel.graph.twin_classes(kernel.live_nodes()):
+            best = node_class[0]
+            for v in node_class:
+                if weights[v] > weights[best]:
+                    best = v
+            for v in node_class:
+                if v != best:
+                    kernel.remove(v)
+
+class DominationReduction(Reduction):
+    """Remove u if it has a neighbour v with at least its weight and whose
+    closed neighbourhood is contained in u's"""
+    name = "domination"
+
+    def apply(self, kernel):
+        weights = kernel.weights
+        for u in kernel.live_nodes():
+            closed_u = kernel.closed_bitset(u)
+            for v in kernel.graph.neighbours(u):
+                if weights[v] >= weights[u] and kernel.closed_bitset(v) & ~closed_u == 0:
+                    kernel.remove(u)
+                    break
+
+class SimplicialReduction(Reduction):
+    """Include v if its neighbourhood is a clique and its weight is at least that
+    of each neighbour. Cycles and chains sharing a patient or donor form such
+    cliques."""
+    name = "simplicial"
+
+    def apply(self, kernel):
+        weights = kernel.weights
+        for v in kernel.live_nodes():
+            if not kernel.live[v]:
+                continue
+            closed_v = kernel.closed_bitset(v)
+            nbrs = kernel.graph.neighbours(v)
+            if all(weights[w] <= weights[v] and closed_v & ~kernel.closed_bitset(w) == 0
+                   for w in nbrs):
+                kernel.include(v)
+
+class IsolatedVertexReduction(Reduction):
+    "Include every node with no neighbours"
+    name = "isolated"
+
+    def apply(self, kernel):
+        for v in kernel.live_nodes():
+            if kernel.graph.degree(v) == 0:
+                kernel.include(v)
+
+class DegreeOneReduction(Reduction):
+    """For a node v whose only neighbour is u, include v if it is at least as
+    heavy as u. Otherwise, fold v into u by removing v and reducing u's weight
+    by v's; v is then in the solution iff u is not."""
+    name = "degree1"
+
+    def apply(self, kernel):
+        weights = kernel.weights
+        for v in kernel.live_nodes():
+            if not kernel.live[v] or kernel.graph.degree(v) != 1:
+                continue
+            u = next(bit_indices(kernel.graph.bitset(v)))
+            if weights[v] >= weights[u]:
+                kernel.include(v)
+            else:
+                kernel.log.fold(kernel.node_ids[v], kernel.node_ids[u], weights[v])
+                weights[u] -= weights[v]
+                kernel.remove(v)
+
+class ReductionStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.nodes_removed = 0
+        self.edges_removed = 0
+        self.seconds = 0.0
+
+    def __str__(self):
+        return "Reduction {}: removed {} nodes and {} edges in {:.3f} s".format(
+                self.name, self.nodes_removed, self.edges_removed, self.seconds)
+
+class ReductionPipeline(object):
+    """Applies each reduction in turn until it makes no further change, and
+    repeats the whole sequence until none of the reductions changes the kernel."""
+
+    def __init__(self, reductions):
+        self.reductions = reductions
+
+    def run(self, kernel):
+        # Returns a ReductionStats for each reduction
+        stats = [ReductionStats(r.name) for r in self.reductions]
+        changed = True
+        while changed:
+            changed = False
+            for reduction, stat in zip(self.reductions, stats):
+                while True:
+                    num_live = kernel.num_live
+                    num_edges = kernel.graph.num_edges
+                    start_time = time.time()
+                    reduction.apply(kernel)
+                    stat.seconds += time.time() - start_time
+                    stat.nodes_removed += num_live - kernel.num_live
+                    stat.edges_removed += num_edges - kernel.graph.num_edges
+                    if kernel.num_live == num_live:
+                        break
+                    changed = True
+        return stats
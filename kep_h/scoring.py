@@ -0,0 +1,384 @@
+from itertools import izip
+from array import array
+import optimality_criteria
+from compact_pool import ChainStore
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+INT64_LIMIT = 1 << 63
+
+def int_score(oc, value):
+    # Converts a criterion value to the integer used in hierarchical scores
+    return int_column(oc, [value])[0]
+
+def int_column(oc, values):
+    # int_score of each of values, with the criterion checked once
+    assert oc.sense == 'MAX'
+    if isinstance(oc, optimality_criteria.MaxWeight):
+        return [int(round(value * 100000)) for value in values]
+    return [int(value) for value in values]
+
+def criterion_scores(opt_criteria, item, score_accessor):
+    # Returns the integer score of a single item under each optimality criterion
+    return [int_score(oc, score_accessor(oc, item)) for oc in opt_criteria]
+
+# Score accessors for criterion_scores
+def chain_val(oc, chain):
+    return oc.chain_val(chain)
+
+def cycle_val(oc, cycle):
+    return oc.cycle_val(cycle)
+
+def altruist_val(oc, altruist):
+    return oc.altruist_val(altruist)
+
+class ArcValues(object):
+    """Values of the arcs of a pool, computed once per pool and shared by all of
+    the structures that use each arc.
+
+    An arc of a cycle or chain is a step to a patient-donor pair, either from
+    the previous pair or, for the first pair of a chain, from an NDD edge. The
+    steps that may occur in a structure are numbered when the ArcValues are
+    built, or when CompactPool adds an arc or NDD edge, and each value is a
+    list with one entry per step:
+
+    "backarc": 1 if the step's patient has a backarc to the previous patient,
+        and 0 for steps from NDD edges
+    "score": the score of the step's edge
+    ("weight", weight_fun): weight_fun of the step's edge, computed the
+        first time it is requested
+    """
+
+    def __init__(self, compact):
+        # Maps ((u * num_donors + d) * num_patients + v) * num_donors + d2 to the
+        # number of the step from the pair (u, d) to the pair (v, d2)
+        self.pair_steps = {}
+        # Maps k * num_donors + d2 to the number of the step from NDD edge k to
+        # the pair of its target patient with d2
+        self.ndd_steps = {}
+        self.num_patients = compact.num_patients
+        self.num_donors = compact.num_donors
+
+        # The arguments of weight_fun for each step
+        self.dages = []
+        self.next_dages = []
+        self._values = {"backarc": [], "score": []}
+        for u in xrange(compact.num_patients):
+            for d in compact.donors_of(u):
+                # Only the donor's first edge to each patient is used
+                seen = set()
+                for v in compact.donor_targets(d):
+                    if v not in seen:
+                        seen.add(v)
+                        self._add_pair_steps(compact, u, d, v)
+        for k in xrange(len(compact.ndd_edge_targets)):
+            self._add_ndd_steps(compact, k)
+
+    def _add_step(self, score, dage, next_dage, backarc):
+        # Number a new step, extending each value computed so far to it
+        values = self._values
+        for name, column in values.iteritems():
+            if isinstance(name, tuple):
+                column.append(name[1](score, dage, next_dage))
+        values["score"].append(score)
+        values["backarc"].append(backarc)
+        self.dages.append(dage)
+        self.next_dages.append(next_dage)
+        return len(self.dages) - 1
+
+    def _add_pair_steps(self, compact, u, d, v):
+        # Add the steps along the arc from donor d, paired with u, to patient v
+        num_donors = self.num_donors
+        key = (u * num_donors + d) * self.num_patients + v
+        score = compact.donor_edge_scores[compact.arc_position(d, v)]
+        backarc = 1 if compact.has_patient_arc(v, u) else 0
+        for d2 in compact.donors_of(v):
+            self.pair_steps[key * num_donors + d2] = self._add_step(
+                    score, compact.donor_dage[d], compact.donor_dage[d2], backarc)
+
+    def _add_ndd_steps(self, compact, k):
+        # Add the steps along NDD edge k
+        dage = compact.ndd_dage[compact.ndd_edge_ndds[k]]
+        for d2 in compact.donors_of(compact.ndd_edge_targets[k]):
+            self.ndd_steps[k * self.num_donors + d2] = self._add_step(
+                    compact.ndd_edge_scores[k], dage, compact.donor_dage[d2], 0)
+
+    # Changes made by CompactPool to its pool. New steps are numbered after
+    # the others, and the numbers of removed steps are not used again.
+
+    def add_arc(self, compact, sources, donor, patient):
+        "Add the steps of a new arc to patient from donor, which is paired with sources"
+        for u in sources:
+            self._add_pair_steps(compact, u, donor, patient)
+        self._update_backarcs(compact, sources, patient)
+
+    def remove_arc(self, compact, sources, donor, patient):
+        "Remove the steps of the arc to patient from donor, which is paired with sources"
+        num_donors = self.num_donors
+        for u in sources:
+            key = (u * num_donors + donor) * self.num_patients + patient
+            for d2 in compact.donors_of(patient):
+                self.pair_steps.pop(key * num_donors + d2, None)
+        self._update_backarcs(compact, sources, patient)
+
+    def _update_backarcs(self, compact, sources, patient):
+        # A step from a pair of patient to a pair of u is a backarc iff u has an
+        # arc back to patient, which may have changed for each u in sources
+        num_patients = self.num_patients
+        num_donors = self.num_donors
+        backarcs = self._values["backarc"]
+        for u in sources:
+            backarc = 1 if compact.has_patient_arc(u, patient) else 0
+            for d in compact.donors_of(patient):
+                if compact.has_arc(d, u):
+                    key = (patient * num_donors + d) * num_patients + u
+                    for d2 in compact.donors_of(u):
+                        backarcs[self.pair_steps[key * num_donors + d2]] = backarc
+
+    def add_ndd_edge(self, compact, k):
+        "Add the steps of a new NDD edge k, after which later NDD edges move up"
+        self._renumber_ndd_edges(k, 1)
+        self._add_ndd_steps(compact, k)
+
+    def remove_ndd_edge(self, k):
+        "Remove the steps of NDD edge k, after which later NDD edges move down"
+        num_donors = self.num_donors
+        for key in xrange(k * num_donors, (k + 1) * num_donors):
+            self.ndd_steps.pop(key, None)
+        self._renumber_ndd_edges(k + 1, -1)
+
+    def _renumber_ndd_edges(self, start, delta):
+        # Add delta to the number of each NDD edge from start on
+        bound = start * self.num_donors
+        shift = delta * self.num_donors
+        self.ndd_steps = {key + shift if key >= bound else key: step
+                          for key, step in self.ndd_steps.iteritems()}
+
+    def __len__(self):
+        return len(self._values["score"])
+
+    def values(self, name):
+        if name not in self._values:
+            if not (isinstance(name, tuple) and name[0] == "weight"):
+                raise KeyError(name)
+            weight_fun = name[1]
+            self._values[name] = [weight_fun(score, dage, next_dage)
+                                  for score, dage, next_dage in
+                                  izip(self._values["score"], self.dages, self.next_dages)]
+        return self._values[name]
+
+def get_arc_values(compact):
+    "The ArcValues of a CompactPool, which are built the first time they are needed"
+    if compact.arc_values is None:
+        compact.arc_values = ArcValues(compact)
+    return compact.arc_values
+
+def _count(values):
+    return sum(1 for value in values if value)
+
+# For each aggregate, a function of the values of a structure's steps, in the
+# order in which Cycle and Chain visit them, and a function that extends the
+# aggregate of a chain's parent by the value of the chain's last step
+AGGREGATES = {"sum": (sum, lambda total, value: total + value),
+              "count": (_count, lambda total, value: total + (1 if value else 0)),
+              "any": (any, lambda total, value: total or bool(value))}
+
+class StructureFeatures(object):
+    """Per-structure quantities used by the optimality criteria, computed for all
+    of the cycles or chains in a StructureStore at once.
+
+    Each quantity is a list with one entry per structure, and is computed the
+    first time it is requested. Most are aggregates of an ArcValues value over
+    the arcs of each structure: arc_sum, arc_count (of nonzero values) and
+    arc_any. Aggregates listed in a call to prepare are computed together, in
+    a single pass that looks up each arc of each structure once. For chains in
+    a ChainStore, each chain's aggregates extend those of its parent by its
+    last arc. The results match Cycle and Chain exactly, including the order
+    in which arc weights are summed.
+    """
+
+    def __init__(self, compact, store, is_chain):
+        self.compact = compact
+        self.arcs = get_arc_values(compact)
+        self.store = store
+        self.is_chain = is_chain
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.store)
+
+    def _cached(self, key, fun):
+        if key not in self._cache:
+            self._cache[key] = fun()
+        return self._cache[key]
+
+    def _is_tree(self):
+        return isinstance(self.store, ChainStore)
+
+    def n_transplants(self):
+        extra = 1 if self.is_chain else 0
+        return self._cached("n_transplants",
+                            lambda: [length / 2 + extra for length in self.store.lengths()])
+
+    def arc_sum(self, name):
+        return self._aggregate("sum", name)
+
+    def arc_count(self, name):
+        return self._aggregate("count", name)
+
+    def arc_any(self, name):
+        return self._aggregate("any", name)
+
+    def _aggregate(self, op, name):
+        self.prepare([(op, name)])
+        return self._cache[op, name]
+
+    def prepare(self, aggregates):
+        """Compute the (op, name) aggregates that have not been computed yet, in
+        one pass over the structures"""
+        todo = []
+        for aggregate in aggregates:
+            if aggregate not in self._cache and aggregate not in todo:
+                todo.append(aggregate)
+        if not todo:
+            return
+        tables = [self.arcs.values(name) for op, name in todo]
+        if self.is_chain and self._is_tree():
+            columns = self._tree_aggregates([AGGREGATES[op] for op, name in todo], tables)
+        else:
+            columns = [[] for aggregate in todo]
+            reducers = [AGGREGATES[op][0] for op, name in todo]
+            for members in self.store:
+                steps = self._steps(members)
+                for reduce, table, column in izip(reducers, tables, columns):
+                    column.append(reduce([table[step] for step in steps]))
+        for aggregate, column in izip(todo, columns):
+            self._cache[aggregate] = column
+
+    def _steps(self, members):
+        # The numbers of the steps of a structure, in the order of its arcs in
+        # Cycle.weight or Chain.weight
+        arcs = self.arcs
+        num_patients = arcs.num_patients
+        num_donors = arcs.num_donors
+        pair_steps = arcs.pair_steps
+        if self.is_chain:
+            steps = [arcs.ndd_steps[members[0] * num_donors + members[2]]]
+            start = 3
+        else:
+            # A cycle's first arc is from its last pair
+            steps = [pair_steps[((members[-2] * num_donors + members[-1]) * num_patients +
+                                 members[0]) * num_donors + members[1]]]
+            start = 2
+        for i in xrange(start, len(members), 2):
+            steps.append(pair_steps[((members[i-2] * num_donors + members[i-1]) *
+                                     num_patients + members[i]) * num_donors + members[i+1]])
+        return steps
+
+    def _tree_aggregates(self, aggregates, tables):
+        arcs = self.arcs
+        num_patients = arcs.num_patients
+        num_donors = arcs.num_donors
+        pair_steps = arcs.pair_steps
+        store = self.store
+        parents = store.parents
+        patients = store.patients
+        donors = store.donors
+        columns = [[] for table in tables]
+        funs = zip(aggregates, tables, columns)
+        for i in xrange(len(parents)):
+            parent = parents[i]
+            if parent < 0:
+                steps = self._steps(store.roots[-1 - parent])
+                for (reduce, extend), table, column in funs:
+                    column.append(reduce([table[step] for step in steps]))
+                continue
+            step = pair_steps[((patients[parent] * num_donors + donors[parent]) *
+                               num_patients + patients[i]) * num_donors + donors[i]]
+            for (reduce, extend), table, column in funs:
+                column.append(extend(column[parent], table[step]))
+        return columns
+
+    def ndd_backarcs(self):
+        "For chains, whether the NDD has an arc to the last patient"
+        return self._cached("ndd_backarcs", self._calc_ndd_backarcs)
+
+    def _calc_ndd_backarcs(self):
+        compact = self.compact
+        ndd_edge_ndds = compact.ndd_edge_ndds
+        ndd_has_arc = compact.ndd_has_arc
+        if not self._is_tree():
+            return [ndd_has_arc(ndd_edge_ndds[members[0]], members[-2])
+                    for members in self.store]
+        store = self.store
+        parents = store.parents
+        patients = store.patients
+        ndds = array('i')
+        result = []
+        for i in xrange(len(parents)):
+            parent = parents[i]
+            if parent < 0:
+                members = store.roots[-1 - parent]
+                ndd = ndd_edge_ndds[members[0]]
+            else:
+                ndd = ndds[parent]
+            ndds.append(ndd)
+            result.append(ndd_has_arc(ndd, patients[i]))
+        return result
+
+def criterion_columns(opt_criteria, compact, store, is_chain, factory):
+    """Returns, for each criterion, the list of integer scores of the cycles or
+    chains in store.
+
+    Criteria whose chain_column or cycle_column method returns None are
+    evaluated one structure at a time, on objects created by factory.
+    """
+    features = StructureFeatures(compact, store, is_chain)
+    features.prepare([aggregate for oc in opt_criteria
+                                for aggregate in oc.arc_aggregates(is_chain)])
+    columns = []
+    for oc in opt_criteria:
+        values = oc.chain_column(features) if is_chain else oc.cycle_column(features)
+        if values is None:
+            if is_chain:
+                values = [oc.chain_val(factory(members, -1)) for members in store]
+            else:
+                values = [oc.cycle_val(factory(members, -1)) for members in store]
+        columns.append(int_column(oc, values))
+    return columns
+
+def _fits_in_int64(columns, total_shifts):
+    bound = 0
+    for column, shift in izip(columns, total_shifts):
+        if column:
+            bound += max(abs(min(column)), abs(max(column))) << shift
+    return bound < INT64_LIMIT
+
+def pack_hier_scores(columns, bit_shifts):
+    """Compresses the criterion scores of every node into hierarchical scores.
+
+    The result for node i is the same as shifting left by bit_shifts[k] after
+    adding columns[k][i], for each k in turn. NumPy is used when it is
+    available and every result fits in 64 bits, and Python ints otherwise.
+    """
+    num_nodes = len(columns[0]) if columns else 0
+    num_columns = min(len(columns), len(bit_shifts))
+    columns = columns[:num_columns]
+    if num_columns == 0:
+        return [0] * num_nodes
+    # total_shifts[k] is how far column k is shifted in the result
+    total_shifts = [sum(bit_shifts[k:num_columns]) for k in range(num_columns)]
+
+    if numpy is not None and _fits_in_int64(columns, total_shifts):
+        packed = numpy.zeros(num_nodes, dtype=numpy.int64)
+        for column, shift in izip(columns, total_shifts):
+            packed += numpy.array(column, dtype=numpy.int64) << shift
+        return packed.tolist()
+
+    packed = [0] * num_nodes
+    for column, shift in izip(columns, total_shifts):
+        packed = [p + (score << shift) for p, score in izip(packed, column)]
+    return packed
@@ -0,0 +1,184 @@
+"""Estimate the size of an instance before building it.
+
+Cycles and chains are counted by a search that stores none of them, and the
+number of conflict edges is bounded by summing the sizes of the cliques of
+nodes that share a patient, a paired donor or an NDD: a clique of c nodes
+has c(c-1)/2 edges, and an edge is counted once for each member its two
+nodes share. From these counts, the memory of a run and the size of its
+output are projected, using the sizes of CPython 2 objects on a 64-bit
+platform. The projections are approximate, and are meant for choosing
+length limits or a machine before a run rather than for exact accounting.
+"""
+
+import math
+from array import array
+from instrumentation import peak_rss_kb
+
+# Bytes taken by each part of the stored instance
+STORE_VALUE_BYTES = 4     # an element of a StructureStore's values
+STORE_OFFSET_BYTES = 8    # an element of a StructureStore's offsets
+LIST_SLOT_BYTES = 8       # a pointer in a list
+INT_BYTES = 24            # a Python int or float
+LONG_BYTES = 24           # a Python long, other than its digits
+LONG_DIGIT_BITS = 30      # bits held by each four-byte digit of a long
+STR_BYTES = 37            # a Python str, other than its characters
+
+def _digits(x):
+    return len(str(x))
+
+def total_index_digits(n):
+    "The total number of decimal digits of the integers 1..n"
+    total = 0
+    low = 1
+    while low <= n:
+        high = min(n, low * 10 - 1)
+        total += (high - low + 1) * _digits(low)
+        low *= 10
+    return total
+
+def _long_bytes(bits):
+    return LONG_BYTES + 4 * int(math.ceil(bits / float(LONG_DIGIT_BITS)))
+
+def _mean_digits(ids):
+    return sum(_digits(x) for x in ids) / float(len(ids)) if ids else 1.0
+
+class SizeEstimate(object):
+    def __init__(self, pool, max_cycle, max_chain):
+        if pool.compact is None:
+            pool.build_indices()
+        compact = pool.compact
+        self.max_cycle = max_cycle
+        self.max_chain = max_chain
+
+        # The number of nodes containing each patient, paired donor and NDD.
+        # Each NDD is also in the node for leaving it unused.
+        self.patient_counts = array('l', [0] * compact.num_patients)
+        self.donor_counts = array('l', [0] * compact.num_donors)
+        self.ndd_counts = array('l', [1] * compact.num_ndds)
+
+        # cycle_counts[k] and chain_counts[k] are the numbers of cycles and
+        # chains of k pairs
+        self.chain_counts = compact.count_chains(max_chain, self.patient_counts,
+                                                 self.donor_counts, self.ndd_counts)
+        self.cycle_counts = compact.count_cycles(max_cycle, self.patient_counts,
+                                                 self.donor_counts)
+
+        # The mean length of a patient-donor pair and an NDD in node descriptions
+        self.pair_chars = 4 + (_mean_digits([p.nhs_id for p in pool.patients]) +
+                               _mean_digits([d.nhs_id for d in pool.paired_donors]))
+        self.ndd_chars = _mean_digits([n.nhs_id for n in pool.altruists])
+
+    @property
+    def num_cycles(self):
+        return sum(self.cycle_counts)
+
+    @property
+    def num_chains(self):
+        return sum(self.chain_counts)
+
+    @property
+    def num_ndds(self):
+        return len(self.ndd_counts)
+
+    @property
+    def num_nodes(self):
+        return self.num_chains + self.num_cycles + self.num_ndds
+
+    @property
+    def num_pairs(self):
+        "The total number of patient-donor pairs in all cycles and chains"
+        return sum(k * count for counts in [self.cycle_counts, self.chain_counts]
+                             for k, count in enumerate(counts))
+
+    @property
+    def num_memberships(self):
+        "The total size of the cliques of the conflict graph"
+        return sum(self.patient_counts) + sum(self.donor_counts) + sum(self.ndd_counts)
+
+    def max_edges(self):
+        "An upper bound on the number of edges of the conflict graph"
+        n = self.num_nodes
+        total = sum(c * (c - 1) / 2 for counts in [self.patient_counts, self.donor_counts,
+                                                   self.ndd_counts]
+                                    for c in counts)
+        return min(total, n * (n - 1) / 2)
+
+    def description_chars(self):
+        "The total length of the node descriptions"
+        return int(self.num_pairs * self.pair_chars +
+                   (self.num_chains + self.num_ndds) * (self.ndd_chars + 1))
+
+    def memory_bytes(self, num_criteria, graph_copies=1):
+        """Returns (name, bytes) for each part of the memory of a run that grows
+        with the instance, and its total.
+        param graph_copies: 2 if the graph is reduced, which works on a copy"""
+        n = self.num_nodes
+        cycle_pairs = sum(k * count for k, count in enumerate(self.cycle_counts))
+        # A chain in a ChainStore takes three values, and a chain of one pair,
+        # which is a root, also takes an explicit tuple of three values
+        num_roots = self.chain_counts[1] if len(self.chain_counts) > 1 else 0
+        parts = [
+            ("structures", STORE_VALUE_BYTES * (2 * cycle_pairs + 3 * self.num_chains +
+                                                3 * num_roots) +
+                           STORE_OFFSET_BYTES * (self.num_cycles + num_roots + 2)),
+            ("node lists", LIST_SLOT_BYTES * self.num_memberships + INT_BYTES * n),
+            ("scores", num_criteria * n * (LIST_SLOT_BYTES + INT_BYTES)),
+            ("descriptions", n * (LIST_SLOT_BYTES + STR_BYTES) + self.description_chars()),
+            # Each row of the graph is a bitset as wide as its highest neighbour,
+            # which is taken to be the last node
+            ("conflict graph", graph_copies * n * (LIST_SLOT_BYTES + _long_bytes(n)))]
+        return parts, sum(size for name, size in parts)
+
+    def dimacs_bytes(self, score_bits, num_edges=None, invert_edges=False):
+        """The approximate size of the DIMACS instance, given the number of bits
+        of the largest hierarchical score"""
+        n = self.num_nodes
+        if num_edges is None:
+            num_edges = self.max_edges()
+        if invert_edges:
+            num_edges = n * (n - 1) / 2 - num_edges
+        index_digits = total_index_digits(n)
+        mean_index_digits = index_digits / float(n) if n else 0
+        score_digits = int(math.ceil(score_bits * math.log10(2))) + 1
+        comments = (4 * n + index_digits + self.description_chars() +
+                    (n * (3 * n + 1) if n < 30 else 0))
+        edges = num_edges * (4 + 2 * mean_index_digits)
+        scores = n * 4 + index_digits + n * score_digits
+        return int(comments + len("p edge {} {}\n".format(n, num_edges)) + edges + scores)
+
+    def binary_bytes(self, score_bits, num_edges=None, invert_edges=False):
+        "The approximate size of the instance in the binary_instance format"
+        n = self.num_nodes
+        if num_edges is None:
+            num_edges = self.max_edges()
+        if invert_edges:
+            num_edges = n * (n - 1) / 2 - num_edges
+        score_bytes = int(math.ceil(score_bits / 8.0))
+        return (20 + 4 * (n + 1) + 8 * num_edges + n * (4 + score_bytes) +
+                4 * n + self.description_chars())
+
+    def report_lines(self, num_criteria, score_bits, reduce=False, invert_edges=False):
+        """A summary of the estimate, as lines without newlines. The memory total
+        includes the current peak RSS, which covers the interpreter and the pool."""
+        lines = []
+        for kind, counts in [("cycles", self.cycle_counts), ("chains", self.chain_counts)]:
+            lines.append("{} {}".format(kind, sum(counts)))
+            for k, count in enumerate(counts):
+                if count:
+                    lines.append("{} of length {} {}".format(kind, k, count))
+        lines.append("nodes {}".format(self.num_nodes))
+        lines.append("edges at most {}".format(self.max_edges()))
+        parts, total = self.memory_bytes(num_criteria, 2 if reduce else 1)
+        for name, size in parts:
+            lines.append("memory {} {:.1f} MB".format(name, size / 1e6))
+        current_kb = peak_rss_kb()
+        if current_kb is not None:
+            total += current_kb * 1024
+            lines.append("memory pool and interpreter {:.1f} MB".format(
+                    current_kb * 1024 / 1e6))
+        lines.append("memory total {:.1f} MB".format(total / 1e6))
+        lines.append("output dimacs {:.1f} MB".format(
+                self.dimacs_bytes(score_bits, invert_edges=invert_edges) / 1e6))
+        lines.append("output binary {:.1f} MB".format(
+                self.binary_bytes(score_bits, invert_edges=invert_edges) / 1e6))
+        return lines
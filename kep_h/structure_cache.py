@@ -0,0 +1,207 @@
+"""An on-disk cache of the cycles and chains enumerated for a pool.
+
+The enumerated structures depend only on the pool and the maximum cycle and
+chain lengths, not on the optimality criteria or bit shifts, so a sweep over
+criteria can reuse them. Entries are keyed by a hash of the pool file and
+the two length limits. Each entry is a file in the cache directory,
+consisting of:
+
+  - a header: the 8-byte magic string MAGIC, then uint32 fields for the format
+    version, the number of chains, the number of cycles, and the lengths of
+    the chains' and the cycles' value arrays;
+  - the chains' StructureStore: its offsets as uint32s, then its values as
+    int32s;
+  - the cycles' StructureStore, in the same form.
+
+All values are little-endian and four bytes wide, so each array starts at a
+four-byte boundary and can be memory-mapped by other tools. When the files in
+the directory exceed the size limit, the least recently used are deleted.
+
+Chains are held in memory as a ChainStore, and are written and read a
+block at a time, so that the full index tuples of all chains are never held
+at once.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from compact_pool import StructureStore, ChainStore
+from binary_instance import UINT32_TYPECODE, UINT32_MAX
+
+MAGIC = "KEPSTRC\0"
+VERSION = 1
+
+HEADER = struct.Struct("<8sIIIII")
+
+SUFFIX = ".kcs"
+
+# The default size limit of a cache directory, in bytes
+DEFAULT_MAX_BYTES = 1 << 30
+
+# The number of chains written or read at a time
+CHAIN_BLOCK_SIZE = 4096
+
+def cache_key(pool_file, max_cycle, max_chain):
+    """A key for the structures of the pool in the file named pool_file. The
+    key is a hash of the file's contents, since pool_reader numbers patients
+    and donors in the order in which they appear in the file."""
+    digest = hashlib.sha1("{}:{}:{}:".format(VERSION, max_cycle, max_chain))
+    with open(pool_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), ""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _to_file_order(arr):
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+def _read_array(typecode, buf, pos, length):
+    # Returns the array of length items at byte pos of buf, and the position after it
+    arr = array(typecode)
+    arr.fromstring(buf[pos:pos + arr.itemsize * length])
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr, pos + arr.itemsize * length
+
+def _read_store(buf, pos, num_structures, num_values):
+    store = StructureStore()
+    offsets, pos = _read_array(UINT32_TYPECODE, buf, pos, num_structures + 1)
+    store.offsets = array('l', offsets)
+    store.values, pos = _read_array('i', buf, pos, num_values)
+    return store, pos
+
+def _read_chains(buf, pos, num_chains, num_values):
+    # As _read_store, but returns a ChainStore, reading CHAIN_BLOCK_SIZE
+    # chains' values at a time
+    chains = ChainStore()
+    offsets, pos = _read_array(UINT32_TYPECODE, buf, pos, num_chains + 1)
+    for start in xrange(0, num_chains, CHAIN_BLOCK_SIZE):
+        end = min(start + CHAIN_BLOCK_SIZE, num_chains)
+        base = offsets[start]
+        values, _ = _read_array('i', buf, pos + 4 * base, offsets[end] - base)
+        for i in xrange(start, end):
+            chains.append(values[offsets[i] - base:offsets[i+1] - base])
+    return chains, pos + 4 * num_values
+
+def _write_store(out, store):
+    if isinstance(store, StructureStore):
+        out.write(_to_file_order(array(UINT32_TYPECODE, store.offsets)))
+        out.write(_to_file_order(store.values))
+        return
+    offsets = array(UINT32_TYPECODE, [0])
+    for length in store.lengths():
+        offsets.append(offsets[-1] + length)
+    out.write(_to_file_order(offsets))
+    for start in xrange(0, len(store), CHAIN_BLOCK_SIZE):
+        values = array('i')
+        for i in xrange(start, min(start + CHAIN_BLOCK_SIZE, len(store))):
+            values.extend(store[i])
+        out.write(_to_file_order(values))
+
+def _num_values(store):
+    if isinstance(store, StructureStore):
+        return len(store.values)
+    return sum(store.lengths())
+
+class StructureCache(object):
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def load(self, key):
+        """Returns the (chains, cycles) stored under key, as a ChainStore and a
+        StructureStore, or None if there is no valid entry"""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < HEADER.size:
+                    return None
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    result = self._read(buf)
+                finally:
+                    buf.close()
+        except (IOError, OSError):
+            return None
+        if result is not None:
+            # The modification time records when the entry was last used
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+        return result
+
+    def _read(self, buf):
+        magic, version, num_chains, num_cycles, num_chain_values, num_cycle_values = \
+                HEADER.unpack_from(buf, 0)
+        expected_size = HEADER.size + 4 * (num_chains + num_cycles + 2 +
+                                           num_chain_values + num_cycle_values)
+        if magic != MAGIC or version != VERSION or len(buf) != expected_size:
+            return None
+        chains, pos = _read_chains(buf, HEADER.size, num_chains, num_chain_values)
+        cycles, pos = _read_store(buf, pos, num_cycles, num_cycle_values)
+        return chains, cycles
+
+    def save(self, key, chains, cycles):
+        """Store the chains and cycles under key, and evict old entries if the
+        directory is over its size limit. Returns False if the structures are
+        too large for the file format."""
+        num_chain_values = _num_values(chains)
+        if num_chain_values > UINT32_MAX or len(cycles.values) > UINT32_MAX:
+            return False
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # The entry is written to a temporary file and renamed, so that a
+        # concurrent reader never sees a partial entry
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(HEADER.pack(MAGIC, VERSION, len(chains), len(cycles),
+                                      num_chain_values, len(cycles.values)))
+                _write_store(out, chains)
+                _write_store(out, cycles)
+            os.rename(temp_path, self.path(key))
+        except:
+            os.remove(temp_path)
+            raise
+        self.evict(keep=key)
+        return True
+
+    def entries(self):
+        "A list of (last use time, size, path) for each entry, oldest first"
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        # Delete the least recently used entries, other than that of key keep,
+        # until the directory is within its size limit
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        keep_path = None if keep is None else self.path(keep)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path != keep_path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
@@ -0,0 +1,45 @@
+"""Configurations for running one pool with several criteria, bit shifts and
+node orders.
+
+A sweep file has one configuration per line: a colon-separated list of
+optimality criteria, a colon-separated list of bit shifts, and optionally a
+node order, separated by whitespace, as in
+
+    effective:size:backarc:weight 7:6:36
+    effective:size:backarc:weight 7:6:36 3
+    size:weight 8
+
+Blank lines and lines beginning with # are ignored.
+"""
+
+from kep_h_pool_optimiser import OptimisationException
+from optimality_criteria import get_criteria
+
+def parse_shifts(input):
+    return [int(s) for s in input.split(":")] + [0]
+
+class SweepConfig(object):
+    def __init__(self, criteria, bit_shifts, node_order=0):
+        # param criteria: a list of OptCriterion
+        # param bit_shifts: as returned by parse_shifts, with one element per criterion
+        if len(criteria) != len(bit_shifts):
+            raise OptimisationException(
+                    "Length of shifts must be one less than length of optimality criteria.")
+        self.criteria = criteria
+        self.bit_shifts = bit_shifts
+        self.node_order = node_order
+
+def read_sweep_configs(lines):
+    configs = []
+    for line_number, line in enumerate(lines):
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        if len(fields) not in [2, 3]:
+            raise OptimisationException(
+                    "Sweep line {}: expected criteria, shifts and an optional node order".format(
+                            line_number + 1))
+        node_order = int(fields[2]) if len(fields) == 3 else 0
+        configs.append(SweepConfig(get_criteria(fields[0]), parse_shifts(fields[1]),
+                                   node_order))
+    return configs
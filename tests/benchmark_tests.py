@@ -0,0 +1,42 @@
+from nose.tools import *
+import copy
+from kep_h.benchmark import *
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def test_parse_limits():
+    assert_equal(parse_limits("3:3,4:2"), [(3, 3), (4, 2)])
+
+def test_run_case():
+    result = run_case(BenchmarkCase("tiny", 20, 2, 3, 2))
+    assert_equal(result["name"], "tiny-c3-n2")
+    for stage in ["read pool", "find cycles", "conflict graph", "reduce nodes",
+                  "write instance"]:
+        assert stage in result["stages"]
+    assert result["counters"]["nodes"] > 0
+    assert_equal(run_case(BenchmarkCase("tiny", 20, 2, 3, 2))["counters"], result["counters"])
+
+def make_result(name, seconds, read_seconds, peak_rss_kb, nodes=100):
+    return {"name": name, "seconds": seconds, "stages": {"read pool": read_seconds},
+            "counters": {"chains": 10, "cycles": 90, "nodes": nodes, "edges": 1000},
+            "peak_rss_kb": peak_rss_kb}
+
+def test_compare_results():
+    baseline = [make_result("a", 1.0, 0.5, 100000), make_result("b", 1.0, 0.5, 100000)]
+    assert_equal(compare_results(copy.deepcopy(baseline), baseline), [])
+    # Small changes, and cases missing from the baseline, are not regressions
+    results = [make_result("a", 1.2, 0.52, 110000), make_result("c", 100.0, 50.0, 10**7)]
+    assert_equal(compare_results(results, baseline), [])
+
+    regressions = compare_results([make_result("a", 2.0, 0.5, 100000)], baseline)
+    assert_equal(len(regressions), 1)
+    assert "total time" in regressions[0]
+    regressions = compare_results([make_result("b", 1.0, 1.5, 200000)], baseline)
+    assert_equal(len(regressions), 2)
+    regressions = compare_results([make_result("b", 1.0, 0.5, 100000, 101)], baseline)
+    assert_equal(len(regressions), 1)
+    assert "nodes" in regressions[0]
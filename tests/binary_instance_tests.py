@@ -0,0 +1,77 @@
+from nose.tools import *
+import os
+import tempfile
+from kep_h.conflict_graph import ConflictGraph
+from kep_h.binary_instance import *
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def write_and_read(graph, hier_scores, descriptions, invert_edges=False):
+    fd, filename = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_binary(f, graph, hier_scores, descriptions, invert_edges)
+        inst = read_binary(filename)
+        result = (inst.num_nodes, inst.num_edges, list(inst.edges()),
+                  inst.hier_scores, inst.descriptions, inst.inverted)
+        inst.close()
+        return result
+    finally:
+        os.remove(filename)
+
+def test_round_trip():
+    graph = ConflictGraph(4)
+    graph.add_clique([0, 1, 3])
+    hier_scores = [0, 1 << 100, -5, 123456789]
+    descriptions = ["6", "(1,1) (2,2)", "(3,3)", ""]
+    num_nodes, num_edges, edges, scores, descs, inverted = write_and_read(
+            graph, hier_scores, descriptions)
+    assert_equal(num_nodes, 4)
+    assert_equal(num_edges, 3)
+    assert_equal(edges, [(0, 1), (0, 3), (1, 3)])
+    assert_equal(scores, hier_scores)
+    assert_equal(descs, descriptions)
+    assert not inverted
+
+def test_inverted():
+    graph = ConflictGraph(3)
+    graph.add_edge(0, 1)
+    num_nodes, num_edges, edges, scores, descs, inverted = write_and_read(
+            graph, [1, 2, 3], None, invert_edges=True)
+    assert_equal(num_edges, 2)
+    assert_equal(edges, [(0, 2), (1, 2)])
+    assert_equal(descs, None)
+    assert inverted
+
+@raises(BinaryInstanceException)
+def test_bad_magic():
+    fd, filename = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write("not an instance at all")
+        read_binary(filename)
+    finally:
+        os.remove(filename)
+
+def test_truncated_files():
+    graph = ConflictGraph(3)
+    graph.add_clique([0, 1, 2])
+    fd, filename = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_binary(f, graph, [1, 2, 3], [u"a", u"b", u"c"])
+        with open(filename, "rb") as f:
+            contents = f.read()
+        # Cut the file off inside the offsets, the neighbour array, the scores
+        # and the descriptions
+        for end in [HEADER.size + 2, HEADER.size + 20, HEADER.size + 45,
+                    len(contents) - 1]:
+            with open(filename, "wb") as f:
+                f.write(contents[:end])
+            assert_raises(ValueError, read_binary, filename)
+    finally:
+        os.remove(filename)
@@ -0,0 +1,81 @@
+from nose.tools import *
+import sys
+from StringIO import StringIO
+from kep_h.check_solution import *
+from kep_h.kep_h_pool_optimiser import PoolOptimiser
+from kep_h.optimality_criteria import get_criteria
+from kep_h import pool_reader
+from tests.helpers import read_tiny_pool
+
+CRITERIA = "effective:size:backarc:weight"
+SHIFTS = [7, 6, 36, 0]
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def check(lines, max_cycle=None, max_chain=None):
+    checker = SolutionChecker(read_tiny_pool(), max_cycle, max_chain)
+    checker.check_lines(lines)
+    return checker
+
+def test_score_matches_solver():
+    optimiser = PoolOptimiser(read_tiny_pool(), get_criteria(CRITERIA), 3, 3)
+    out = StringIO()
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+    try:
+        optimiser.solve(False, False, 0, SHIFTS, out, "solution")
+        reported = sys.stderr.getvalue()
+    finally:
+        sys.stderr = stderr
+    checker = check(StringIO(out.getvalue()), 3, 3)
+    assert_equal(len(checker.cycles), 2)
+    assert_equal(len(checker.chains), 1)
+    assert_equal(checker.n_transplants(), 7)
+    score = checker.hier_score(get_criteria(CRITERIA), SHIFTS)
+    assert reported.startswith("Score {} ".format(score))
+
+def test_unused_ndd_is_scored():
+    checker = check(["c 3 (1,1) (3,3)\n"])
+    assert_equal(checker.unused_ndds()[0].nhs_id, 6)
+    columns = checker.criterion_columns(get_criteria("size"))
+    assert_equal(columns, [[2, 1]])
+
+def test_one_pair_cycle():
+    # Donor 1 matches their own patient, and the solver uses that 1-pair cycle
+    text = ('{"data": {"1": {"dage": 40, "sources": [1], "matches": [{"recipient": 1, "score": 5}]},'
+            ' "2": {"dage": 40, "sources": [2], "matches": [{"recipient": 1, "score": 1}]}}}')
+    optimiser = PoolOptimiser(pool_reader.read_file(StringIO(text)), get_criteria("size"), 3, 3)
+    out = StringIO()
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+    try:
+        optimiser.solve(False, False, 0, [0], out, "solution")
+    finally:
+        sys.stderr = stderr
+    assert_equal(out.getvalue().split(), ["c", "1", "(1,1)"])
+    checker = SolutionChecker(pool_reader.read_file(StringIO(text)), 3, 3)
+    checker.check_lines(StringIO(out.getvalue()))
+    assert_equal(len(checker.cycles), 1)
+    assert_equal(checker.n_transplants(), 1)
+
+def assert_infeasible(lines, message, max_cycle=None, max_chain=None):
+    try:
+        check(lines, max_cycle, max_chain)
+    except SolutionException as e:
+        assert message in str(e), str(e)
+    else:
+        assert False, "No SolutionException"
+
+def test_infeasible_solutions():
+    assert_infeasible(["c 1 (1,1) (3,3)\n", "c 2 (1,1) (2,2)\n"], "Line 2: Patient 1 is used twice")
+    assert_infeasible(["c 1 (1,1) (5,5)\n"], "Donor 1 has no arc to patient 5")
+    assert_infeasible(["c 1 (1,1)\n"], "Donor 1 has no arc to patient 1")
+    assert_infeasible(["c 1 (1,2) (2,1)\n"], "Donor 2 is not paired with patient 1")
+    assert_infeasible(["c 1 6 (1,1)\n"], "NDD 6 has no arc to patient 1")
+    assert_infeasible(["c 1 (9,9) (2,2)\n"], "No patient with ID 9")
+    assert_infeasible(["c 1 (2,2) (5,5) (4,4)\n"], "longer than 2", max_cycle=2)
+    assert_infeasible(["c 1 (2,2) (5,5\n"], "Not a patient-donor pair")
@@ -0,0 +1,197 @@
+from nose.tools import *
+import random
+from kep_h import pool_reader, scoring
+from kep_h.pool_generator import generate_pool
+from kep_h.kep_h_pool import *
+from kep_h.compact_pool import *
+from tests.helpers import random_pool
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def test_structure_store():
+    store = StructureStore()
+    store.append([1, 2])
+    store.append([3, 4, 5, 6])
+    store.append([])
+    assert_equal(len(store), 3)
+    assert_equal(store[1], (3, 4, 5, 6))
+    assert_equal(store[-1], ())
+    assert_equal(list(store), [(1, 2), (3, 4, 5, 6), ()])
+
+def three_pair_pool():
+    # Patients 0, 1 and 2 with donors 0, 1 and 2, arcs 0->1->2->0 and
+    # 1->0, and an NDD with an arc to patient 1
+    pool = Pool()
+    pool.patients.extend([Patient(10+i, i) for i in range(3)])
+    pool.paired_donors.extend([PairedDonor(50, 20+i) for i in range(3)])
+    for patient, donor in zip(pool.patients, pool.paired_donors):
+        pool.associate_patient_with_donor(patient, donor)
+    for i, j in [(0, 1), (1, 2), (2, 0), (1, 0)]:
+        pool.paired_donors[i].edges_out.append(DonorPatientMatch(pool.patients[j], 1))
+    altruist = Altruist(40, 30)
+    altruist.edges.append(AltruistEdge(altruist, pool.patients[1], 1))
+    pool.altruists.append(altruist)
+    pool.build_indices()
+    return pool
+
+def test_compact_enumeration():
+    pool = three_pair_pool()
+    compact = pool.compact
+    assert_equal(list(compact.find_cycles(3)), [(0, 0, 1, 1), (0, 0, 1, 1, 2, 2)])
+    assert_equal(list(compact.find_cycles(2)), [(0, 0, 1, 1)])
+    assert_equal(list(compact.find_chains(2)), [(0, 1, 1), (0, 1, 1, 2, 2), (0, 1, 1, 0, 0)])
+
+def test_structure_list():
+    pool = three_pair_pool()
+    chains = StructureList(pool.compact.find_chains(3), pool.make_chain)
+    assert_equal(len(chains), 4)
+    chain = chains[2]
+    assert_equal(chain.index, 3)
+    assert chain.altruist_edge is pool.altruists[0].edges[0]
+    assert_equal([pd_pair.patient.nhs_id for pd_pair in chain.pd_pairs], [11, 12, 10])
+
+def test_iterators_match_stores():
+    pool = three_pair_pool()
+    compact = pool.compact
+    for max_length in range(4):
+        assert_equal(list(compact.iter_cycles(max_length)), list(compact.find_cycles(max_length)))
+        assert_equal(list(compact.iter_chains(max_length)), list(compact.find_chains(max_length)))
+    assert_equal([c.index for c in pool.iter_cycles(3)], [1, 2])
+    assert_equal([len(c.pd_pairs) for c in pool.iter_chains(3)], [1, 2, 3, 2])
+
+def test_long_chain_is_not_recursive():
+    # A chain much longer than the recursion limit
+    n = 3000
+    pool = Pool()
+    pool.patients.extend([Patient(i, i) for i in range(n)])
+    pool.paired_donors.extend([PairedDonor(50, i) for i in range(n)])
+    for i in range(n):
+        pool.associate_patient_with_donor(pool.patients[i], pool.paired_donors[i])
+        if i+1 < n:
+            pool.paired_donors[i].edges_out.append(DonorPatientMatch(pool.patients[i+1], 1))
+    altruist = Altruist(40, n)
+    altruist.edges.append(AltruistEdge(altruist, pool.patients[0], 1))
+    pool.altruists.append(altruist)
+    pool.build_indices()
+    chains = pool.compact.find_chains(n)
+    assert_equal(len(chains), n)
+    assert_equal(len(chains[-1]), 2*n + 1)
+
+def unpruned_cycles(compact, max_length):
+    # A plain depth-first search with no distance-based pruning
+    cycles = []
+    def extend(path):
+        if compact.has_arc(path[-1], path[0]):
+            cycles.append(tuple(path))
+        if len(path) < 2 * max_length:
+            for patient in compact.donor_targets(path[-1]):
+                if (compact.patient_index[patient] > compact.patient_index[path[0]]
+                        and patient not in path[0::2]):
+                    for donor in compact.donors_of(patient):
+                        if donor not in path[1::2]:
+                            extend(path + [patient, donor])
+    for patient in range(compact.num_patients):
+        for donor in compact.donors_of(patient):
+            extend([patient, donor])
+    return cycles
+
+def test_pruned_cycle_search():
+    for seed in range(5):
+        compact = random_pool(random.Random(seed), 12, 0, 0.15).compact
+        for max_length in range(6):
+            assert_equal(list(compact.iter_cycles(max_length)),
+                         unpruned_cycles(compact, max_length))
+
+def test_distances_to():
+    pool = three_pair_pool()
+    assert_equal(pool.compact.distances_to(0, 5), {0: 0, 1: 1, 2: 1})
+    assert_equal(pool.compact.distances_to(0, 0), {0: 0})
+    assert_equal(pool.compact.distances_to(1, 5), {1: 0})
+
+def test_patients_of():
+    compact = random_pool(random.Random(0), 12, 0, 0.15).compact
+    for d in range(compact.num_donors):
+        assert_equal(list(compact.patients_of(d)),
+                     [p for p in range(compact.num_patients) if d in compact.donors_of(p)])
+
+def test_chain_store():
+    store = ChainStore()
+    chains = [(0, 1, 1), (0, 1, 1, 2, 2), (0, 1, 1, 2, 2, 3, 3), (0, 1, 1, 4, 4),
+              (2, 5, 5, 6, 6), (1, 0, 0)]
+    for members in chains:
+        store.append(members)
+    assert_equal(list(store), chains)
+    assert_equal(store[-2], (2, 5, 5, 6, 6))
+    assert_equal(list(store.lengths()), [3, 5, 7, 5, 5, 3])
+    # Only the chains whose parents were not found are stored as tuples
+    assert_equal(list(store.roots), [(0, 1, 1), (2, 5, 5, 6, 6), (1, 0, 0)])
+    assert_equal(list(store.parents[:4]), [-1, 0, 1, 0])
+    kept = store.without([1, 4])
+    assert_equal(list(kept), [chains[0], chains[2], chains[3], chains[5]])
+    assert_equal(len(kept.roots), 3)
+
+def test_chains_are_stored_by_parent():
+    for pool in [three_pair_pool(), pool_reader.read(generate_pool(20, 3, 2)["data"])]:
+        pool.build_indices()
+        for max_length in range(5):
+            chains = pool.compact.find_chains(max_length)
+            assert_equal(list(chains), list(pool.compact.iter_chains(max_length)))
+            # Only the chains of one pair are stored as tuples
+            assert all(len(members) == 3 for members in chains.roots)
+
+def test_inserted():
+    store = ChainStore()
+    for members in [(0, 1, 1), (0, 1, 1, 2, 2), (2, 5, 5)]:
+        store.append(members)
+    new_chains = [(0, 1, 1, 3, 3), (1, 0, 0)]
+    positions = insertion_positions(store, new_chains, lambda members: members)
+    assert_equal(positions, [2, 2])
+    assert_equal(list(store.inserted(positions, new_chains)),
+                 [(0, 1, 1), (0, 1, 1, 2, 2), (0, 1, 1, 3, 3), (1, 0, 0), (2, 5, 5)])
+    cycles = StructureStore()
+    cycles.append([0, 0, 1, 1])
+    assert_equal(list(cycles.inserted([0, 1], [(0, 0), (2, 2)])),
+                 [(0, 0), (0, 0, 1, 1), (2, 2)])
+
+def test_keys_follow_enumeration_order():
+    pool = pool_reader.read(generate_pool(20, 3, 2)["data"])
+    pool.build_indices()
+    compact = pool.compact
+    cycles = list(compact.iter_cycles(3))
+    assert_equal(sorted(cycles, key=compact.cycle_key), cycles)
+    chains = list(compact.iter_chains(3))
+    assert_equal(sorted(chains, key=compact.chain_key), chains)
+
+def test_changes_match_rebuild():
+    pool = three_pair_pool()
+    compact = pool.compact
+    scoring.get_arc_values(compact)
+    patients = pool.patients
+    donors = pool.paired_donors
+    altruist = Altruist(45, 31)
+    altruist.edges.append(AltruistEdge(altruist, patients[2], 3))
+    changes = [lambda: pool.add_arc(donors[2], patients[1], 4),
+               lambda: pool.remove_arc(donors[1], patients[0]),
+               lambda: pool.add_altruist(altruist),
+               lambda: pool.add_altruist_edge(pool.altruists[0], patients[0], 2),
+               lambda: pool.remove_altruist_edge(pool.altruists[0], patients[1]),
+               lambda: pool.remove_altruist(pool.altruists[0])]
+    for change in changes:
+        change()
+        rebuilt = CompactPool(pool)
+        for name, value in vars(rebuilt).iteritems():
+            if name != "arc_values":
+                assert_equal(getattr(compact, name), value)
+        # Each step that is still in use has the same values as in new ArcValues
+        arcs = compact.arc_values
+        new_arcs = scoring.ArcValues(rebuilt)
+        for steps, new_steps in [(arcs.pair_steps, new_arcs.pair_steps),
+                                 (arcs.ndd_steps, new_arcs.ndd_steps)]:
+            assert_equal(sorted(steps), sorted(new_steps))
+            for key, step in steps.iteritems():
+                for name in ["score", "backarc"]:
+                    assert_equal(arcs.values(name)[step], new_arcs.values(name)[new_steps[key]])
@@ -0,0 +1,99 @@
+from nose.tools import *
+import random
+from kep_h.conflict_graph import *
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def test_empty_graph():
+    graph = ConflictGraph(4)
+    assert_equal(len(graph), 4)
+    assert_equal(graph.num_edges, 0)
+    assert_equal(list(graph.edges()), [])
+
+def test_add_clique():
+    graph = ConflictGraph(5)
+    graph.add_clique([0, 2, 4])
+    graph.add_clique([2, 4, 3])
+    assert_equal(graph.num_edges, 5)
+    assert graph.has_edge(0, 4)
+    assert graph.has_edge(4, 0)
+    assert not graph.has_edge(0, 3)
+    assert_equal(graph.degree(2), 3)
+    assert_equal(graph.bitset(0), (1<<2) | (1<<4))
+    assert_equal(list(graph.edges()), [(0, 2), (0, 4), (2, 3), (2, 4), (3, 4)])
+
+def test_subgraph():
+    graph = ConflictGraph(4)
+    graph.add_clique([0, 1, 2])
+    graph.add_edge(2, 3)
+    sub = graph.subgraph([3, 2, 0])
+    assert_equal(sub.num_edges, 2)
+    assert sub.has_edge(0, 1)
+    assert sub.has_edge(1, 2)
+    assert not sub.has_edge(0, 2)
+
+def test_relabel():
+    rand = random.Random(0)
+    for trial in range(200):
+        n = rand.randint(0, 80)
+        graph = ConflictGraph(n)
+        for i in range(n):
+            graph.add_clique(rand.sample(range(n), rand.randint(1, min(n, 4))))
+        # Drop a few nodes or many, and spread the rest out among new ones
+        kept = sorted(rand.sample(range(n), rand.choice([n, n - n / 10, n / 2])))
+        num_nodes = len(kept) + rand.randint(0, 20)
+        new_ids = [-1] * n
+        for v, new_id in zip(kept, sorted(rand.sample(range(num_nodes), len(kept)))):
+            new_ids[v] = new_id
+        relabelled = graph.relabel(new_ids, num_nodes)
+        assert_equal(len(relabelled), num_nodes)
+        expected = sorted((new_ids[i], new_ids[j]) for i, j in graph.edges()
+                          if new_ids[i] != -1 and new_ids[j] != -1)
+        assert_equal(list(relabelled.edges()), expected)
+        assert_equal(relabelled.num_edges, len(expected))
+
+def test_join_new_nodes():
+    graph = ConflictGraph(6)
+    graph.add_clique([0, 1, 3])
+    graph.join_new_nodes([2, 4], [[0, 1, 2, 3], [2, 4, 5], [1, 5]])
+    # No edge is added between 1 and 5, as neither is new
+    assert_equal(list(graph.edges()), [(0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3),
+                                       (2, 4), (2, 5), (4, 5)])
+    assert_equal(graph.num_edges, 9)
+
+def test_non_neighbours():
+    graph = ConflictGraph(5)
+    graph.add_clique([0, 2, 4])
+    assert_equal(graph.neighbours(2), [0, 4])
+    assert_equal(graph.non_neighbours(2), [1, 3])
+    assert_equal(list(graph.later_neighbours(2)), [4])
+    assert_equal(list(graph.later_non_neighbours(0)), [1, 3])
+
+def test_remove_node():
+    graph = ConflictGraph(4)
+    graph.add_clique([0, 1, 2])
+    graph.add_edge(2, 3)
+    graph.remove_node(2)
+    assert_equal(graph.num_edges, 1)
+    assert_equal(list(graph.edges()), [(0, 1)])
+    assert_equal(graph.degree(3), 0)
+
+def test_twin_classes():
+    graph = ConflictGraph(6)
+    graph.add_clique([0, 1, 2])
+    graph.add_clique([2, 3])
+    graph.add_clique([4, 5])
+    assert_equal(sorted(graph.twin_classes(range(6))), [[0, 1], [4, 5]])
+    assert_equal(graph.twin_classes([0, 2, 3, 4]), [])
+
+def test_components():
+    graph = ConflictGraph(7)
+    graph.add_clique([0, 3])
+    graph.add_clique([3, 5, 6])
+    graph.add_edge(1, 4)
+    assert_equal(graph.components(), [[0, 3, 5, 6], [1, 4], [2]])
+    assert_equal(ConflictGraph(0).components(), [])
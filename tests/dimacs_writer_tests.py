@@ -0,0 +1,33 @@
+from nose.tools import *
+from StringIO import StringIO
+from kep_h.conflict_graph import ConflictGraph
+from kep_h.dimacs_writer import *
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def small_instance():
+    graph = ConflictGraph(3)
+    graph.add_edge(0, 1)
+    return graph, [5, 6, 7], ["a", "b", "c"]
+
+def test_write_dimacs():
+    graph, hier_scores, descriptions = small_instance()
+    out = StringIO()
+    write_dimacs(out, graph, hier_scores, descriptions)
+    lines = out.getvalue().splitlines()
+    assert "p edge 3 1" in lines
+    assert "e 1 2" in lines
+    assert_equal([l for l in lines if l.startswith("n")], ["n 1 5", "n 2 6", "n 3 7"])
+    assert "c 3 c" in lines
+
+def test_write_dimacs_inverted():
+    graph, hier_scores, descriptions = small_instance()
+    out = StringIO()
+    write_dimacs(out, graph, hier_scores, descriptions, invert_edges=True)
+    lines = out.getvalue().splitlines()
+    assert "p edge 3 2" in lines
+    assert_equal([l for l in lines if l.startswith("e")], ["e 1 3", "e 2 3"])
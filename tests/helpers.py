@@ -0,0 +1,33 @@
+import os
+from kep_h import pool_reader
+from kep_h.kep_h_pool import Pool, Patient, PairedDonor, Altruist, AltruistEdge, \
+        DonorPatientMatch
+
+TINY_JSON = os.path.join(os.path.dirname(__file__), "..", "tiny.json")
+
+def read_tiny_pool():
+    with open(TINY_JSON) as json_file:
+        return pool_reader.read_file(json_file)
+
+def random_pool(rand, n_patients, n_ndds, density):
+    # A pool in which each patient has one or two donors, each donor has an
+    # arc to each patient with probability density, and each NDD has arcs to
+    # two patients, with ages and scores drawn from the random.Random rand
+    pool = Pool()
+    pool.patients.extend([Patient(i, i) for i in range(n_patients)])
+    for patient in pool.patients:
+        for j in range(rand.choice([1, 1, 2])):
+            donor = PairedDonor(rand.randint(20, 70), 1000 + len(pool.paired_donors))
+            pool.paired_donors.append(donor)
+            pool.associate_patient_with_donor(patient, donor)
+    for donor in pool.paired_donors:
+        for patient in pool.patients:
+            if rand.random() < density:
+                donor.edges_out.append(DonorPatientMatch(patient, rand.randint(1, 9)))
+    for i in range(n_ndds):
+        altruist = Altruist(rand.randint(20, 70), 2000 + i)
+        for patient in rand.sample(pool.patients, 2):
+            altruist.edges.append(AltruistEdge(altruist, patient, rand.randint(1, 9)))
+        pool.altruists.append(altruist)
+    pool.build_indices()
+    return pool
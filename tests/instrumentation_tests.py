@@ -0,0 +1,80 @@
+from nose.tools import *
+import json
+import os
+import pstats
+import tempfile
+from StringIO import StringIO
+from kep_h import pool_reader
+from kep_h.compact_pool import StructureStore
+from kep_h.instrumentation import *
+from kep_h.kep_h_pool_optimiser import PoolOptimiser
+from kep_h.optimality_criteria import get_criteria
+from tests.helpers import TINY_JSON
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def test_stages_and_counters():
+    stats = Stats()
+    with stats.stage("first stage"):
+        pass
+    stats.count("nodes", 3)
+    stats.add("passes", 1)
+    stats.add("passes", 2)
+    stats.count("nodes", 4)
+    assert_equal([stage.name for stage in stats.stages], ["first stage"])
+    assert_equal(stats.counters, [["nodes", 4], ["passes", 3]])
+    lines = stats.comment_lines()
+    assert lines[0].startswith("c stat stage first_stage ")
+    assert_equal(lines[1:], ["c stat count nodes 4", "c stat count passes 3"])
+    out = StringIO()
+    stats.write_json(out)
+    assert_equal(json.loads(out.getvalue())["counters"], {"nodes": 4, "passes": 3})
+
+def test_stage_recorded_on_exception():
+    stats = Stats()
+    try:
+        with stats.stage("failing"):
+            raise ValueError()
+    except ValueError:
+        pass
+    assert_equal([stage.name for stage in stats.stages], ["failing"])
+
+def test_count_lengths():
+    stats = Stats()
+    chains = StructureStore()
+    for members in [(0, 1, 1), (0, 1, 1, 2, 2), (1, 3, 3)]:
+        chains.append(members)
+    count_lengths(stats, "chains", chains, True)
+    assert_equal(stats.counters, [["chains", 3], ["chains of length 1", 2],
+                                  ["chains of length 2", 1]])
+
+def test_optimiser_stats():
+    stats = Stats()
+    with open(TINY_JSON) as json_file:
+        pool = pool_reader.read_file(json_file)
+    optimiser = PoolOptimiser(pool, get_criteria("effective:size:backarc:weight"), 3, 3,
+                              stats=stats)
+    optimiser.solve(False, True, 3, [7, 6, 36, 0], StringIO())
+    assert_equal([stage.name for stage in stats.stages],
+                 ["find chains", "chain scores", "find cycles", "cycle scores",
+                  "hierarchical scores", "conflict graph", "reduce nodes", "node order",
+                  "write instance"])
+    counters = dict(stats.counters)
+    assert_equal(counters["cycles"], 8)
+    assert_equal(counters["cycles of length 3"], 4)
+    assert_equal(counters["nodes"], 10)
+    assert_equal(counters["edges"], 23)
+    assert_equal(counters["nodes after reduce nodes"], 9)
+
+def test_run_profiled():
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        assert_equal(run_profiled(filename, sum, [1, 2, 3]), 6)
+        assert pstats.Stats(filename).total_calls > 0
+    finally:
+        os.remove(filename)
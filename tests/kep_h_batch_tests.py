@@ -0,0 +1,89 @@
+from nose.tools import *
+import csv
+import os
+import shutil
+import signal
+import tempfile
+import time
+from StringIO import StringIO
+import kep_h.kep_h_batch as batch
+from kep_h.kep_h_batch import *
+from tests.helpers import TINY_JSON
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def make_input_dir():
+    directory = tempfile.mkdtemp()
+    for name in ["a", "b"]:
+        shutil.copy(TINY_JSON, os.path.join(directory, name + ".json"))
+    with open(os.path.join(directory, "broken.json"), "w") as f:
+        f.write('{"data": ')
+    with open(os.path.join(directory, "notes.txt"), "w") as f:
+        f.write("not a pool")
+    return directory
+
+def test_find_pool_files():
+    directory = make_input_dir()
+    try:
+        files = find_pool_files([directory, os.path.join(directory, "a.*")])
+        assert_equal([os.path.basename(f) for f in files], ["a.json", "b.json", "broken.json"])
+    finally:
+        shutil.rmtree(directory)
+
+def test_batch_survives_failing_file():
+    directory = make_input_dir()
+    output_dir = tempfile.mkdtemp()
+    try:
+        options = BatchOptions("effective:size:backarc:weight", "7:6:36", 3, 3, output_dir)
+        for jobs in [1, 2]:
+            summary = StringIO()
+            num_errors = run_batch(find_pool_files([directory]), options, summary, jobs)
+            assert_equal(num_errors, 1)
+            rows = {os.path.basename(row["file"]): row
+                    for row in csv.DictReader(StringIO(summary.getvalue()))}
+            assert_equal(sorted(rows), ["a.json", "b.json", "broken.json"])
+            assert_equal(rows["broken.json"]["status"], "error")
+            for name in ["a", "b"]:
+                assert_equal(rows[name + ".json"]["status"], "ok")
+                assert_equal(rows[name + ".json"]["nodes"], "10")
+                assert_equal(rows[name + ".json"]["edges"], "23")
+                for field in ["read_seconds", "enumerate_seconds", "score_seconds",
+                              "graph_seconds", "write_seconds"]:
+                    assert rows[name + ".json"][field] != ""
+                with open(os.path.join(output_dir, name + ".clq")) as f:
+                    assert "p edge 10 23\n" in f.read()
+    finally:
+        shutil.rmtree(directory)
+        shutil.rmtree(output_dir)
+
+def test_batch_survives_dead_and_slow_children():
+    directory = make_input_dir()
+    output_dir = tempfile.mkdtemp()
+    run_file = batch.run_file
+    def misbehave(task):
+        # The children are forked, so they see this in place of run_file
+        name = os.path.basename(task[0])
+        if name == "a.json":
+            os.kill(os.getpid(), signal.SIGKILL)
+        elif name == "broken.json":
+            time.sleep(30)
+        return run_file(task)
+    batch.run_file = misbehave
+    try:
+        options = BatchOptions("effective:size:backarc:weight", "7:6:36", 3, 3, output_dir)
+        summary = StringIO()
+        num_errors = run_batch(find_pool_files([directory]), options, summary, 2, timeout=1)
+        assert_equal(num_errors, 2)
+        rows = {os.path.basename(row["file"]): row
+                for row in csv.DictReader(StringIO(summary.getvalue()))}
+        assert_equal(rows["a.json"]["error"], "Child process killed by signal 9")
+        assert_equal(rows["broken.json"]["error"], "Timed out after 1 s")
+        assert_equal(rows["b.json"]["status"], "ok")
+    finally:
+        batch.run_file = run_file
+        shutil.rmtree(directory)
+        shutil.rmtree(output_dir)
@@ -0,0 +1,265 @@
+from nose.tools import *
+import random
+from StringIO import StringIO
+from kep_h.conflict_graph import ConflictGraph
+from kep_h.kep_h_pool import Patient, PairedDonor, Altruist, AltruistEdge, DonorPatientMatch
+from kep_h.optimality_criteria import get_criteria
+from kep_h.reductions import get_reductions
+from kep_h.sweep import read_sweep_configs
+from kep_h.kep_h_pool_optimiser import *
+from tests.helpers import read_tiny_pool, random_pool
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def tiny_instance(max_cycle=3, max_chain=3, jobs=1):
+    pool = read_tiny_pool()
+    optimiser = PoolOptimiser(pool, get_criteria("effective:size:backarc:weight"),
+                              max_cycle, max_chain, jobs)
+    return optimiser.build_instance(False, 0, [7, 6, 36, 0])
+
+def test_tiny_instance():
+    graph, hier_scores, descriptions = tiny_instance()
+    assert_equal(len(graph), 10)
+    assert_equal(graph.num_edges, 23)
+    assert_equal(descriptions[0], "6 (7,7)")
+    assert_equal(descriptions[-1], "6")
+    assert graph.has_edge(0, 9)
+
+def test_parallel_enumeration_matches_serial():
+    graph, hier_scores, descriptions = tiny_instance()
+    graph_p, hier_scores_p, descriptions_p = tiny_instance(jobs=2)
+    assert_equal(list(graph_p.edges()), list(graph.edges()))
+    assert_equal(hier_scores_p, hier_scores)
+    assert_equal(descriptions_p, descriptions)
+
+def pairwise_reduction(graph, hier_scores):
+    # Repeatedly compare every pair of adjacent nodes, keeping the best
+    # node of each class with equal closed neighbourhoods
+    while True:
+        best = {}
+        for i in range(len(graph)):
+            for j in graph.neighbours(i):
+                if graph.bitset(i) & ~(1 << j) == graph.bitset(j) & ~(1 << i):
+                    if hier_scores[j] > hier_scores[i] or (
+                            hier_scores[j] == hier_scores[i] and j < i):
+                        best[i] = False
+        nodes_to_keep = [i for i in range(len(graph)) if i not in best]
+        if len(nodes_to_keep) == len(graph):
+            return graph, hier_scores
+        graph = graph.subgraph(nodes_to_keep)
+        hier_scores = [hier_scores[i] for i in nodes_to_keep]
+
+def test_reduce_instance_matches_pairwise_reduction():
+    optimiser = PoolOptimiser(read_tiny_pool(), get_criteria("size"), 3, 3)
+    rand = random.Random(0)
+    for trial in range(20):
+        n = rand.randint(1, 12)
+        graph = ConflictGraph(n)
+        for k in range(rand.randint(0, n)):
+            graph.add_clique(rand.sample(range(n), rand.randint(1, n)))
+        hier_scores = [rand.randint(0, 3) for i in range(n)]
+        expected_graph, expected_scores = pairwise_reduction(graph.subgraph(range(n)),
+                                                             hier_scores)
+        nodes_to_keep = range(n)
+        while True:
+            reduced = optimiser.reduce_instance(graph, hier_scores, nodes_to_keep)
+            if len(reduced) == len(nodes_to_keep):
+                break
+            nodes_to_keep = reduced
+        assert_equal([hier_scores[i] for i in nodes_to_keep], expected_scores)
+        assert_equal(list(graph.subgraph(nodes_to_keep).edges()), list(expected_graph.edges()))
+
+def baseline_reduction_pass(adj_mat, hier_scores):
+    # One pass of reduce_instance as it was on dense matrices, before twin
+    # classes were found by hashing. Returns the nodes that it keeps.
+    node_to_equiv_class = {}
+    for i in range(len(adj_mat)-1):
+        for j in range(i+1, len(adj_mat)):
+            if adj_mat[i][j] and all(adj_mat[i][k] == adj_mat[j][k]
+                                     for k in range(len(adj_mat)) if k != i and k != j):
+                if i in node_to_equiv_class:
+                    equiv_class = node_to_equiv_class[i]
+                else:
+                    equiv_class = NodeEquivClass()
+                    equiv_class.add_node(i, hier_scores[i])
+                    node_to_equiv_class[i] = equiv_class
+                    node_to_equiv_class[j] = equiv_class
+                equiv_class.add_node(j, hier_scores[j])
+    return [i for i in range(len(adj_mat))
+            if i not in node_to_equiv_class or node_to_equiv_class[i].best_node_id == i]
+
+def test_reduce_instance_matches_baseline_passes():
+    # The old pass only marked the first two members of each class, so it
+    # could take several passes to remove what one pass removes now. Each
+    # pass now removes at least as much, and the fixed point is the same.
+    optimiser = PoolOptimiser(read_tiny_pool(), get_criteria("size"), 3, 3)
+    rand = random.Random(1)
+    for trial in range(30):
+        n = rand.randint(1, 14)
+        graph = ConflictGraph(n)
+        for k in range(rand.randint(0, n)):
+            graph.add_clique(rand.sample(range(n), rand.randint(1, n)))
+        hier_scores = rand.sample(range(100), n)
+        baseline_counts = []
+        baseline_kept = range(n)
+        while not baseline_counts or baseline_counts[-1] > len(baseline_kept):
+            baseline_counts.append(len(baseline_kept))
+            adj_mat = [[graph.has_edge(i, j) for j in baseline_kept] for i in baseline_kept]
+            scores = [hier_scores[i] for i in baseline_kept]
+            baseline_kept = [baseline_kept[i] for i in baseline_reduction_pass(adj_mat, scores)]
+        counts = []
+        kept = range(n)
+        work = graph.copy()
+        while not counts or counts[-1] > len(kept):
+            counts.append(len(kept))
+            kept = optimiser.reduce_instance(work, hier_scores, kept)
+        assert_equal(kept, baseline_kept)
+        assert counts[0] == baseline_counts[0] and len(counts) <= len(baseline_counts)
+        for count, baseline_count in zip(counts, baseline_counts):
+            assert count <= baseline_count
+
+def test_reductions():
+    optimiser = PoolOptimiser(read_tiny_pool(), get_criteria("effective:size:backarc:weight"),
+                              3, 3)
+    comments = []
+    graph, hier_scores, descriptions = optimiser.build_instance(
+            False, 0, [7, 6, 36, 0], comments, get_reductions("simplicial:degree1:domination"))
+    assert len(graph) < 10
+    assert "Reductions simplicial:degree1:domination" in comments
+    solution = optimiser.expand_solution([])
+    assert_equal(optimiser.expand_solution(range(len(graph)))[:len(solution)], solution)
+
+def test_solve_writes_solution():
+    optimiser = PoolOptimiser(read_tiny_pool(), get_criteria("effective:size:backarc:weight"),
+                              3, 3)
+    out = StringIO()
+    optimiser.solve(False, True, 0, [7, 6, 36, 0], out, "solution")
+    assert_equal(out.getvalue(), "c 1 6 (7,7)\nc 3 (1,1) (3,3)\nc 7 (2,2) (5,5) (4,4)\n")
+
+def test_solve_components():
+    criteria = get_criteria("effective:size:backarc:weight")
+    out = StringIO()
+    PoolOptimiser(read_tiny_pool(), criteria, 3, 3).solve(
+            False, False, 0, [7, 6, 36, 0], out, "solution")
+    for jobs in [1, 2]:
+        split_out = StringIO()
+        PoolOptimiser(read_tiny_pool(), criteria, 3, 3, jobs).solve(
+                False, False, 0, [7, 6, 36, 0], split_out, "solution", split_components=True)
+        assert_equal(split_out.getvalue(), out.getvalue())
+
+def test_write_components():
+    outs = []
+    def component_out(k):
+        outs.append(StringIO())
+        outs[-1].close = lambda: None
+        return outs[-1]
+    optimiser = PoolOptimiser(read_tiny_pool(), get_criteria("effective:size:backarc:weight"),
+                              3, 3)
+    optimiser.solve(False, False, 0, [7, 6, 36, 0], None, "dimacs",
+                    split_components=True, component_out=component_out)
+    assert_equal(len(outs), 2)
+    assert "c Component 2 of 2\n" in outs[1].getvalue()
+    assert "p edge 2 1\n" in outs[0].getvalue()
+    assert "p edge 8 22\n" in outs[1].getvalue()
+
+def test_sweep_matches_separate_runs():
+    configs = read_sweep_configs(["effective:size:backarc:weight 7:6:36",
+                                  "size:weight 8 3",
+                                  "weight:inverse3way:size 9:9 4"])
+    outs = []
+    def config_out(k):
+        outs.append(StringIO())
+        outs[-1].close = lambda: None
+        return outs[-1]
+    optimiser = PoolOptimiser(read_tiny_pool(), configs[0].criteria, 3, 3)
+    optimiser.sweep(configs, False, True, config_out)
+    assert_equal(len(outs), 3)
+    for config, out in zip(configs, outs):
+        expected = StringIO()
+        PoolOptimiser(read_tiny_pool(), config.criteria, 3, 3).solve(
+                False, True, config.node_order, config.bit_shifts, expected)
+        assert_equal(out.getvalue(), expected.getvalue())
+
+def test_heuristic_solution():
+    optimiser = PoolOptimiser(read_tiny_pool(), get_criteria("effective:size:backarc:weight"),
+                              3, 3)
+    out = StringIO()
+    optimiser.solve(False, False, 0, [7, 6, 36, 0], out, "heuristic", time_limit=0.01)
+    assert_equal(out.getvalue(), "c 1 6 (7,7)\nc 3 (1,1) (3,3)\nc 7 (2,2) (5,5) (4,4)\n")
+
+def node_state(optimiser):
+    return (optimiser.node_descriptions(), optimiser.criterion_scores,
+            optimiser.patient_to_nodes, optimiser.paired_donor_to_nodes, optimiser.ndd_to_nodes)
+
+def compact_state(compact):
+    return {name: value for name, value in vars(compact).iteritems() if name != "arc_values"}
+def random_update(rand, optimiser):
+    pool = optimiser.pool
+    kind = rand.randrange(10)
+    if kind == 0:
+        donor = rand.choice(pool.paired_donors)
+        patient = rand.choice(pool.patients)
+        if not donor.has_edge_to(patient):
+            optimiser.add_arc(donor, patient, rand.randint(1, 9))
+    elif kind == 1:
+        donor = rand.choice([donor for donor in pool.paired_donors if donor.edges_out])
+        optimiser.remove_arc(donor, rand.choice(donor.edges_out).target_patient)
+    elif kind == 2:
+        altruist = rand.choice(pool.altruists)
+        patient = rand.choice(pool.patients)
+        if not altruist.has_edge_to(patient):
+            optimiser.add_altruist_edge(altruist, patient, rand.randint(1, 9))
+    elif kind == 3:
+        altruist = rand.choice([altruist for altruist in pool.altruists if altruist.edges])
+        optimiser.remove_altruist_edge(altruist, rand.choice(altruist.edges).target_patient)
+    elif kind == 4:
+        optimiser.add_patient(Patient(3000 + len(pool.patients), 3000 + len(pool.patients)))
+    elif kind == 5:
+        optimiser.remove_patient(rand.choice(pool.patients))
+    elif kind == 6:
+        donor = PairedDonor(rand.randint(20, 70), 4000 + len(pool.paired_donors))
+        for patient in rand.sample(pool.patients, 3):
+            donor.edges_out.append(DonorPatientMatch(patient, rand.randint(1, 9)))
+        optimiser.add_paired_donor(donor, rand.choice(pool.patients))
+    elif kind == 7:
+        optimiser.remove_paired_donor(rand.choice(pool.paired_donors))
+    elif kind == 8:
+        altruist = Altruist(rand.randint(20, 70), 5000 + len(pool.altruists))
+        altruist.edges.append(AltruistEdge(altruist, rand.choice(pool.patients), 5))
+        optimiser.add_altruist(altruist)
+    else:
+        optimiser.remove_altruist(rand.choice(pool.altruists))
+
+def test_incremental_updates_match_rebuild():
+    rand = random.Random(0)
+    criteria = get_criteria("effective:size:inverse3way:backarc:weight")
+    for trial in range(6):
+        pool = random_pool(rand, 10, 3, 0.25)
+        optimiser = PoolOptimiser(pool, criteria, 3, 3)
+        if trial % 2:
+            optimiser.conflict_graph()
+        for step in range(25):
+            random_update(rand, optimiser)
+            # The patched indices must match new ones, and a new optimiser
+            # built from them must have the same nodes, in the same order
+            patched = pool.compact
+            numbers = (pool.patient_numbers, pool.donor_numbers, pool.altruist_numbers)
+            pool.build_indices()
+            assert_equal(compact_state(patched), compact_state(pool.compact))
+            assert_equal(numbers,
+                         (pool.patient_numbers, pool.donor_numbers, pool.altruist_numbers))
+            rebuilt = PoolOptimiser(pool, criteria, 3, 3)
+            assert_equal(node_state(optimiser), node_state(rebuilt))
+            if optimiser.graph is not None:
+                assert_equal(optimiser.graph.rows, rebuilt.conflict_graph().rows)
+                assert_equal(optimiser.graph.num_edges, rebuilt.conflict_graph().num_edges)
+            pool.compact = patched
+            pool.patient_numbers, pool.donor_numbers, pool.altruist_numbers = numbers
+        graph, hier_scores, descriptions = optimiser.build_instance(False, 0, [7, 6, 36, 9, 0])
+        graph2, hier_scores2, descriptions2 = rebuilt.build_instance(False, 0, [7, 6, 36, 9, 0])
+        assert_equal(graph.rows, graph2.rows)
+        assert_equal((hier_scores, descriptions), (hier_scores2, descriptions2))
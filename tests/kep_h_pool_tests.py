@@ -114,3 +114,35 @@ def test_cycle_backarcs():
     for c in cycles:
         if len(c.pd_pairs) == 3:
             assert c.n_backarcs() == 3
+
+def test_edge_lookups():
+    pool = Pool()
+
+    p1 = p(1)
+    p2 = p(2)
+    d1 = d(1)
+    d2 = d(2)
+    a = Altruist(50, 3)
+
+    pool.patients.extend([p1, p2])
+    pool.paired_donors.extend([d1, d2])
+    pool.altruists.append(a)
+    pool.associate_patient_with_donor(p1, d1)
+    pool.associate_patient_with_donor(p2, d2)
+
+    first_edge = DonorPatientMatch(p2, 10)
+    d1.edges_out.append(first_edge)
+    d1.edges_out.append(DonorPatientMatch(p2, 20))
+    a.edges.append(AltruistEdge(a, p1, 5))
+
+    for indexed in [False, True]:
+        if indexed:
+            pool.build_indices()
+        assert d1.get_edge_to(p2) is first_edge
+        assert d1.has_edge_to(p2)
+        assert not d2.has_edge_to(p1)
+        assert d2.get_edge_to(p1) is None
+        assert p1.has_backarc_to(p2)
+        assert not p2.has_backarc_to(p1)
+        assert a.has_edge_to(p1)
+        assert not a.has_edge_to(p2)
@@ -0,0 +1,50 @@
+from nose.tools import *
+import random
+from kep_h.conflict_graph import ConflictGraph
+from kep_h.mwis_heuristic import *
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def is_independent(graph, nodes):
+    return all(not graph.has_edge(u, v) for u in nodes for v in nodes)
+
+def test_one_two_swap():
+    # Node 0 is adjacent to 1 and 2, which are not adjacent to each other
+    graph = ConflictGraph(3)
+    graph.add_edge(0, 1)
+    graph.add_edge(0, 2)
+    heuristic = MWISHeuristic(graph, [5, 3, 3])
+    assert_equal(heuristic.one_two_swap(1, 0), (1, 2))
+    assert_equal(heuristic.improve(1), 6)
+    assert_equal(MWISHeuristic(graph, [7, 3, 3]).one_two_swap(1, 0), None)
+
+def test_omega_one_swap():
+    graph = ConflictGraph(3)
+    graph.add_edge(0, 2)
+    graph.add_edge(1, 2)
+    heuristic = MWISHeuristic(graph, [1, 1, 3])
+    assert_equal(heuristic.omega_one_swap(3, 2), 3)
+    assert_equal(heuristic.improve(3), 4)
+    assert_equal(MWISHeuristic(graph, [2, 1, 3]).omega_one_swap(3, 2), None)
+
+def test_solve():
+    rand = random.Random(0)
+    for trial in range(20):
+        n = rand.randint(0, 30)
+        graph = ConflictGraph(n)
+        for k in range(rand.randint(0, 2*n)):
+            graph.add_clique(rand.sample(range(n), rand.randint(1, min(n, 3))))
+        weights = [rand.randint(0, 6) for i in range(n)]
+        reports = []
+        result = MWISHeuristic(graph, weights, 0.01,
+                               lambda seconds, weight: reports.append(weight)).solve()
+        assert not result.optimal
+        assert is_independent(graph, result.nodes)
+        assert_equal(sum(weights[v] for v in result.nodes), result.weight)
+        assert_equal(reports, [weight for seconds, weight in result.history])
+        assert_equal(reports, sorted(reports))
+        assert_equal(reports[-1], result.weight)
@@ -0,0 +1,48 @@
+from nose.tools import *
+import random
+from kep_h.conflict_graph import ConflictGraph
+from kep_h.mwis_solver import *
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def is_independent(graph, nodes):
+    return all(not graph.has_edge(u, v) for u in nodes for v in nodes)
+
+def brute_force_weight(graph, weights):
+    n = len(graph)
+    best = 0
+    for mask in range(1 << n):
+        subset = [v for v in range(n) if mask >> v & 1]
+        if is_independent(graph, subset):
+            best = max(best, sum(weights[v] for v in subset))
+    return best
+
+def test_matches_brute_force():
+    rand = random.Random(0)
+    for trial in range(100):
+        n = rand.randint(0, 11)
+        graph = ConflictGraph(n)
+        for k in range(rand.randint(0, 2*n)):
+            graph.add_clique(rand.sample(range(n), rand.randint(1, min(n, 3))))
+        weights = [rand.randint(-1, 6) << rand.choice([0, 70]) for i in range(n)]
+        result = MWISSolver(graph, weights).solve()
+        assert result.optimal
+        assert is_independent(graph, result.nodes)
+        assert_equal(sum(weights[v] for v in result.nodes), result.weight)
+        assert_equal(result.weight, brute_force_weight(graph, weights))
+
+def test_time_limit():
+    rand = random.Random(1)
+    n = 120
+    graph = ConflictGraph(n)
+    for k in range(300):
+        graph.add_clique(rand.sample(range(n), 2))
+    weights = [rand.randint(1, 1000) for i in range(n)]
+    result = MWISSolver(graph, weights, time_limit=0).solve()
+    assert not result.optimal
+    assert result.weight > 0
+    assert is_independent(graph, result.nodes)
@@ -0,0 +1,46 @@
+from nose.tools import *
+import json
+from StringIO import StringIO
+from kep_h import pool_reader
+from kep_h.pool_generator import *
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def test_same_seed_gives_same_pool():
+    assert_equal(generate_pool(30, 3, 5), generate_pool(30, 3, 5))
+    assert_not_equal(generate_pool(30, 3, 5), generate_pool(30, 3, 6))
+
+def test_generated_pool_is_readable():
+    pool_json = generate_pool(40, 4, 1, extra_donor_prob=0.3, shared_donor_prob=0.3)
+    out = StringIO()
+    write_pool(out, pool_json)
+    assert_equal(json.loads(out.getvalue()), pool_json)
+    pool = pool_reader.read_file(StringIO(out.getvalue()))
+    assert_equal(len(pool.patients), 40)
+    assert_equal(len(pool.altruists), 4)
+    # Some patients have several donors, and some donors several patients
+    assert any(len(p.paired_donors) > 1 for p in pool.patients)
+    assert any(len(d.paired_patients) > 1 for d in pool.paired_donors)
+    for donor in pool.paired_donors:
+        for edge in donor.edges_out:
+            assert edge.target_patient not in donor.paired_patients
+
+def test_pairs_are_incompatible():
+    generator = PoolGenerator(2)
+    for i in xrange(200):
+        donor_type = generator.incompatible_donor_type("O", 0.0)
+        assert not blood_type_compatible(donor_type, "O")
+
+@raises(ValueError)
+def test_zero_pra():
+    PoolGenerator(0, pra_levels=[(0.5, 0.5), (0.5, 0.0)])
+
+def test_ndd_arcs_are_limited():
+    pool_json = generate_pool(50, 5, 0, pra_levels=[(1.0, 0.01)], max_ndd_arcs=3)
+    ndds = [d for d in pool_json["data"].values() if d.get("altruistic")]
+    assert_equal(len(ndds), 5)
+    assert all(len(d["matches"]) <= 3 for d in ndds)
@@ -1,5 +1,11 @@
 from nose.tools import *
+import json
+from collections import OrderedDict
+from StringIO import StringIO
 import kep_h
+from kep_h import pool_reader
+from kep_h.pool_reader import JSONStream
+from tests.helpers import TINY_JSON
 
 def setup():
     pass
@@ -9,3 +15,62 @@ def teardown():
 
 def test_1():
     pass
+
+def describe_pool(pool):
+    # The pool's people and edges, which do not depend on the order of reading
+    return (sorted(p.nhs_id for p in pool.patients),
+            sorted((d.nhs_id, d.dage, sorted(p.nhs_id for p in d.paired_patients),
+                    [(e.target_patient.nhs_id, e.score) for e in d.edges_out])
+                   for d in pool.paired_donors),
+            sorted((n.nhs_id, n.dage, [(e.target_patient.nhs_id, e.score) for e in n.edges])
+                   for n in pool.altruists))
+
+def test_read_file_matches_read():
+    with open(TINY_JSON) as json_file:
+        text = json_file.read()
+    expected = describe_pool(pool_reader.read(json.loads(text)["data"]))
+    for chunk_size in [1, 2, 5, 64, pool_reader.CHUNK_SIZE]:
+        stream = JSONStream(StringIO(text), chunk_size)
+        pool = pool_reader.read_records(pool_reader._data_records(stream))
+        assert_equal(describe_pool(pool), expected)
+        # Patients are numbered in order of first appearance in the file
+        assert_equal([p.nhs_id for p in pool.patients], range(1, 8))
+    # read numbers them in the same order if the data object keeps it
+    ordered = pool_reader.read(json.loads(text, object_pairs_hook=OrderedDict)["data"])
+    assert_equal([p.nhs_id for p in ordered.patients], range(1, 8))
+
+def test_read_file_skips_other_members():
+    text = '{"version": [1, {"a": 2.5}], "data": {"3": {"dage": 40, "sources": [7]}}, "z": 123}'
+    pool = pool_reader.read_file(StringIO(text))
+    assert_equal([p.nhs_id for p in pool.patients], [7])
+    assert_equal([d.nhs_id for d in pool.paired_donors], [3])
+
+def test_numbers_split_across_chunks():
+    stream = JSONStream(StringIO('{"a": 123456, "b": [1, 2]}'), 3)
+    values = {}
+    for key in stream.members():
+        values[key] = stream.value()
+    stream.end()
+    assert_equal(values, {"a": 123456, "b": [1, 2]})
+
+@raises(ValueError)
+def test_truncated_file():
+    pool_reader.read_file(StringIO('{"data": {"3": {"dage": 40, "sources": [7]}'))
+
+@raises(ValueError)
+def test_missing_data():
+    pool_reader.read_file(StringIO('{"other": {}}'))
+
+def test_error_offsets_are_file_offsets():
+    # The bad character and value are well past the first chunk
+    text = '{"a": [1, 2, 3], "b": 4, "c" 5}'
+    stream = JSONStream(StringIO(text), 4)
+    with assert_raises(ValueError) as cm:
+        for key in stream.members():
+            stream.value()
+    assert_in("offset {} ".format(text.index(" 5") + 1), str(cm.exception))
+    stream = JSONStream(StringIO('{"abcdefgh": tru'), 4)
+    with assert_raises(ValueError) as cm:
+        for key in stream.members():
+            stream.value()
+    assert_in("offset 13 ", str(cm.exception))
@@ -0,0 +1,69 @@
+from nose.tools import *
+import random
+from kep_h.conflict_graph import ConflictGraph
+from kep_h.reductions import *
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def random_graph(rand, n):
+    graph = ConflictGraph(n)
+    for k in range(rand.randint(0, n)):
+        graph.add_clique(rand.sample(range(n), rand.randint(1, min(n, 4))))
+    return graph
+
+def is_independent(graph, nodes):
+    return all(not graph.has_edge(u, v) for u in nodes for v in nodes)
+
+def brute_force_mwis(graph, weights, nodes):
+    # Returns the best weight and an optimal independent subset of nodes
+    best = (0, [])
+    for mask in range(1 << len(nodes)):
+        subset = [v for k, v in enumerate(nodes) if mask >> k & 1]
+        if is_independent(graph, subset):
+            best = max(best, (sum(weights[v] for v in subset), subset))
+    return best
+
+def test_get_reductions():
+    assert_equal([r.name for r in get_reductions("simplicial:degree1")],
+                 ["simplicial", "degree1"])
+    assert_raises(ReductionException, get_reduction, "nonsense")
+
+def test_degree_one_fold():
+    graph = ConflictGraph(3)
+    graph.add_edge(0, 1)
+    graph.add_edge(1, 2)
+    kernel = Kernel(graph, [2, 5, 6], range(3))
+    DegreeOneReduction().apply(kernel)
+    # 0 is folded into 1, and then 1 into 2
+    assert_equal(kernel.log.steps, [(0, 1), (1, 2)])
+    assert_equal(kernel.live_nodes(), [2])
+    assert_equal(kernel.weights[2], 3)
+    assert_equal(kernel.log.weight_offset, 5)
+    assert_equal(kernel.log.expand_solution([2]), [0, 2])
+    assert_equal(kernel.log.expand_solution([]), [1])
+
+def test_pipeline_preserves_optimum():
+    rand = random.Random(0)
+    for trial in range(100):
+        n = rand.randint(1, 10)
+        graph = random_graph(rand, n)
+        original = graph.subgraph(range(n))
+        weights = [rand.randint(0, 5) for i in range(n)]
+        best_weight, best_set = brute_force_mwis(original, weights, range(n))
+
+        kernel = Kernel(graph, weights, range(n))
+        stats = ReductionPipeline(get_reductions(
+                "twin:domination:simplicial:isolated:degree1")).run(kernel)
+        assert_equal(sum(stat.nodes_removed for stat in stats), n - kernel.num_live)
+        assert_equal(sum(stat.edges_removed for stat in stats),
+                     original.num_edges - graph.num_edges)
+        reduced_weight, reduced_set = brute_force_mwis(graph, kernel.weights,
+                                                       kernel.live_nodes())
+        assert_equal(reduced_weight + kernel.log.weight_offset, best_weight)
+        expanded = kernel.log.expand_solution(reduced_set)
+        assert is_independent(original, expanded)
+        assert_equal(sum(weights[v] for v in expanded), best_weight)
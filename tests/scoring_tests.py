@@ -0,0 +1,98 @@
+from nose.tools import *
+from kep_h import pool_reader
+from kep_h import scoring
+from kep_h.compact_pool import StructureStore
+from kep_h.optimality_criteria import get_criteria
+from kep_h.pool_generator import generate_pool
+from kep_h.scoring import *
+from tests.helpers import read_tiny_pool
+
+MAX_CRITERIA = "effective:size:backarc:weight:inverse3way:null"
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def test_columns_match_single_item_scores():
+    pool = read_tiny_pool()
+    pool.build_indices()
+    compact = pool.compact
+    opt_criteria = get_criteria(MAX_CRITERIA)
+    for store, factory, is_chain, accessor in [
+            (compact.find_chains(3), pool.make_chain, True, lambda oc, c: oc.chain_val(c)),
+            (compact.find_cycles(3), pool.make_cycle, False, lambda oc, c: oc.cycle_val(c))]:
+        assert len(store) > 0
+        columns = criterion_columns(opt_criteria, compact, store, is_chain, factory)
+        expected = [criterion_scores(opt_criteria, factory(members, -1), accessor)
+                    for members in store]
+        assert_equal([list(row) for row in zip(*columns)], expected)
+
+def python_pack(scores, bit_shifts):
+    val = 0
+    for score, bit_shift in zip(scores, bit_shifts):
+        val += score
+        val <<= bit_shift
+    return val
+
+def test_pack_hier_scores():
+    columns = [[0, 1, 3], [5, 0, 127], [2, 9, 0]]
+    for bit_shifts in [[7, 6, 0], [30, 40, 0]]:
+        packed = pack_hier_scores(columns, bit_shifts)
+        assert_equal(packed, [python_pack(scores, bit_shifts) for scores in zip(*columns)])
+
+def test_pack_hier_scores_without_numpy():
+    columns = [[0, 1, 3], [5, 0, 127], [2, 9, 0]]
+    bit_shifts = [7, 6, 0]
+    numpy = scoring.numpy
+    scoring.numpy = None
+    try:
+        packed = pack_hier_scores(columns, bit_shifts)
+    finally:
+        scoring.numpy = numpy
+    assert_equal(packed, [python_pack(scores, bit_shifts) for scores in zip(*columns)])
+
+def test_chain_store_features_match_tuples():
+    pool = pool_reader.read(generate_pool(25, 3, 4)["data"])
+    pool.build_indices()
+    compact = pool.compact
+    opt_criteria = get_criteria(MAX_CRITERIA)
+    tree = compact.find_chains(4)
+    flat = StructureStore()
+    for members in tree:
+        flat.append(members)
+    assert len(tree.roots) < len(tree)
+    assert_equal(criterion_columns(opt_criteria, compact, tree, True, pool.make_chain),
+                 criterion_columns(opt_criteria, compact, flat, True, pool.make_chain))
+
+def test_arc_aggregates_with_shared_donors():
+    pool = pool_reader.read(generate_pool(30, 3, 2, extra_donor_prob=0.3,
+                                          shared_donor_prob=0.3)["data"])
+    pool.build_indices()
+    compact = pool.compact
+    opt_criteria = get_criteria(MAX_CRITERIA)
+    tree = compact.find_chains(4)
+    flat = StructureStore()
+    for members in tree:
+        flat.append(members)
+    for store, factory, is_chain, accessor in [
+            (tree, pool.make_chain, True, lambda oc, c: oc.chain_val(c)),
+            (flat, pool.make_chain, True, lambda oc, c: oc.chain_val(c)),
+            (compact.find_cycles(4), pool.make_cycle, False, lambda oc, c: oc.cycle_val(c))]:
+        columns = criterion_columns(opt_criteria, compact, store, is_chain, factory)
+        expected = [criterion_scores(opt_criteria, factory(members, -1), accessor)
+                    for members in store]
+        assert_equal([list(row) for row in zip(*columns)], expected)
+
+        features = StructureFeatures(compact, store, is_chain)
+        expected = []
+        for members in store:
+            pairs = factory(members, -1).pd_pairs
+            prev_pairs = [None] + pairs[:-1] if is_chain else pairs[-1:] + pairs[:-1]
+            expected.append(sum(1 for prev, pair in zip(prev_pairs, pairs)
+                                if prev is not None and
+                                pair.patient.has_backarc_to(prev.patient)))
+        assert_equal(features.arc_count("backarc"), expected)
+    # The arc values are built once per pool
+    assert get_arc_values(compact) is features.arcs
@@ -0,0 +1,45 @@
+from nose.tools import *
+import json
+from kep_h import pool_reader
+from kep_h.optimality_criteria import get_criteria
+from kep_h.kep_h_pool_optimiser import PoolOptimiser
+from kep_h.pool_generator import generate_pool
+from kep_h.size_estimate import *
+from tests.helpers import TINY_JSON
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def test_total_index_digits():
+    for n in [0, 1, 9, 10, 99, 100, 1234]:
+        assert_equal(total_index_digits(n), sum(len(str(i)) for i in range(1, n + 1)))
+
+def check_estimate(pool_json, max_cycle, max_chain):
+    criteria = get_criteria("effective:size:backarc:weight")
+    estimate = SizeEstimate(pool_reader.read(pool_json["data"]), max_cycle, max_chain)
+    optimiser = PoolOptimiser(pool_reader.read(pool_json["data"]), criteria,
+                              max_cycle, max_chain)
+    assert_equal(estimate.num_nodes, optimiser.num_nodes)
+    assert_equal(estimate.num_chains, len(optimiser.chain_members))
+    for k in range(max_cycle + 1):
+        assert_equal(estimate.cycle_counts[k],
+                     sum(1 for members in optimiser.cycle_members if len(members) == 2 * k))
+    assert_equal(list(estimate.patient_counts), map(len, optimiser.patient_to_nodes))
+    assert_equal(list(estimate.donor_counts), map(len, optimiser.paired_donor_to_nodes))
+    assert_equal(list(estimate.ndd_counts), map(len, optimiser.ndd_to_nodes))
+    num_edges = optimiser.conflict_graph().num_edges
+    assert num_edges <= estimate.max_edges()
+    parts, total = estimate.memory_bytes(len(criteria))
+    assert total > 0
+    assert estimate.dimacs_bytes(20) > 0
+    assert estimate.binary_bytes(20) > 0
+
+def test_estimate_matches_optimiser():
+    with open(TINY_JSON) as json_file:
+        tiny = json.load(json_file)
+    for max_cycle, max_chain in [(2, 0), (3, 3), (4, 2)]:
+        check_estimate(tiny, max_cycle, max_chain)
+    check_estimate(generate_pool(40, 3, 1), 3, 3)
@@ -0,0 +1,85 @@
+from nose.tools import *
+import os
+import shutil
+import tempfile
+import time
+from kep_h.compact_pool import StructureStore
+from kep_h.kep_h_pool_optimiser import PoolOptimiser
+from kep_h.optimality_criteria import get_criteria
+from kep_h.structure_cache import *
+from tests.helpers import TINY_JSON, read_tiny_pool
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def make_store(tuples):
+    store = StructureStore()
+    for members in tuples:
+        store.append(members)
+    return store
+
+def test_round_trip():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = StructureCache(directory)
+        chains = make_store([(0, 1, 2), (1, 3, 4, 0, 0)])
+        cycles = make_store([(0, 0, 1, 1), (2, 3, 4, 5, 6, 7)])
+        assert_equal(cache.load("abc"), None)
+        assert cache.save("abc", chains, cycles)
+        loaded_chains, loaded_cycles = cache.load("abc")
+        assert_equal(list(loaded_chains), list(chains))
+        assert_equal(list(loaded_cycles), list(cycles))
+        assert_equal(cache.load("abd"), None)
+    finally:
+        shutil.rmtree(directory)
+
+def test_corrupt_entry_is_a_miss():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = StructureCache(directory)
+        cache.save("abc", make_store([(0, 1, 2)]), make_store([]))
+        with open(cache.path("abc"), "r+b") as f:
+            f.truncate(os.path.getsize(cache.path("abc")) - 4)
+        assert_equal(cache.load("abc"), None)
+    finally:
+        shutil.rmtree(directory)
+
+def test_least_recently_used_entries_are_evicted():
+    directory = tempfile.mkdtemp()
+    try:
+        cycles = make_store([tuple(range(100))])
+        entry_size = len(cycles.values) * 4 + 200
+        cache = StructureCache(directory, 2 * entry_size)
+        for key in ["a", "b"]:
+            cache.save(key, StructureStore(), cycles)
+        # Make "a" older than "b", then use it
+        os.utime(cache.path("a"), (time.time() - 20, time.time() - 20))
+        os.utime(cache.path("b"), (time.time() - 10, time.time() - 10))
+        assert cache.load("a") is not None
+        cache.save("c", StructureStore(), cycles)
+        assert cache.load("a") is not None
+        assert_equal(cache.load("b"), None)
+        assert cache.load("c") is not None
+    finally:
+        shutil.rmtree(directory)
+
+def test_cached_structures_give_same_nodes():
+    criteria = get_criteria("effective:size:backarc:weight")
+    directory = tempfile.mkdtemp()
+    try:
+        cache = StructureCache(directory)
+        key = cache_key(TINY_JSON, 3, 3)
+        assert_equal(key, cache_key(TINY_JSON, 3, 3))
+        assert_not_equal(key, cache_key(TINY_JSON, 3, 2))
+        optimiser = PoolOptimiser(read_tiny_pool(), criteria, 3, 3)
+        cache.save(key, optimiser.chain_members, optimiser.cycle_members)
+        cached = PoolOptimiser(read_tiny_pool(), criteria, 3, 3, 1, cache.load(key))
+        assert_equal(list(cached.chain_members), list(optimiser.chain_members))
+        assert_equal(list(cached.cycle_members), list(optimiser.cycle_members))
+        assert_equal(cached.criterion_scores, optimiser.criterion_scores)
+        assert_equal(cached.patient_to_nodes, optimiser.patient_to_nodes)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,30 @@
+from nose.tools import *
+from kep_h.kep_h_pool_optimiser import OptimisationException
+from kep_h.optimality_criteria import MaxTransplants, MaxWeight
+from kep_h.sweep import *
+
+def setup():
+    pass
+
+def teardown():
+    pass
+
+def test_read_sweep_configs():
+    configs = read_sweep_configs(["# criteria shifts order\n",
+                                  "size:weight 8\n",
+                                  "\n",
+                                  "  weight:size   9  3\n"])
+    assert_equal(len(configs), 2)
+    assert_equal([type(oc) for oc in configs[0].criteria], [MaxTransplants, MaxWeight])
+    assert_equal(configs[0].bit_shifts, [8, 0])
+    assert_equal(configs[0].node_order, 0)
+    assert_equal([type(oc) for oc in configs[1].criteria], [MaxWeight, MaxTransplants])
+    assert_equal(configs[1].node_order, 3)
+
+@raises(OptimisationException)
+def test_wrong_number_of_shifts():
+    read_sweep_configs(["size:weight 8:9"])
+
+@raises(OptimisationException)
+def test_missing_shifts():
+    read_sweep_configs(["size:weight"])